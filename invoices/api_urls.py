@@ -33,8 +33,11 @@ from .api_views import (
     InvoiceCorrectionViewSet,
     # Phase 6追加（追加機能）
     CSVExportViewSet,
+    PDFExportJobViewSet,
     ChartDataViewSet,
     AuditLogViewSet,
+    QueryProfileViewSet,
+    AuditArchiveViewSet,
     DocumentTypeViewSet,
     MonthlyClosingViewSet,
     SafetyFeeViewSet,
@@ -82,8 +85,11 @@ router.register(r'departments', DepartmentViewSet, basename='department')
 router.register(r'invoice-corrections', InvoiceCorrectionViewSet, basename='invoice-correction')
 # Phase 6追加（追加機能）
 router.register(r'csv-export', CSVExportViewSet, basename='csv-export')
+router.register(r'pdf-export-jobs', PDFExportJobViewSet, basename='pdf-export-job')
 router.register(r'chart-data', ChartDataViewSet, basename='chart-data')
 router.register(r'audit-logs', AuditLogViewSet, basename='audit-log')
+router.register(r'query-profile', QueryProfileViewSet, basename='query-profile')
+router.register(r'audit-archives', AuditArchiveViewSet, basename='audit-archive')
 router.register(r'document-types', DocumentTypeViewSet, basename='document-type')
 router.register(r'monthly-closing', MonthlyClosingViewSet, basename='monthly-closing')
 router.register(r'safety-fee', SafetyFeeViewSet, basename='safety-fee-calc')
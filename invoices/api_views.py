@@ -8,15 +8,17 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.renderers import BaseRenderer
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum, Count, F
-from django.db import IntegrityError
+from django.db.models import Q, Sum, Count, F, Prefetch
+from django.db.models.functions import Coalesce
+from django.db import IntegrityError, connection, transaction
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
-from django.http import HttpResponse
-from datetime import datetime, timedelta
+from django.http import HttpResponse, FileResponse
+from django.utils.cache import get_conditional_response
+from datetime import date, datetime, timedelta
 import io
 import csv
 from django.contrib.auth.forms import PasswordResetForm, SetPasswordForm
@@ -57,7 +59,12 @@ from .models import (
     PaymentCalendar,
     DeadlineNotificationBanner,
     # Phase 6追加
-    AuditLog
+    AuditLog,
+    ApprovalInbox,
+    EmailOutbox,
+    PDFExportJob,
+    InvoiceMonthlyRollup, CustomerMonthlyRollup, SiteMonthlyRollup,
+    AuditArchive, AccessLogHourlyRollup,
 )
 from .serializers import (
     CompanySerializer, DepartmentSerializer, CustomerCompanySerializer,
@@ -88,8 +95,12 @@ from .serializers import (
     PaymentCalendarSerializer,
     DeadlineNotificationBannerSerializer,
     # Phase 6追加
-    AuditLogSerializer
+    AuditLogSerializer,
+    PDFExportJobSerializer,
+    AuditArchiveSerializer,
 )
+from .pagination import InvoiceCursorPagination
+from .search import search_invoices
 
 
 class IsCustomerUser(permissions.BasePermission):
@@ -618,6 +629,7 @@ class ConstructionSiteViewSet(viewsets.ModelViewSet):
 class InvoiceViewSet(viewsets.ModelViewSet):
     """請求書API"""
     permission_classes = [IsAuthenticated]
+    pagination_class = InvoiceCursorPagination
     
     def get_serializer_class(self):
         """アクションに応じたシリアライザーを使用"""
@@ -636,10 +648,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         
-        qs = Invoice.objects.select_related(
-            'customer_company', 'construction_site', 'created_by',
-            'approval_route', 'current_approval_step', 'current_approver'
-        ).prefetch_related('items', 'comments', 'approval_histories')
+        qs = self._shape_queryset(Invoice.objects.all())
 
         if user.user_type == 'customer':
             qs = qs.filter(customer_company=user.customer_company)
@@ -678,18 +687,10 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             qs = qs.filter(current_approver=user)
         
         # 検索（請求書番号・管理番号・工事名・現場名・協力会社名・備考を横断検索）
+        # 検索用ドキュメント（invoices/search.py）経由で関連度付きで絞り込む
         search = self.request.query_params.get('search')
         if search:
-            qs = qs.filter(
-                Q(invoice_number__icontains=search) |
-                Q(unique_number__icontains=search) |
-                Q(project_name__icontains=search) |
-                Q(construction_site_name__icontains=search) |
-                Q(construction_site__name__icontains=search) |
-                Q(customer_company__name__icontains=search) |
-                Q(customer_company__name_kana__icontains=search) |
-                Q(notes__icontains=search)
-            )
+            qs = search_invoices(qs, search)
 
         # 工事現場フィルター（サーバーサイド）
         site_id = self.request.query_params.get('site')
@@ -723,7 +724,76 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         if max_amount and max_amount.isdigit():
             qs = qs.filter(total_amount__lte=int(max_amount))
     
-        return qs.order_by('-created_at')
+        if search:
+            return qs.order_by('-search_rank', '-created_at', '-id')
+        return qs.order_by('-created_at', '-id')
+
+    # 一覧（InvoiceListSerializer）で参照する列のみ
+    LIST_ONLY_FIELDS = (
+        'id', 'invoice_number', 'document_type',
+        'construction_site_name', 'project_name',
+        'invoice_date', 'payment_due_date',
+        'status', 'total_amount', 'amount_check_result',
+        'created_at', 'updated_at',
+        'customer_company__name',
+        'construction_site__name',
+        'construction_type__name',
+        'current_approver__first_name', 'current_approver__last_name',
+        'created_by__first_name', 'created_by__last_name',
+        'template__name',
+        'invoice_period__year', 'invoice_period__month',
+    )
+
+    def _shape_queryset(self, qs):
+        """
+        アクションに応じて取得する列・関連を最適化
+        - list: 一覧シリアライザーが使う列のみ（子テーブルのprefetchなし）
+        - retrieve: 詳細シリアライザーが辿る関連をすべて先読み
+        - その他: 従来どおり
+        """
+        if self.action == 'list':
+            return qs.select_related(
+                'customer_company', 'construction_site', 'construction_type',
+                'current_approver', 'created_by', 'template', 'invoice_period'
+            ).only(*self.LIST_ONLY_FIELDS)
+
+        if self.action == 'retrieve':
+            comment_qs = InvoiceComment.objects.select_related('user').prefetch_related('mentioned_users')
+            return qs.select_related(
+                'customer_company', 'construction_site', 'construction_type',
+                'purchase_order', 'created_by', 'current_approver',
+                'current_approval_step', 'approval_route__company',
+                'template', 'invoice_period'
+            ).prefetch_related(
+                'items',
+                Prefetch(
+                    'comments',
+                    queryset=comment_qs.prefetch_related(
+                        Prefetch('replies', queryset=comment_qs)
+                    )
+                ),
+                Prefetch(
+                    'approval_histories',
+                    queryset=ApprovalHistory.objects.select_related('user', 'approval_step')
+                ),
+                Prefetch(
+                    'approval_route__steps',
+                    queryset=ApprovalStep.objects.select_related('approver_user')
+                ),
+                Prefetch(
+                    'change_histories',
+                    queryset=InvoiceChangeHistory.objects.select_related('changed_by')
+                ),
+                Prefetch(
+                    'custom_values',
+                    queryset=CustomFieldValue.objects.select_related('custom_field')
+                ),
+            )
+
+        return qs.select_related(
+            'customer_company', 'construction_site', 'created_by',
+            'approval_route', 'current_approval_step', 'current_approver'
+        ).prefetch_related('items', 'comments', 'approval_histories')
     
     def create(self, request, *args, **kwargs):
         """請求書作成（下書き保存のみ。締め日チェックは提出時に行う）"""
@@ -895,6 +965,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         return Response({'valid': True, 'message': '認証成功'})
     
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def submit(self, request, pk=None):
         """
         請求書を提出
@@ -998,59 +1069,12 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                     'requires_special_password': True
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 厳格な承認フローの構築 (現場監督 -> 部長 -> 専務 -> 社長 -> 常務 -> 経理)
-        step_definitions = [
-            (1, '現場所長承認', 'site_supervisor'),
-            (2, '部長承認', 'department_manager'),
-            (3, '専務承認', 'senior_managing_director'),
-            (4, '社長承認', 'president'),
-            (5, '常務承認', 'managing_director'),
-            (6, '経理確認', 'accountant'),
-        ]
-        
-        # 承認ルートの作成
-        # 注: 以前は会社共通のルートを使い回していましたが、現場監督が異なるため
-        # 請求書ごとに個別のルートを作成するように変更しました（上書き防止）
-        route_name = f"Approval Flow for {invoice.invoice_number}"
-        approval_route = ApprovalRoute.objects.create(
-            company=invoice.receiving_company,
-            name=route_name,
-            description=f'請求書 {invoice.invoice_number} 専用の承認ルート',
-            is_default=False
-        )
-        
-        # ステップの作成（各ステップに具体的な承認者を紐付ける）
-        first_step = None
-        for order, name, position in step_definitions:
-            user_to_assign = None
-            # 現場監督は現場に紐付いたユーザーを指定
-            if position == 'site_supervisor':
-                user_to_assign = invoice.construction_site.supervisor
-            elif position == 'accountant':
-                # 経理は特定ユーザーに紐付けない（経理なら誰でも承認可能）
-                user_to_assign = None
-            else:
-                # その他の役職は具体的なユーザーを検索して紐付ける
-                user_to_assign = User.objects.filter(
-                    user_type='internal',
-                    company=invoice.receiving_company,
-                    position=position,
-                    is_active=True
-                ).order_by('-id').first()
-            
-            step = ApprovalStep.objects.create(
-                route=approval_route,
-                step_order=order,
-                step_name=name,
-                approver_position=position,
-                approver_user=user_to_assign
-            )
-            if order == 1:
-                first_step = step
-
-        # 承認ルートを設定
-        invoice.approval_route = approval_route
-        invoice.current_approval_step = first_step
+        # 承認ルート: 会社共通の標準テンプレート（現場監督 -> 部長 -> 専務 -> 社長 -> 常務 -> 経理）を共有し、
+        # 現場によって異なる現場監督だけを請求書ごとに割り当てる
+        route_id, first_step_id = ApprovalRoute.standard_template(invoice.receiving_company)
+        invoice.approval_route_id = route_id
+        invoice.current_approval_step_id = first_step_id
+        invoice.approval_supervisor = invoice.construction_site.supervisor
         
         # 提出履歴を記録
         ApprovalHistory.objects.create(
@@ -1065,8 +1089,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         if special_password or invoice.is_created_with_special_access:
             # 特例: 即座に承認待ちへ
             invoice.status = 'pending_approval'
-            invoice.current_approver = invoice.construction_site.supervisor
-            invoice.current_approval_step = first_step
+            invoice.current_approver = invoice.approval_supervisor
             invoice.save()
             
             # 通知メール送信（即時）
@@ -1112,171 +1135,13 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         if not invoice_ids:
             return Response({'error': '請求書IDが指定されていません'}, status=status.HTTP_400_BAD_REQUEST)
             
-        success_count = 0
-        errors = []
-        
-        user = request.user
-        
         # 対象の請求書を取得（閲覧権限のあるものに限定）
-        invoices = self.get_queryset().filter(id__in=invoice_ids)
+        visible_ids = self.get_queryset().filter(id__in=invoice_ids).values_list('id', flat=True)
         
-        for invoice in invoices:
-            # 承認待ち状態のみ
-            if invoice.status != 'pending_approval':
-                errors.append({'id': invoice.id, 'invoice_number': invoice.invoice_number, 'error': '承認待ちではありません'})
-                continue
-            
-            # 重複承認チェック
-            already_approved = ApprovalHistory.objects.filter(
-                invoice=invoice,
-                user=user,
-                action='approved'
-            ).exists()
-            
-            if already_approved:
-                errors.append({'id': invoice.id, 'invoice_number': invoice.invoice_number, 'error': '既に承認済みです'})
-                continue
-            
-            # 現在のステップを確認
-            current_step = invoice.current_approval_step
-            if not current_step:
-                # 自動復元を試みる（approveメソッドと同じロジック）
-                if invoice.current_approver and invoice.approval_route:
-                    # 現場監督の場合は特別処理
-                    if invoice.construction_site and invoice.current_approver == invoice.construction_site.supervisor:
-                        current_step = invoice.approval_route.steps.filter(
-                            approver_position='site_supervisor'
-                        ).first()
-                    else:
-                        # 役職からステップを検索
-                        current_step = invoice.approval_route.steps.filter(
-                            approver_position=invoice.current_approver.position
-                        ).first()
-                    
-                    if current_step:
-                        # ステップを設定して保存
-                        invoice.current_approval_step = current_step
-                        invoice.save()
-                
-                # それでも見つからない場合はエラー
-                if not current_step:
-                    errors.append({
-                        'id': invoice.id,
-                        'invoice_number': invoice.invoice_number,
-                        'error': '承認ステップが設定されていません',
-                        'detail': f'承認ルート: {invoice.approval_route_id or "未設定"}, 現在の承認者: {invoice.current_approver.username if invoice.current_approver else "未設定"}'
-                    })
-                    continue
-
-            
-            # 権限チェック
-            can_approve = False
-            
-            # 経理の場合：最終ステップ（経理確認ステップ）のみ承認可能
-            if user.position == 'accountant':
-                if current_step.approver_position == 'accountant':
-                    can_approve = True
-                else:
-                    errors.append({'id': invoice.id, 'invoice_number': invoice.invoice_number, 'error': '経理の承認は全ての役職者承認後に実施してください'})
-                    continue
-            # 現場監督の場合：現場の担当監督のみ承認可
-            elif current_step.approver_position == 'site_supervisor':
-                if invoice.construction_site and invoice.construction_site.supervisor == user:
-                    can_approve = True
-            # 指定ユーザーが設定されている場合
-            elif current_step.approver_user:
-                if current_step.approver_user == user:
-                    can_approve = True
-            # 役職が一致する場合
-            elif user.position == current_step.approver_position:
-                can_approve = True
-            
-            if not can_approve:
-                errors.append({'id': invoice.id, 'invoice_number': invoice.invoice_number, 'error': '承認権限がありません'})
-                continue
-                
-            try:
-                # 承認処理（approveメソッドと同様のロジック）
-                ApprovalHistory.objects.create(
-                    invoice=invoice,
-                    approval_step=invoice.current_approval_step,
-                    user=user,
-                    action='approved',
-                    comment=comment
-                )
-                
-                # 次のステップへ
-                current_step_order = invoice.current_approval_step.step_order
-                next_step = invoice.approval_route.steps.filter(
-                    step_order=current_step_order + 1
-                ).first()
-                
-                if next_step:
-                    invoice.current_approval_step = next_step
-                    if next_step.approver_position == 'accountant':
-                        # 経理ステップ: 誰でも承認可能
-                        invoice.current_approver = None
-                    elif next_step.approver_user:
-                        invoice.current_approver = next_step.approver_user
-                    else:
-                        next_approver = User.objects.filter(
-                            user_type='internal',
-                            company=invoice.receiving_company,
-                            position=next_step.approver_position,
-                            is_active=True
-                        ).order_by('-id').first()
-                        if next_approver:
-                            invoice.current_approver = next_approver
-                    
-                    invoice.save()
-                    
-                    # 通知（経理の場合は全経理に通知）
-                    if next_step.approver_position == 'accountant':
-                        accountants = User.objects.filter(
-                            user_type='internal',
-                            company=invoice.receiving_company,
-                            position='accountant',
-                            is_active=True
-                        )
-                        for acc in accountants:
-                            self._send_notification_email(
-                                recipient=acc,
-                                subject=f'【請求書承認依頼】{invoice.invoice_number}',
-                                message=f'一括承認により経理確認依頼が届いています。'
-                            )
-                    elif invoice.current_approver:
-                        self._send_notification_email(
-                            recipient=invoice.current_approver,
-                            subject=f'【請求書承認依頼】{invoice.invoice_number}',
-                            message=f'一括承認により承認依頼が届いています。'
-                        )
-                else:
-                    # 完了
-                    invoice.status = 'approved'
-                    invoice.current_approval_step = None
-                    invoice.current_approver = None
-                    invoice.save()
-                    
-                    # 完了通知
-                    self._send_notification_email(
-                        recipient=invoice.created_by,
-                        subject=f'【承認完了】{invoice.invoice_number}',
-                        message=f'請求書が一括承認されました。'
-                    )
-                
-                # ログ記録
-                AccessLog.log(user, 'bulk_approve', 'Invoice', invoice.id, {'comment': comment})
-                if 'AuditLog' in globals():
-                     AuditLog.objects.create(
-                        user=user, action='approve', target_model='Invoice', 
-                        target_id=str(invoice.id), target_label=invoice.invoice_number,
-                        details={'comment': comment, 'type': 'bulk'}
-                     )
-                
-                success_count += 1
-                
-            except Exception as e:
-                errors.append({'id': invoice.id, 'invoice_number': invoice.invoice_number, 'error': str(e)})
+        # 承認ルート・承認者候補をまとめて取得し、1トランザクションで一括書き込み（通知は送信キューへ）
+        service = BulkApprovalService(request.user, comment)
+        success_count = service.approve(visible_ids)
+        errors = service.errors
         
         return Response({
             'success_count': success_count,
@@ -1286,6 +1151,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=True, methods=['post'], permission_classes=[IsInternalUser])
+    @transaction.atomic
     def approve(self, request, pk=None):
         """
         請求書承認
@@ -1325,7 +1191,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 # 承認ルートがあれば、承認者の役職からステップを見つける
                 if invoice.approval_route:
                     # 現場監督の場合は特別処理
-                    if invoice.construction_site and invoice.current_approver == invoice.construction_site.supervisor:
+                    if invoice.is_site_supervisor(invoice.current_approver):
                         current_step = invoice.approval_route.steps.filter(
                             approver_position='site_supervisor'
                         ).first()
@@ -1361,13 +1227,17 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 )
         # 現場監督の場合：現場の担当監督のみ承認可
         elif current_step.approver_position == 'site_supervisor':
-            if invoice.construction_site and invoice.construction_site.supervisor == user:
+            if invoice.is_site_supervisor(user):
                 can_approve = True
         # 指定ユーザーが設定されている場合
         elif current_step.approver_user:
             if current_step.approver_user == user:
                 can_approve = True
-        # 役職が一致する場合
+        # 承認者が割り当て済みの場合（共有テンプレートのステップは approver_user を持たない）：その本人のみ
+        elif invoice.current_approver_id:
+            if invoice.current_approver_id == user.id:
+                can_approve = True
+        # 承認者を割り当てられなかった場合のみ役職で判定
         elif user.position == current_step.approver_position:
             can_approve = True
         
@@ -1434,12 +1304,9 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 elif next_step.approver_user:
                     invoice.current_approver = next_step.approver_user
                 else:
-                    next_approver = User.objects.filter(
-                        user_type='internal',
-                        company=invoice.receiving_company,
-                        position=next_step.approver_position,
-                        is_active=True
-                    ).order_by('-id').first()
+                    next_approver = ApproverDirectory.first(
+                        invoice.receiving_company_id, next_step.approver_position
+                    )
 
                     if next_approver:
                         invoice.current_approver = next_approver
@@ -1452,12 +1319,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 invoice.save()
 
                 if next_step.approver_position == 'accountant':
-                    accountants = User.objects.filter(
-                        user_type='internal',
-                        company=invoice.receiving_company,
-                        position='accountant',
-                        is_active=True
-                    )
+                    accountants = ApproverDirectory.users(invoice.receiving_company_id, 'accountant')
                     for acc in accountants:
                         self._send_notification_email(
                             recipient=acc,
@@ -1510,6 +1372,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         })
     
     @action(detail=True, methods=['post'], permission_classes=[IsInternalUser])
+    @transaction.atomic
     def reject(self, request, pk=None):
         """
         請求書却下
@@ -1570,6 +1433,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         })
     
     @action(detail=True, methods=['post'], permission_classes=[IsInternalUser])
+    @transaction.atomic
     def return_invoice(self, request, pk=None):
         """
         請求書差し戻し
@@ -1721,26 +1585,38 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             ]
         })
     
+    def _pdf_response(self, request, invoice, filename):
+        """
+        請求書PDFのレスポンス
+        描画内容のハッシュを ETag とし、If-None-Match が一致すれば304、
+        それ以外はキャッシュ済みのPDFファイル（無ければ描画して保存）を返す
+        """
+        fingerprint = InvoicePDFCache.fingerprint(invoice)
+        etag = f'"{fingerprint}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            fileobj, _ = InvoicePDFCache.get_or_render(invoice, fingerprint)
+            response = FileResponse(fileobj, as_attachment=True, filename=filename, content_type='application/pdf')
+        response['ETag'] = etag
+        # 認証付きのため共有キャッシュには載せず、毎回 ETag で再検証させる
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
     @action(detail=True, methods=['get'])
     def generate_pdf(self, request, pk=None):
         """請求書PDF生成"""
         invoice = self.get_object()
         
         try:
-            from .pdf_generator import generate_invoice_pdf
+            response = self._pdf_response(request, invoice, f'invoice_{invoice.invoice_number}.pdf')
             
-            pdf_buffer = generate_invoice_pdf(invoice)
-            
-            # 生成履歴を記録
-            PDFGenerationLog.objects.create(
-                invoice=invoice,
-                generated_by=request.user,
-                file_size=len(pdf_buffer.getvalue())
-            )
-            
-            # PDFレスポンス
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
+            # 生成履歴を記録（ブラウザのキャッシュが有効な304応答は除く）
+            if response.status_code == 200:
+                PDFGenerationLog.objects.create(
+                    invoice=invoice,
+                    generated_by=request.user,
+                    file_size=int(response['Content-Length'])
+                )
             
             return response
         except ImportError:
@@ -1870,6 +1746,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'], permission_classes=[IsInternalUser])
+    @transaction.atomic
     def set_received(self, request, pk=None):
         """請求書を受領状態にする（訂正期限を設定）"""
         invoice = self.get_object()
@@ -1998,15 +1875,9 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     
     def _send_notification_email(self, recipient, subject, message):
         """
-        通知メール送信（開発環境ではコンソール出力）
+        通知メールを送信キューに登録（送信は send_outbox_emails コマンド。開発環境ではコンソール出力）
         """
-        print(f"\n{'='*60}")
-        print(f"📧 メール通知")
-        print(f"{'='*60}")
-        print(f"宛先: {recipient.email} ({recipient.get_full_name()})")
-        print(f"件名: {subject}")
-        print(f"\n{message}")
-        print(f"{'='*60}\n")
+        EmailOutbox.enqueue(recipient.email, subject, message)
     
     # ==========================================
     # Phase 5: 追加要件エンドポイント
@@ -2040,21 +1911,10 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             details={'invoice_number': invoice.invoice_number, 'type': 'pdf'}
         )
         
-        # PDF生成
+        # PDF（描画済みならキャッシュから返す）
         try:
-            from .pdf_generator import generate_invoice_pdf
-            pdf_buffer = generate_invoice_pdf(invoice)
-            
-            # ファイル名を設定（日本語対応）
             invoice_number = invoice.invoice_number or f'invoice_{invoice.id}'
-            filename = f'invoice_{invoice_number}.pdf'
-            
-            # PDFレスポンスを返す
-            response = HttpResponse(pdf_buffer.read(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            response['Content-Type'] = 'application/pdf'
-            
-            return response
+            return self._pdf_response(request, invoice, f'invoice_{invoice_number}.pdf')
             
         except Exception as e:
             import traceback
@@ -2297,57 +2157,15 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             if getattr(user, 'user_type', '') != 'internal':
                 return Response({'count': 0, 'results': []})
             
-            # Step 1: IDだけ取得（軽量クエリ）
-            pending_ids = list(Invoice.objects.filter(
-                current_approver=user,
-                status='pending_approval'
-            ).values_list('id', flat=True))
-            
-            # 経理ユーザーの場合：経理ステップの全請求書も対象
-            if getattr(user, 'position', '') == 'accountant':
-                try:
-                    accountant_ids = list(Invoice.objects.filter(
-                        status='pending_approval',
-                        current_approval_step__approver_position='accountant',
-                    ).exclude(
-                        id__in=pending_ids
-                    ).values_list('id', flat=True))
-                    pending_ids.extend(accountant_ids)
-                except Exception as e:
-                    print(f"[my_pending_approvals] accountant query error: {e}")
-            
-            # 役職に基づく承認待ち（ワークフロー対応）
-            role_map = {
-                'site_supervisor': 'supervisor',
-                'manager': 'manager',
-                'accountant': 'accounting',
-                'director': 'executive',
-                'president': 'president',
-            }
-            user_role = role_map.get(getattr(user, 'position', ''))
-            if user_role:
-                try:
-                    workflow_ids = list(InvoiceApprovalStep.objects.filter(
-                        approver_role=user_role,
-                        step_status='in_progress'
-                    ).values_list('workflow__invoice_id', flat=True))
-                    for wid in workflow_ids:
-                        if wid not in pending_ids:
-                            pending_ids.append(wid)
-                except Exception as e:
-                    print(f"[my_pending_approvals] workflow query error: {e}")
-            
-            if not pending_ids:
-                return Response({'count': 0, 'results': []})
-            
-            # Step 2: IDで取得してシリアライズ
-            invoices = Invoice.objects.filter(
-                id__in=pending_ids,
-                status='pending_approval'
-            ).select_related(
+            # 承認待ち受信箱（本人宛て＋経理ステップ・ワークフロー役職宛て）から取得
+            invoices = ApprovalInbox.invoices_for(user).select_related(
                 'customer_company',
                 'construction_site',
-                'created_by'
+                'construction_type',
+                'current_approver',
+                'created_by',
+                'template',
+                'invoice_period'
             ).order_by('-created_at')
             
             try:
@@ -2380,7 +2198,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                         print(f"[my_pending_approvals] item serialize error for invoice {inv.id}: {item_err}")
             
             return Response({
-                'count': len(pending_ids),
+                'count': len(results),
                 'results': results
             })
         except Exception as e:
@@ -2393,25 +2211,6 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 '_debug_error': f'{type(e).__name__}: {str(e)}'
             })
     
-    def _count_my_pending(self, user):
-        """自分の承認待ち件数（経理は全経理ステップをカウント）"""
-        count = Invoice.objects.filter(
-            status='pending_approval',
-            current_approver=user
-        ).count()
-        
-        # 経理ユーザーの場合、current_approver=Noneで経理ステップの請求書もカウント
-        if user.position == 'accountant':
-            accountant_count = Invoice.objects.filter(
-                status='pending_approval',
-                current_approval_step__approver_position='accountant',
-            ).exclude(
-                current_approver=user  # 二重カウント防止
-            ).count()
-            count += accountant_count
-        
-        return count
-    
     # ==========================================
     # Phase 6: 一括承認機能
     # ==========================================
@@ -2442,9 +2241,11 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             status='pending_approval'
         )
         
-        # 自分が承認者の請求書のみフィルタ
+        # 自分の承認待ち（受信箱）の請求書のみフィルタ
         if not request.user.is_super_admin:
-            invoices = invoices.filter(current_approver=request.user)
+            invoices = invoices.filter(
+                id__in=ApprovalInbox.for_user(request.user).values('invoice_id')
+            )
         
         approved_count = 0
         failed_count = 0
@@ -2576,50 +2377,6 @@ class DashboardViewSet(viewsets.GenericViewSet):
     """ダッシュボードAPI - ユーザー種別対応版"""
     permission_classes = [IsAuthenticated]
     
-    def _my_pending_queryset(self, user):
-        """自分の承認待ち請求書のクエリセット（経理は経理ステップも含む）"""
-        qs = Invoice.objects.filter(status='pending_approval', current_approver=user)
-        if getattr(user, 'position', '') == 'accountant':
-            accountant_qs = Invoice.objects.filter(
-                status='pending_approval',
-                current_approval_step__approver_position='accountant',
-            ).exclude(current_approver=user)
-            qs = qs | accountant_qs
-        return qs.distinct()
-
-    def _count_my_pending(self, user):
-        """自分の承認待ち件数（B：経理は経理ステップも含む）"""
-        try:
-            return self._my_pending_queryset(user).count()
-        except Exception:
-            import traceback
-            traceback.print_exc()
-            return 0
-
-    def _my_pending_amount(self, user):
-        """自分の承認待ち合計金額（B）"""
-        try:
-            return self._my_pending_queryset(user).aggregate(
-                total=Sum('total_amount')
-            )['total'] or 0
-        except Exception:
-            import traceback
-            traceback.print_exc()
-            return 0
-
-    def _my_approved_stats(self, user):
-        """自分がこれまでに承認した請求書の件数・合計金額（A）"""
-        try:
-            approved_ids = ApprovalHistory.objects.filter(
-                user=user, action='approved'
-            ).values_list('invoice_id', flat=True).distinct()
-            qs = Invoice.objects.filter(id__in=list(approved_ids))
-            return qs.count(), (qs.aggregate(total=Sum('total_amount'))['total'] or 0)
-        except Exception:
-            import traceback
-            traceback.print_exc()
-            return 0, 0
-    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """
@@ -2630,79 +2387,14 @@ class DashboardViewSet(viewsets.GenericViewSet):
         """
         try:
             user = request.user
-            current_month = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            next_month = (current_month + timedelta(days=32)).replace(day=1)
 
+            # 条件付き集計1回＋短時間キャッシュ（DashboardStatsService）
             if user.user_type == 'internal':
-                # 自社フィルター（company未設定の場合は全件）
-                company_filter = Q(receiving_company=user.company) if user.company else Q()
-
                 # 社内ユーザー向け統計
-                stats = {
-                    'pending_invoices': Invoice.objects.filter(
-                        company_filter,
-                        status='pending_approval'
-                    ).count(),
-
-                    'my_pending_approvals': self._count_my_pending(user),
-
-                    'monthly_payment': Invoice.objects.filter(
-                        company_filter,
-                        payment_due_date__gte=current_month,
-                        payment_due_date__lt=next_month,
-                        status__in=['approved', 'paid']
-                    ).aggregate(total=Sum('total_amount'))['total'] or 0,
-
-                    'partner_companies': CustomerCompany.objects.filter(
-                        is_active=True
-                    ).count(),
-
-                    # C: 全社の進行中（提出済み・承認待ち）合計金額・件数
-                    'submitted_total_amount': Invoice.objects.filter(
-                        company_filter,
-                        status__in=['submitted', 'pending_approval']
-                    ).aggregate(total=Sum('total_amount'))['total'] or 0,
-                    'submitted_count': Invoice.objects.filter(
-                        company_filter,
-                        status__in=['submitted', 'pending_approval']
-                    ).count(),
-
-                    # B: 自分の承認待ち合計金額（件数は my_pending_approvals）
-                    'my_pending_amount': self._my_pending_amount(user),
-                }
-
-                # A: 自分が承認してきた累計（件数・金額）
-                approved_count, approved_total = self._my_approved_stats(user)
-                stats['my_approved_count'] = approved_count
-                stats['my_approved_total'] = approved_total
+                stats = DashboardStatsService.internal_stats(user)
             else:
                 # 協力会社ユーザー向け統計
-                stats = {
-                    'draft_count': Invoice.objects.filter(
-                        customer_company=user.customer_company,
-                        status='draft'
-                    ).count(),
-                    
-                    'submitted_count': Invoice.objects.filter(
-                        customer_company=user.customer_company,
-                        status__in=['submitted', 'pending_approval']
-                    ).count(),
-                    
-                    'returned_count': Invoice.objects.filter(
-                        customer_company=user.customer_company,
-                        status='returned'
-                    ).count(),
-                    
-                    'approved_count': Invoice.objects.filter(
-                        customer_company=user.customer_company,
-                        status='approved'
-                    ).count(),
-                    
-                    'total_amount_pending': Invoice.objects.filter(
-                        customer_company=user.customer_company,
-                        status__in=['submitted', 'pending_approval', 'approved']
-                    ).aggregate(total=Sum('total_amount'))['total'] or 0,
-                }
+                stats = DashboardStatsService.customer_stats(user)
 
             return Response(stats, status=status.HTTP_200_OK)
         except Exception as e:
@@ -2781,43 +2473,27 @@ class DashboardViewSet(viewsets.GenericViewSet):
         if request.user.user_type != 'internal':
             return Response({'error': '社内ユーザーのみアクセス可能です'}, status=403)
         
-        # 過去12ヶ月のデータを取得
+        # 過去12ヶ月（12ヶ月前から今月まで）の年月
         today = timezone.now().date()
-        trends = []
+        months = []
+        for i in range(11, -1, -1):
+            index = today.year * 12 + today.month - 1 - i
+            months.append((index // 12, index % 12 + 1))
+        
+        # 会社別月次集計から12ヶ月分を1回で集計
+        monthly = ChartDataService.get_invoiced_monthly_totals(
+            months[0][0] * 100 + months[0][1], months[-1][0] * 100 + months[-1][1]
+        )
         
-        for i in range(11, -1, -1):  # 12ヶ月前から今月まで
-            # 月初を計算
-            if today.month > i:
-                year = today.year
-                month = today.month - i
-            else:
-                year = today.year - 1
-                month = 12 - (i - today.month)
-            
-            # 正規化
-            while month <= 0:
-                month += 12
-                year -= 1
-            while month > 12:
-                month -= 12
-                year += 1
-            
-            # その月の集計
-            invoices = Invoice.objects.filter(
-                invoice_date__year=year,
-                invoice_date__month=month,
-                status__in=['approved', 'paid', 'payment_preparing']
-            )
-            
-            total = invoices.aggregate(total=Sum('total_amount'))['total'] or 0
-            count = invoices.count()
-            
+        trends = []
+        for year, month in months:
+            row = monthly.get(year * 100 + month, {})
             trends.append({
                 'year': year,
                 'month': month,
                 'label': f'{year}/{month:02d}',
-                'total_amount': float(total),
-                'invoice_count': count,
+                'total_amount': float(row.get('total') or 0),
+                'invoice_count': row.get('count') or 0,
             })
         
         return Response({
@@ -3012,7 +2688,10 @@ class MonthlyInvoicePeriodViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def close(self, request, pk=None):
-        """期間を締める"""
+        """
+        期間を締める
+        dry_run=true の場合は締めずに、承認待ちへ移す請求書の変更前後と対象外の請求書を返す
+        """
         period = self.get_object()
         
         # 既に締められているか確認
@@ -3029,12 +2708,16 @@ class MonthlyInvoicePeriodViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        if str(request.data.get('dry_run', request.query_params.get('dry_run', ''))).lower() in ('1', 'true'):
+            return Response(PeriodCloseService(period, request.user).plan())
+        
         # 締め処理実行
-        period.close_period(request.user)
+        processed_count = period.close_period(request.user)
         
         serializer = MonthlyInvoicePeriodSerializer(period)
         return Response({
             'message': f'{period.period_name}を締めました',
+            'processed_count': processed_count,
             'period': serializer.data
         })
     
@@ -3375,23 +3058,24 @@ class ReportViewSet(viewsets.GenericViewSet):
     @action(detail=False, methods=['get'])
     def site_payment_summary(self, request):
         """5.1 現場別支払い割合（円グラフ用）"""
-        # 承認済み・支払い済みの請求書を現場別に集計
-        site_totals = Invoice.objects.filter(
-            status__in=['approved', 'paid', 'payment_preparing']
+        # 承認済み・支払い済みの請求書を現場別月次集計から集計
+        site_totals = SiteMonthlyRollup.objects.filter(
+            bucket__in=InvoiceMonthlyRollup.INVOICED_BUCKETS
         ).values(
             'construction_site__id',
             'construction_site__name',
             'construction_site__total_budget'
         ).annotate(
-            total_amount=Sum('total_amount')
-        ).order_by('-total_amount')
+            count=Sum('invoice_count'),
+            total=Sum('total_amount')
+        ).filter(count__gt=0).order_by('-total')
         
-        grand_total = sum(item['total_amount'] or 0 for item in site_totals)
+        grand_total = sum(item['total'] or 0 for item in site_totals)
         
         result = []
         for item in site_totals:
             if item['construction_site__id']:
-                total = item['total_amount'] or 0
+                total = item['total'] or 0
                 budget = item['construction_site__total_budget'] or 0
                 result.append({
                     'site_id': item['construction_site__id'],
@@ -3399,7 +3083,7 @@ class ReportViewSet(viewsets.GenericViewSet):
                     'total_amount': total,
                     'percentage': round((total / grand_total * 100) if grand_total > 0 else 0, 1),
                     'budget': budget,
-                    'budget_rate': round((total / budget * 100) if budget > 0 else None, 1),
+                    'budget_rate': round(total / budget * 100, 1) if budget > 0 else None,
                     'is_alert': (total / budget * 100) >= 90 if budget > 0 else False
                 })
         
@@ -3414,28 +3098,32 @@ class ReportViewSet(viewsets.GenericViewSet):
         year = request.query_params.get('year', timezone.now().year)
         month = request.query_params.get('month')
         
-        queryset = Invoice.objects.all()
-        
-        if month:
-            queryset = queryset.filter(
-                invoice_date__year=year,
-                invoice_date__month=month
-            )
-        else:
-            queryset = queryset.filter(invoice_date__year=year)
-        
-        summary = queryset.values(
+        # 協力会社別月次集計から集計（区分 pending = 提出済み・承認待ち）
+        summary = CustomerMonthlyRollup.objects.filter(
+            InvoiceMonthlyRollup.period_q(year, month)
+        ).values(
             'customer_company__id',
             'customer_company__name',
-            month_field=F('invoice_date__month')
+            month_field=F('year_month') % 100
         ).annotate(
-            invoice_count=Count('id'),
-            total_amount=Sum('total_amount'),
-            approved_count=Count('id', filter=Q(status='approved')),
-            pending_count=Count('id', filter=Q(status__in=['submitted', 'pending_approval']))
-        ).order_by('customer_company__name', 'month_field')
+            count=Sum('invoice_count'),
+            total=Sum('total_amount'),
+            approved_count=Coalesce(Sum('invoice_count', filter=Q(bucket='approved')), 0),
+            pending_count=Coalesce(Sum('invoice_count', filter=Q(bucket='pending')), 0)
+        ).filter(count__gt=0).order_by('customer_company__name', 'month_field')
         
-        return Response(list(summary))
+        return Response([
+            {
+                'customer_company__id': row['customer_company__id'],
+                'customer_company__name': row['customer_company__name'],
+                'month_field': row['month_field'],
+                'invoice_count': row['count'],
+                'total_amount': row['total'],
+                'approved_count': row['approved_count'],
+                'pending_count': row['pending_count'],
+            }
+            for row in summary
+        ])
     
     @action(detail=False, methods=['get'])
     def csv_export(self, request):
@@ -3444,75 +3132,67 @@ class ReportViewSet(viewsets.GenericViewSet):
         month = request.query_params.get('month')
         export_type = request.query_params.get('type', 'monthly')  # monthly, company, site
         
-        queryset = Invoice.objects.filter(invoice_date__year=year)
-        if month:
-            queryset = queryset.filter(invoice_date__month=month)
-        
-        # CSVレスポンス作成
-        response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
         filename = f'invoices_{year}_{month or "all"}.csv'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        writer = csv.writer(response)
         
         if export_type == 'company':
-            # 業者別累計
-            writer.writerow(['協力会社', '請求書数', '合計金額', '承認済み', '未承認'])
-            summary = queryset.values('customer_company__name').annotate(
-                count=Count('id'),
+            # 業者別累計（協力会社別月次集計から）
+            header = ['協力会社', '請求書数', '合計金額', '承認済み', '未承認']
+            summary = CustomerMonthlyRollup.objects.filter(
+                InvoiceMonthlyRollup.period_q(year, month)
+            ).values('customer_company__name').annotate(
+                count=Sum('invoice_count'),
                 total=Sum('total_amount'),
-                approved=Count('id', filter=Q(status='approved')),
-                pending=Count('id', filter=Q(status__in=['submitted', 'pending_approval']))
+                approved=Coalesce(Sum('invoice_count', filter=Q(bucket='approved')), 0),
+                pending=Coalesce(Sum('invoice_count', filter=Q(bucket='pending')), 0)
+            ).filter(count__gt=0)
+            rows = (
+                [row['customer_company__name'], row['count'], row['total'], row['approved'], row['pending']]
+                for row in summary
             )
-            for row in summary:
-                writer.writerow([
-                    row['customer_company__name'],
-                    row['count'],
-                    row['total'],
-                    row['approved'],
-                    row['pending']
-                ])
         elif export_type == 'site':
-            # 現場別累計
-            writer.writerow(['工事現場', '請求書数', '合計金額', '予算', '消化率'])
-            summary = queryset.values(
+            # 現場別累計（現場別月次集計から）
+            header = ['工事現場', '請求書数', '合計金額', '予算', '消化率']
+            summary = SiteMonthlyRollup.objects.filter(
+                InvoiceMonthlyRollup.period_q(year, month)
+            ).values(
                 'construction_site__name',
                 'construction_site__total_budget'
             ).annotate(
-                count=Count('id'),
+                count=Sum('invoice_count'),
                 total=Sum('total_amount')
-            )
-            for row in summary:
-                budget = row['construction_site__total_budget'] or 0
-                total = row['total'] or 0
-                rate = round((total / budget * 100) if budget > 0 else 0, 1)
-                writer.writerow([
-                    row['construction_site__name'],
-                    row['count'],
-                    total,
-                    budget,
-                    f'{rate}%'
-                ])
+            ).filter(count__gt=0)
+            
+            def site_rows():
+                for row in summary:
+                    budget = row['construction_site__total_budget'] or 0
+                    total = row['total'] or 0
+                    rate = round((total / budget * 100) if budget > 0 else 0, 1)
+                    yield [row['construction_site__name'], row['count'], total, budget, f'{rate}%']
+            
+            rows = site_rows()
         else:
-            # 月別明細
-            writer.writerow([
+            # 月別明細（行数が多いため values_list + iterator で順次出力）
+            header = [
                 '請求書番号', '協力会社', '工事現場', '工種', '請求日', 
                 '金額', 'ステータス', '注文書番号', '金額差異'
-            ])
-            for invoice in queryset.select_related(
-                'customer_company', 'construction_site', 'construction_type', 'purchase_order'
-            ):
-                writer.writerow([
-                    invoice.invoice_number,
-                    invoice.customer_company.name if invoice.customer_company else '',
-                    invoice.construction_site.name if invoice.construction_site else '',
-                    invoice.construction_type.name if invoice.construction_type else '',
-                    invoice.invoice_date.strftime('%Y/%m/%d') if invoice.invoice_date else '',
-                    invoice.total_amount,
-                    invoice.get_status_display(),
-                    invoice.purchase_order.order_number if invoice.purchase_order else '',
-                    invoice.amount_difference
-                ])
+            ]
+            status_display = dict(Invoice.STATUS_CHOICES)
+            queryset = Invoice.objects.filter(Invoice.accounting_period_q(year, month))
+            detail_rows = queryset.values_list(
+                'invoice_number', 'customer_company__name', 'construction_site__name',
+                'construction_type__name', 'invoice_date', 'total_amount', 'status',
+                'purchase_order__order_number', 'amount_difference',
+            ).iterator(chunk_size=CSVExportService.ITERATOR_CHUNK_SIZE)
+            rows = (
+                [
+                    invoice_number, company_name or '', site_name or '', type_name or '',
+                    invoice_date.strftime('%Y/%m/%d') if invoice_date else '',
+                    total_amount, status_display.get(invoice_status, ''),
+                    order_number or '', amount_difference,
+                ]
+                for (invoice_number, company_name, site_name, type_name, invoice_date,
+                     total_amount, invoice_status, order_number, amount_difference) in detail_rows
+            )
         
         # アクセスログ
         AccessLog.log(
@@ -3522,28 +3202,34 @@ class ReportViewSet(viewsets.GenericViewSet):
             details={'year': year, 'month': month, 'type': export_type}
         )
         
-        return response
+        return CSVExportService.streaming_response(filename, header, rows)
     
     @action(detail=False, methods=['get'])
     def alert_sites(self, request):
         """5.1 アラート状態の現場一覧（煙が立ってる現場）"""
+        # 閾値付近以上の現場だけをDB側で絞り込み（消化率の丸めを考慮して1%手前から。判定は下で行う）
         sites = ConstructionSite.objects.filter(
             is_active=True,
-            is_completed=False
+            is_completed=False,
+            total_budget__gt=0,
+        ).filter(
+            Q(invoiced_total__gte=F('total_budget') * (F('budget_alert_threshold') - 1) / 100) |
+            Q(invoiced_total__gt=F('total_budget'))
         )
         
         alert_sites = []
         for site in sites:
             rate = site.get_budget_consumption_rate()
-            if site.is_budget_alert() or site.is_budget_exceeded():
+            if rate >= site.budget_alert_threshold or rate > 100:
+                is_exceeded = rate > 100
                 alert_sites.append({
                     'id': site.id,
                     'name': site.name,
                     'budget': site.total_budget,
                     'invoiced': site.get_total_invoiced_amount(),
                     'consumption_rate': rate,
-                    'is_exceeded': site.is_budget_exceeded(),
-                    'alert_type': 'exceeded' if site.is_budget_exceeded() else 'warning'
+                    'is_exceeded': is_exceeded,
+                    'alert_type': 'exceeded' if is_exceeded else 'warning'
                 })
         
         return Response({
@@ -3962,13 +3648,50 @@ class InvoiceCorrectionViewSet(viewsets.ModelViewSet):
 # CSV出力、円グラフ、監査ログ、PDF生成など
 # ==========================================
 
+from . import profiling
 from .services import (
-    CSVExportService, ChartDataService, AuditLogService,
+    CSVExportService, ExcelExportService, ChartDataService, AuditLogService,
     MonthlyClosingService, SafetyFeeService, AmountVerificationService,
-    EmailService, BudgetAlertService
+    EmailService, BudgetAlertService, DashboardStatsService, BulkApprovalService,
+    ApproverDirectory, InvoicePDFCache, PDFExportService, PeriodCloseService,
+    AuditArchiveService,
 )
 
 
+def _local_day_start(value, days=0):
+    """日付（date または 'YYYY-MM-DD'）の days 日後の 0 時（ローカル時刻）。日時のインデックスで範囲検索するため"""
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value)
+        except ValueError:
+            raise DRFValidationError({'date': f'日付の形式が正しくありません: {value}'})
+    return timezone.make_aware(datetime.combine(value + timedelta(days=days), datetime.min.time()))
+
+
+def filter_export_invoices(params):
+    """出力用の請求書一覧のフィルター済みクエリセットを返す（CSV/Excel/PDF/PDF一括出力共通）"""
+    status_filter = params.get('status')
+    year = params.get('year')
+    month = params.get('month')
+    site_id = params.get('site')
+    company_id = params.get('company')
+
+    queryset = Invoice.objects.select_related(
+        'customer_company', 'construction_site', 'construction_type', 'created_by'
+    )
+    if status_filter and status_filter != 'all':
+        queryset = queryset.filter(status=status_filter)
+    if year:
+        queryset = queryset.filter(Invoice.accounting_period_q(year, month))
+    elif month:
+        queryset = queryset.filter(accounting_date__month=int(month))
+    if site_id and str(site_id).isdigit():
+        queryset = queryset.filter(construction_site_id=int(site_id))
+    if company_id and str(company_id).isdigit():
+        queryset = queryset.filter(customer_company_id=int(company_id))
+    return queryset.order_by('-invoice_date', '-created_at')
+
+
 class CSVExportViewSet(viewsets.ViewSet):
     """CSV出力ViewSet"""
     permission_classes = [IsAuthenticated, IsAccountantOrSuperAdmin]
@@ -3976,92 +3699,20 @@ class CSVExportViewSet(viewsets.ViewSet):
 
     def _filtered_invoices(self, request):
         """請求書一覧のフィルター済みクエリセットを返す（CSV/Excel/PDF共通）"""
-        status_filter = request.query_params.get('status')
-        year = request.query_params.get('year')
-        month = request.query_params.get('month')
-        site_id = request.query_params.get('site')
-        company_id = request.query_params.get('company')
-
-        queryset = Invoice.objects.select_related(
-            'customer_company', 'construction_site', 'construction_type', 'created_by'
-        )
-        if status_filter and status_filter != 'all':
-            queryset = queryset.filter(status=status_filter)
-        if year:
-            queryset = queryset.filter(invoice_date__year=int(year))
-        if month:
-            queryset = queryset.filter(invoice_date__month=int(month))
-        if site_id and str(site_id).isdigit():
-            queryset = queryset.filter(construction_site_id=int(site_id))
-        if company_id and str(company_id).isdigit():
-            queryset = queryset.filter(customer_company_id=int(company_id))
-        return queryset.order_by('-invoice_date', '-created_at')
+        return filter_export_invoices(request.query_params)
 
     @action(detail=False, methods=['get'])
     def invoices_excel(self, request):
         """請求書一覧をExcel(.xlsx)で出力（経理のみ）"""
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+            import openpyxl  # noqa: F401
         except ImportError:
             return Response({'error': 'Excel出力機能が利用できません（サーバー設定）'}, status=503)
 
+        # write_only ブックに1行ずつ書き込み、一時ファイルから送信（件数によらずメモリ使用量は一定）
         queryset = self._filtered_invoices(request)
-        wb = Workbook()
-        ws = wb.active
-        ws.title = '請求書一覧'
-
-        headers = ['請求書番号', '協力会社', '工事現場', '工種', '請求日',
-                   '小計', '消費税', '合計金額', '協力会費', '差引支払額',
-                   'ステータス', '作成日', '作成者']
-        ws.append(headers)
-        header_fill = PatternFill('solid', fgColor='2F5496')
-        header_font = Font(color='FFFFFF', bold=True)
-        thin = Side(style='thin', color='D0D0D0')
-        border = Border(left=thin, right=thin, top=thin, bottom=thin)
-        for col, _ in enumerate(headers, 1):
-            c = ws.cell(row=1, column=col)
-            c.fill = header_fill
-            c.font = header_font
-            c.alignment = Alignment(horizontal='center', vertical='center')
-            c.border = border
-
-        for inv in queryset:
-            safety = inv.safety_cooperation_fee or 0
-            net = (inv.total_amount or 0) - safety
-            ws.append([
-                inv.invoice_number,
-                inv.customer_company.name if inv.customer_company else '',
-                inv.construction_site.name if inv.construction_site else (inv.construction_site_name or ''),
-                inv.construction_type.name if inv.construction_type else (inv.construction_type_other or ''),
-                inv.invoice_date.strftime('%Y/%m/%d') if inv.invoice_date else '',
-                int(inv.subtotal or 0), int(inv.tax_amount or 0), int(inv.total_amount or 0),
-                int(safety), int(net),
-                inv.get_status_display(),
-                inv.created_at.strftime('%Y/%m/%d %H:%M') if inv.created_at else '',
-                inv.created_by.get_full_name() if inv.created_by else '',
-            ])
-
-        # 列幅と数値書式
-        widths = [16, 22, 22, 14, 12, 12, 10, 13, 10, 13, 12, 17, 14]
-        for i, w in enumerate(widths, 1):
-            ws.column_dimensions[chr(64 + i) if i <= 26 else 'A'].width = w
-        for row in ws.iter_rows(min_row=2, min_col=6, max_col=10):
-            for cell in row:
-                cell.number_format = '#,##0'
-                cell.border = border
-
-        import io
-        buf = io.BytesIO()
-        wb.save(buf)
-        buf.seek(0)
         filename = f'invoices_{timezone.now().strftime("%Y%m%d")}.xlsx'
-        resp = HttpResponse(
-            buf.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        resp['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return resp
+        return ExcelExportService.export_invoices(queryset, filename)
 
     @action(detail=False, methods=['get'])
     def invoices_pdf(self, request):
@@ -4072,11 +3723,9 @@ class CSVExportViewSet(viewsets.ViewSet):
             return Response({'error': 'PDF出力機能が利用できません'}, status=503)
 
         queryset = self._filtered_invoices(request)
-        pdf_buffer = generate_invoice_list_pdf(queryset)
+        pdf_file = generate_invoice_list_pdf(queryset)
         filename = f'invoices_{timezone.now().strftime("%Y%m%d")}.pdf'
-        resp = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-        resp['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return resp
+        return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
 
     @action(detail=False, methods=['get'])
     def invoices(self, request):
@@ -4084,13 +3733,13 @@ class CSVExportViewSet(viewsets.ViewSet):
         try:
             queryset = self._filtered_invoices(request)
             
-            # 監査ログ（エラーでも続行）
+            # 監査ログ（エラーでも続行。出力前に件数を数えるクエリは発行しない）
             try:
-                if queryset.exists():
-                    AuditLogService.log_invoice_action(
-                        request, queryset.first(),
-                        'export', {'type': 'invoices', 'count': queryset.count()}
-                    )
+                AuditLogService.log(
+                    request.user, 'export', 'Invoice',
+                    details={'type': 'invoices', 'filters': request.query_params.dict()},
+                    **AuditLogService.get_client_info(request)
+                )
             except Exception as e:
                 print(f"監査ログ記録エラー: {e}")
             
@@ -4179,6 +3828,71 @@ class CSVExportViewSet(viewsets.ViewSet):
             return Response({'error': f'CSV出力エラー: {str(e)}'}, status=500)
 
 
+class PDFExportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    請求書PDF一括出力（ZIP）ジョブ（経理のみ）
+    POST で登録して run_pdf_export_jobs コマンドが処理し、状態を GET でポーリングする
+    """
+    serializer_class = PDFExportJobSerializer
+    permission_classes = [IsAuthenticated, IsAccountantOrSuperAdmin]
+
+    def get_queryset(self):
+        queryset = PDFExportJob.objects.select_related('requested_by')
+        if not self.request.user.is_super_admin:
+            queryset = queryset.filter(requested_by=self.request.user)
+        return queryset
+
+    def create(self, request):
+        """
+        ジョブ登録
+        invoice_ids（請求書IDのリスト）を指定しない場合は CSV/Excel 出力と同じ条件
+        （status, year, month, site, company）で対象を絞り込む
+        """
+        invoice_ids = request.data.get('invoice_ids')
+        if invoice_ids is not None:
+            if not isinstance(invoice_ids, list) or not all(str(i).isdigit() for i in invoice_ids):
+                return Response({'error': 'invoice_ids は請求書IDのリストで指定してください'}, status=400)
+            queryset = Invoice.objects.filter(pk__in=[int(i) for i in invoice_ids]).order_by('id')
+        else:
+            queryset = filter_export_invoices(request.data)
+
+        ids = list(queryset.values_list('id', flat=True)[:PDFExportJob.MAX_INVOICES + 1])
+        if not ids:
+            return Response({'error': '対象の請求書がありません'}, status=400)
+        if len(ids) > PDFExportJob.MAX_INVOICES:
+            return Response(
+                {'error': f'一度に出力できるのは{PDFExportJob.MAX_INVOICES}件までです。条件を絞り込んでください'},
+                status=400
+            )
+
+        job = PDFExportService.create_job(request.user, ids)
+        try:
+            AuditLogService.log(
+                request.user, 'export', 'Invoice',
+                details={'type': 'invoices_pdf_zip', 'job_id': job.pk, 'count': len(ids)},
+                **AuditLogService.get_client_info(request)
+            )
+        except Exception as e:
+            print(f"監査ログ記録エラー: {e}")
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """完了したジョブの ZIP をダウンロード"""
+        job = self.get_object()
+        if job.status != 'done':
+            return Response({'error': 'まだ出力が完了していません', 'status': job.status}, status=409)
+        if not job.file_path:
+            return Response({'error': '保存期間を過ぎたため、ZIPファイルは削除されました'}, status=410)
+        try:
+            fileobj = open(job.file_path, 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'ZIPファイルが見つかりません'}, status=404)
+        return FileResponse(
+            fileobj, as_attachment=True, filename=f'invoices_{job.pk}.zip', content_type='application/zip'
+        )
+
+
 class ChartDataViewSet(viewsets.ViewSet):
     """チャートデータViewSet"""
     permission_classes = [IsAuthenticated]
@@ -4201,8 +3915,10 @@ class ChartDataViewSet(viewsets.ViewSet):
         """アラート状態の現場一覧"""
         sites = ConstructionSite.objects.filter(
             is_active=True,
-            is_completed=False
-        ).exclude(total_budget=0)
+            is_completed=False,
+            # 消化率の丸めを考慮して79%以上をDB側で抽出し、80%判定は下で行う
+            invoiced_total__gte=F('total_budget') * 79 / 100,
+        ).exclude(total_budget=0).select_related('supervisor')
         
         alert_sites = []
         for site in sites:
@@ -4245,32 +3961,36 @@ class AccessLogViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(user_id=user_id)
         if resource_type:
             queryset = queryset.filter(resource_type=resource_type)
+        # 日付は日時の範囲に直して絞り込む（timestamp__date だと日時のインデックスが使われない）
         if start_date:
-            queryset = queryset.filter(timestamp__date__gte=start_date)
+            queryset = queryset.filter(timestamp__gte=_local_day_start(start_date))
         if end_date:
-            queryset = queryset.filter(timestamp__date__lte=end_date)
+            queryset = queryset.filter(timestamp__lt=_local_day_start(end_date, days=1))
         
         return queryset[:1000]  # 最大1000件
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """監査ログサマリー"""
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
+        """監査ログサマリー（生ログではなく時間別集計から。ログの件数によらず一定の時間で返す）"""
+        today = timezone.localdate()
+        today_start = _local_day_start(today)
+        week_ago_start = _local_day_start(today, days=-7)
         
         # 今日のログ
-        today_logs = AccessLog.objects.filter(timestamp__date=today).count()
+        today_logs = AccessLogHourlyRollup.objects.filter(
+            hour__gte=today_start
+        ).aggregate(count=Sum('log_count'))['count'] or 0
         
         # 過去7日間のアクション別集計
-        action_summary = AccessLog.objects.filter(
-            timestamp__date__gte=week_ago
-        ).values('action').annotate(count=Count('id')).order_by('-count')
+        action_summary = AccessLogHourlyRollup.objects.filter(
+            hour__gte=week_ago_start
+        ).values('action').annotate(count=Sum('log_count')).order_by('-count')
         
         # 過去7日間のユーザー別集計
-        user_summary = AccessLog.objects.filter(
-            timestamp__date__gte=week_ago
+        user_summary = AccessLogHourlyRollup.objects.filter(
+            hour__gte=week_ago_start
         ).values('user__username', 'user__first_name', 'user__last_name').annotate(
-            count=Count('id')
+            count=Sum('log_count')
         ).order_by('-count')[:10]
         
         return Response({
@@ -4280,6 +4000,68 @@ class AccessLogViewSet(viewsets.ReadOnlyModelViewSet):
         })
 
 
+class AuditArchiveViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    アクセスログ・操作ログのアーカイブ台帳（スーパーアドミンのみ）
+    archive_audit_logs コマンドが書き出した月別の gzip 圧縮 JSON Lines の一覧・改ざん検証・ダウンロード
+    """
+    serializer_class = AuditArchiveSerializer
+    permission_classes = [IsAuthenticated, IsSuperAdmin]
+    
+    def get_queryset(self):
+        queryset = AuditArchive.objects.all()
+        table_name = self.request.query_params.get('table_name')
+        if table_name:
+            queryset = queryset.filter(table_name=table_name)
+        year_month_from = self.request.query_params.get('year_month_from')
+        if year_month_from:
+            queryset = queryset.filter(year_month__gte=year_month_from)
+        year_month_to = self.request.query_params.get('year_month_to')
+        if year_month_to:
+            queryset = queryset.filter(year_month__lte=year_month_to)
+        return queryset
+    
+    @action(detail=True, methods=['post'])
+    def verify(self, request, pk=None):
+        """ファイルの SHA-256 を台帳と照合"""
+        archive = self.get_object()
+        return Response({'id': archive.pk, 'valid': AuditArchiveService.verify(archive)})
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """アーカイブファイルをダウンロード"""
+        archive = self.get_object()
+        try:
+            fileobj = open(archive.file_path, 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'アーカイブファイルが見つかりません'}, status=404)
+        return FileResponse(
+            fileobj, as_attachment=True,
+            filename=f'{archive.table_name}_{archive.year_month}_{archive.part}.jsonl.gz',
+            content_type='application/gzip'
+        )
+
+
+class QueryProfileViewSet(viewsets.ViewSet):
+    """
+    ビューごとのクエリ数・処理時間の集計（スーパーアドミンのみ）
+    QueryProfilingMiddleware がこのプロセスで計測した直近の値を返す（プロセスごとに別集計）
+    """
+    permission_classes = [IsAuthenticated, IsSuperAdmin]
+    
+    def list(self, request):
+        return Response({
+            'window_size': profiling.store.window_size,
+            'endpoints': profiling.store.summary(),
+        })
+    
+    @action(detail=False, methods=['post'])
+    def reset(self, request):
+        """集計をリセット"""
+        profiling.store.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class DocumentTypeViewSet(viewsets.ViewSet):
     """書類タイプ（請求書/納品書）管理ViewSet"""
     permission_classes = [IsAuthenticated]
@@ -4826,14 +4608,12 @@ class PaymentReportViewSet(viewsets.ViewSet):
         year = int(year)
         month = int(month)
         
-        # 対象請求書を取得（承認済み・支払い準備中・支払い済み）
-        # invoice_date が null の場合は issue_date / created_at でフォールバック
+        # 対象請求書（承認済み・支払い準備中・支払い済み）を計上月で絞り込む
+        # 計上日は保存時に 請求日 → 発行日 → 作成日 の順で決めた日付
         invoices_qs = Invoice.objects.filter(
-            Q(invoice_date__year=year, invoice_date__month=month) |
-            Q(invoice_date__isnull=True, issue_date__year=year, issue_date__month=month) |
-            Q(invoice_date__isnull=True, issue_date__isnull=True, created_at__year=year, created_at__month=month),
-            status__in=['approved', 'payment_preparing', 'paid']
-        ).select_related('customer_company', 'construction_site')
+            Invoice.accounting_period_q(year, month),
+            status__in=Invoice.INVOICED_STATUSES,
+        )
 
         # receiving_company でフィルタリング（経理ユーザーの所属会社のみ）
         if request.user.company:
@@ -4842,72 +4622,74 @@ class PaymentReportViewSet(viewsets.ViewSet):
         if site_id:
             invoices_qs = invoices_qs.filter(construction_site_id=site_id)
         
-        # 現場ごとにグループ化
-        sites_data = {}
-        for inv in invoices_qs:
-            site_name = inv.construction_site.name if inv.construction_site else '現場未指定'
-            site_key = inv.construction_site_id or 0
-            
-            if site_key not in sites_data:
-                sites_data[site_key] = {
-                    'site_id': site_key,
-                    'site_name': site_name,
-                    'companies': {}
-                }
-            
-            company_name = inv.customer_company.name if inv.customer_company else '会社未指定'
-            company_id = inv.customer_company_id or 0
-            
-            if company_id not in sites_data[site_key]['companies']:
-                sites_data[site_key]['companies'][company_id] = {
-                    'company_id': company_id,
-                    'company_name': company_name,
-                    'invoice_amount': 0,
-                    'safety_fee': 0,
-                    'net_amount': 0,
-                    'invoice_count': 0,
-                    'invoice_ids': [],
-                }
-            
-            entry = sites_data[site_key]['companies'][company_id]
-            total = int(inv.total_amount or 0)
-            safety = int(inv.safety_cooperation_fee or 0) if hasattr(inv, 'safety_cooperation_fee') else 0
-            entry['invoice_amount'] += total
-            entry['safety_fee'] += safety
-            entry['net_amount'] += (total - safety)
-            entry['invoice_count'] += 1
-            entry['invoice_ids'].append(inv.id)
+        # 現場 × 協力会社ごとの集計を1回の GROUP BY で取得（請求書の件数によらず行数は組み合わせの数）
+        aggregates = {
+            'invoice_amount': Sum('total_amount'),
+            'safety_fee': Sum('safety_cooperation_fee'),
+            'invoice_count': Count('id'),
+        }
+        use_array_agg = connection.vendor == 'postgresql'
+        if use_array_agg:
+            from django.contrib.postgres.aggregates import ArrayAgg
+            aggregates['invoice_ids'] = ArrayAgg('id', ordering='id')
+        groups = list(
+            invoices_qs.values(
+                'construction_site_id', 'construction_site__name',
+                'customer_company_id', 'customer_company__name',
+            )
+            .annotate(**aggregates)
+            .order_by('construction_site__name', 'construction_site_id', 'customer_company__name', 'customer_company_id')
+        )
+        if not use_array_agg:
+            # ArrayAgg の無いDB（開発用 SQLite）では請求書IDだけ別に取得
+            ids_by_group = {}
+            for group_key_site, group_key_company, invoice_id in invoices_qs.order_by('id').values_list(
+                'construction_site_id', 'customer_company_id', 'id'
+            ):
+                ids_by_group.setdefault((group_key_site, group_key_company), []).append(invoice_id)
+            for group in groups:
+                group['invoice_ids'] = ids_by_group.get(
+                    (group['construction_site_id'], group['customer_company_id']), []
+                )
         
         # レスポンス構築
-        report_data = []
+        sites_data = {}
         grand_total_invoice = 0
         grand_total_safety = 0
         grand_total_net = 0
         
-        for site_key, site_info in sites_data.items():
-            site_total_invoice = 0
-            site_total_safety = 0
-            site_total_net = 0
-            companies_list = []
-            
-            for company_id, comp_data in site_info['companies'].items():
-                site_total_invoice += comp_data['invoice_amount']
-                site_total_safety += comp_data['safety_fee']
-                site_total_net += comp_data['net_amount']
-                companies_list.append(comp_data)
-            
-            grand_total_invoice += site_total_invoice
-            grand_total_safety += site_total_safety
-            grand_total_net += site_total_net
+        for group in groups:
+            site_key = group['construction_site_id'] or 0
+            site_info = sites_data.get(site_key)
+            if site_info is None:
+                site_info = sites_data[site_key] = {
+                    'site_id': site_key,
+                    'site_name': group['construction_site__name'] or '現場未指定',
+                    'companies': [],
+                    'site_total_invoice': 0,
+                    'site_total_safety': 0,
+                    'site_total_net': 0,
+                }
             
-            report_data.append({
-                'site_id': site_info['site_id'],
-                'site_name': site_info['site_name'],
-                'companies': companies_list,
-                'site_total_invoice': site_total_invoice,
-                'site_total_safety': site_total_safety,
-                'site_total_net': site_total_net,
+            total = int(group['invoice_amount'] or 0)
+            safety = int(group['safety_fee'] or 0)
+            site_info['companies'].append({
+                'company_id': group['customer_company_id'] or 0,
+                'company_name': group['customer_company__name'] or '会社未指定',
+                'invoice_amount': total,
+                'safety_fee': safety,
+                'net_amount': total - safety,
+                'invoice_count': group['invoice_count'],
+                'invoice_ids': group['invoice_ids'],
             })
+            site_info['site_total_invoice'] += total
+            site_info['site_total_safety'] += safety
+            site_info['site_total_net'] += total - safety
+            grand_total_invoice += total
+            grand_total_safety += safety
+            grand_total_net += total - safety
+        
+        report_data = list(sites_data.values())
         
         # 支払日計算（翌月末）
         import calendar as cal_module
@@ -4932,36 +4714,21 @@ class PaymentReportViewSet(viewsets.ViewSet):
     def available_months(self, request):
         """支払い表が利用可能な年月の一覧"""
         base_qs = Invoice.objects.filter(
-            status__in=['approved', 'payment_preparing', 'paid']
+            status__in=Invoice.INVOICED_STATUSES
         )
         if request.user.company:
             base_qs = base_qs.filter(receiving_company=request.user.company)
 
-        # invoice_date が設定されている月
-        months_from_invoice = list(
-            base_qs.filter(invoice_date__isnull=False)
-            .values_list('invoice_date__year', 'invoice_date__month')
-            .distinct()
-        )
-        # invoice_date が null の場合は issue_date を使用
-        months_from_issue = list(
-            base_qs.filter(invoice_date__isnull=True, issue_date__isnull=False)
-            .values_list('issue_date__year', 'issue_date__month')
-            .distinct()
-        )
-
-        # 重複排除してソート
+        # 計上年月（支払い表の対象月と同じ基準）
         all_months = sorted(
-            set(months_from_invoice + months_from_issue),
-            key=lambda x: (x[0], x[1]),
+            base_qs.filter(accounting_ym__isnull=False)
+            .order_by()
+            .values_list('accounting_ym', flat=True)
+            .distinct(),
             reverse=True
         )
 
-        result = [
-            {'year': y, 'month': m}
-            for y, m in all_months
-            if y is not None and m is not None
-        ]
+        result = [{'year': ym // 100, 'month': ym % 100} for ym in all_months]
         return Response(result)
 
 
@@ -6,6 +6,12 @@ class InvoicesConfig(AppConfig):
     name = 'invoices'
 
     def ready(self):
+        # シリアライザーの処理時間を Server-Timing に含める（invoices.profiling）
+        from django.conf import settings
+        if getattr(settings, 'QUERY_PROFILING', True):
+            from .profiling import install_serializer_timing
+            install_serializer_timing()
+
         # App Runner 起動時に工種マスタを36種類に同期する
         try:
             from django.db import connection
@@ -0,0 +1,227 @@
+# invoices/audit.py
+"""
+アクセスログ・監査ログ（AccessLog / AuditLog）のまとめ書き
+- リクエスト（またはワーカーの処理単位）ごとにログをバッファに溜め、レスポンスの送信後、
+  または AUDIT_BUFFER_MAX_ENTRIES 件に達した時点で bulk_create でまとめて書き込む
+- 書き込みに失敗したログはローカルのスプールファイル（fsync 済み）に退避し、
+  flush_audit_spool コマンドで後から書き込む（スプールからの書き込みは少なくとも1回。
+  書き込み直後にプロセスが落ちた場合は重複することがある）
+- バッファが無い場所（管理コマンド・シェル・ストリーミング出力中など）では従来どおりその場で書き込む
+- トランザクション内で記録したログはコミット時にバッファへ入れる（ロールバックされたらログも捨てる）
+- 書き込みと同じトランザクションでモデルの after_bulk_insert(rows) を呼ぶ（アクセスログの時間別集計の加算）
+
+settings:
+    AUDIT_LOG_DURABILITY      'buffered'（既定）: バッファに溜めてまとめて書き込む
+                              'spool': 溜める時点でスプールファイルにも書いて fsync し、
+                                       書き込み前にプロセスが落ちてもログを失わない
+                              'sync': バッファを使わず、その場で書き込む（従来の動作）
+    AUDIT_BUFFER_MAX_ENTRIES  この件数に達したらレスポンスの途中でも書き込む
+    AUDIT_SPOOL_DIR           スプールファイルの保存先
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# 処理中のリクエスト・ワーカーのバッファ（スレッド・非同期タスクごと）
+_current = ContextVar('audit_buffer', default=None)
+
+SPOOL_SUFFIX = '.jsonl'
+REPLAYING_SUFFIX = '.replaying'
+
+
+def _durability():
+    return getattr(settings, 'AUDIT_LOG_DURABILITY', 'buffered')
+
+
+def _spool_dir():
+    return Path(getattr(settings, 'AUDIT_SPOOL_DIR', Path(settings.BASE_DIR) / 'audit_spool'))
+
+
+def _new_spool_path():
+    return _spool_dir() / f'{os.getpid()}-{uuid.uuid4().hex}{SPOOL_SUFFIX}'
+
+
+def _serialize(instance):
+    fields = {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields if not field.primary_key
+    }
+    return json.dumps({'model': instance._meta.label, 'fields': fields}, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _deserialize(line):
+    data = json.loads(line)
+    model = apps.get_model(data['model'])
+    return model(**{
+        field.attname: field.to_python(data['fields'][field.attname])
+        for field in model._meta.concrete_fields if field.attname in data['fields']
+    })
+
+
+def _write_spool(path, instances):
+    """スプールファイルに追記して fsync する"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(_serialize(instance) + '\n' for instance in instances))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _insert(instances):
+    """モデルごとに bulk_create（AccessLog と AuditLog を1トランザクションで）"""
+    by_model = {}
+    for instance in instances:
+        by_model.setdefault(type(instance), []).append(instance)
+    with transaction.atomic():
+        for model, rows in by_model.items():
+            model.objects.bulk_create(rows)
+            # 集計テーブルへの加算など、モデル側の後処理（AccessLog.after_bulk_insert）
+            after_bulk_insert = getattr(model, 'after_bulk_insert', None)
+            if after_bulk_insert:
+                after_bulk_insert(rows)
+
+
+class AuditBuffer:
+    """1リクエスト・1処理単位分の未書き込みのログ"""
+
+    def __init__(self, durability=None):
+        self.durability = durability or _durability()
+        self.entries = []
+        self.spool_path = None
+
+    def add(self, instances):
+        self.entries.extend(instances)
+        if self.durability == 'spool':
+            if self.spool_path is None:
+                self.spool_path = _new_spool_path()
+            _write_spool(self.spool_path, instances)
+        if len(self.entries) >= getattr(settings, 'AUDIT_BUFFER_MAX_ENTRIES', 500):
+            self.flush()
+
+    def flush(self):
+        """溜まったログを書き込んで件数を返す（失敗したらスプールファイルに退避して 0）"""
+        entries, self.entries = self.entries, []
+        spool_path, self.spool_path = self.spool_path, None
+        if not entries:
+            return 0
+        try:
+            _insert(entries)
+        except Exception:
+            logger.exception('監査ログの書き込みに失敗しました（%d件）。スプールファイルに退避します', len(entries))
+            if spool_path is None:
+                try:
+                    _write_spool(_new_spool_path(), entries)
+                except OSError:
+                    logger.exception(
+                        '監査ログをスプールファイルに退避できませんでした: %s',
+                        [_serialize(instance) for instance in entries],
+                    )
+            return 0
+        if spool_path is not None:
+            spool_path.unlink(missing_ok=True)
+        return len(entries)
+
+
+def record(*instances):
+    """
+    未保存の AccessLog / AuditLog を書き込む（バッファがあれば溜めるだけ）
+    トランザクション内ではコミットされてからバッファに入れ、ロールバックされた処理のログは書かない
+    （バッファが無い場合はその場で INSERT するため、元からトランザクションと一緒にロールバックされる）
+    """
+    buffer = _current.get()
+    if buffer is None or buffer.durability == 'sync':
+        _insert(instances)
+    else:
+        # トランザクション外ではその場で実行される
+        transaction.on_commit(lambda: buffer.add(instances), robust=True)
+
+
+@contextmanager
+def buffered(durability=None):
+    """ワーカー・管理コマンド用: ブロック内のログを溜めて、抜けるときにまとめて書き込む"""
+    buffer = AuditBuffer(durability)
+    token = _current.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current.reset(token)
+        buffer.flush()
+
+
+class AuditBufferMiddleware:
+    """リクエスト中のログを溜め、レスポンスの送信後（response.close）にまとめて書き込む"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if _durability() == 'sync':
+            return self.get_response(request)
+
+        buffer = AuditBuffer()
+        token = _current.set(buffer)
+        try:
+            response = self.get_response(request)
+        except Exception:
+            buffer.flush()
+            raise
+        finally:
+            _current.reset(token)
+        response._resource_closers.append(buffer.flush)
+        return response
+
+
+def replay_spool(min_age=60):
+    """
+    スプールファイルに残ったログを書き込む。(ファイル数, 件数) を返す
+    min_age 秒より新しいファイルは書き込み中のリクエストのものの可能性があるため対象外
+    """
+    directory = _spool_dir()
+    if not directory.exists():
+        return 0, 0
+
+    cutoff = time.time() - min_age
+    files = rows = 0
+    for path in sorted(directory.glob(f'*{SPOOL_SUFFIX}')):
+        # 他のプロセスと同じファイルを二重に書き込まないよう、名前を変えてから読む
+        claimed = path.with_suffix(REPLAYING_SUFFIX)
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+            path.rename(claimed)
+        except FileNotFoundError:
+            continue
+
+        instances = []
+        with open(claimed, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    instances.append(_deserialize(line))
+                except (ValueError, ValidationError):
+                    # 書き込み途中で落ちた最終行など
+                    logger.warning('読み込めないスプール行を飛ばしました: %s: %r', path.name, line)
+        try:
+            _insert(instances)
+        except Exception:
+            claimed.rename(path)
+            raise
+        claimed.unlink()
+        files += 1
+        rows += len(instances)
+    return files, rows
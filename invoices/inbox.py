@@ -0,0 +1,52 @@
+# invoices/inbox.py
+"""
+承認待ち受信箱（ApprovalInbox）の行の組み立て
+請求書の承認状態から「誰の承認待ちか」を1か所で決める。
+マイグレーションからも使うため、モデルには依存しない。
+"""
+
+# ワークフロー（InvoiceApprovalStep.approver_role）のロール → 承認できる役職
+WORKFLOW_ROLE_POSITIONS = {
+    'supervisor': 'site_supervisor',
+    'manager': 'manager',
+    'accounting': 'accountant',
+    'executive': 'director',
+    'president': 'president',
+}
+
+
+def build_inbox_entries(invoice_rows, workflow_rows):
+    """
+    受信箱の行を組み立てる
+
+    invoice_rows: (invoice_id, status, current_approver_id, 現在ステップの承認者役職) の列
+    workflow_rows: (invoice_id, approver_role) の列（進行中のワークフローステップ）
+    戻り値: (invoice_id, user_id, approver_position, reason) のリスト
+      - 現在の承認者本人宛て: user_id を設定
+      - 経理ステップ・ワークフロー役職宛て: approver_position を設定（該当役職の全員が対象）
+    """
+    pending = set()
+    entries = []
+    for invoice_id, status, approver_id, step_position in invoice_rows:
+        if status != 'pending_approval':
+            continue
+        pending.add(invoice_id)
+        if approver_id:
+            entries.append((invoice_id, approver_id, '', 'approver'))
+        if step_position == 'accountant':
+            entries.append((invoice_id, None, 'accountant', 'accountant_step'))
+
+    for invoice_id, role in workflow_rows:
+        position = WORKFLOW_ROLE_POSITIONS.get(role)
+        if invoice_id in pending and position:
+            entries.append((invoice_id, None, position, 'workflow_role'))
+
+    # 同じ宛先の重複を除く（最初の理由を優先）
+    seen = set()
+    unique_entries = []
+    for entry in entries:
+        key = entry[:3]
+        if key not in seen:
+            seen.add(key)
+            unique_entries.append(entry)
+    return unique_entries
@@ -0,0 +1,90 @@
+# invoices/management/commands/archive_audit_logs.py
+"""
+アクセスログ・操作ログのパーティション作成とアーカイブ（cron で毎月実行）
+1. PostgreSQL では今月から --months-ahead か月先までの月別パーティションを作成する
+2. ホットテーブルに残す期間（今月を含めて --keep-months か月）より前の月のログを、
+   月ごとに gzip 圧縮の JSON Lines（AUDIT_ARCHIVE_DIR）に書き出して台帳（AuditArchive）に
+   件数と SHA-256 を記録し、ホットテーブルから消す（パーティションは DROP）
+アーカイブファイルは電子取引データの保存規程の保存期間（AUDIT_ARCHIVE_RETENTION_YEARS）が過ぎるまで削除しないこと。
+
+Usage:
+    python manage.py archive_audit_logs                   # AUDIT_LOG_HOT_MONTHS か月より前をアーカイブ
+    python manage.py archive_audit_logs --keep-months 6
+    python manage.py archive_audit_logs --dry-run         # アーカイブ対象の月を表示するだけ
+    python manage.py archive_audit_logs --verify          # 台帳の全ファイルの SHA-256 を照合
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.models import AuditArchive
+from invoices.services import AuditArchiveService
+
+
+class Command(BaseCommand):
+    help = 'アクセスログ・操作ログの古い月をアーカイブし、先の月のパーティションを作成'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months',
+            type=int,
+            default=None,
+            help='ホットテーブルに残す月数（今月を含む。デフォルト: AUDIT_LOG_HOT_MONTHS）',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help='PostgreSQL で作成しておく先の月のパーティション数（デフォルト: 3）',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='アーカイブ対象の月を表示するだけで、書き出し・削除しない',
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='アーカイブせず、台帳の全ファイルの SHA-256 を照合する',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self._verify()
+
+        keep_months = options['keep_months'] or getattr(settings, 'AUDIT_LOG_HOT_MONTHS', 13)
+        if keep_months < 1:
+            raise CommandError('--keep-months は1以上を指定してください')
+
+        if not options['dry_run']:
+            partitions = AuditArchiveService.ensure_partitions(months_ahead=options['months_ahead'])
+            for name in partitions['created']:
+                self.stdout.write(f'パーティションを作成しました: {name}')
+            for name in partitions['skipped']:
+                self.stdout.write(self.style.WARNING(
+                    f'既定パーティションに同じ月のログがあるため作成しませんでした: {name}'
+                ))
+
+        for table in AuditArchiveService.TABLES:
+            for year_month in AuditArchiveService.months_to_archive(table, keep_months):
+                if options['dry_run']:
+                    self.stdout.write(f'[DRY RUN] {table} {year_month}')
+                    continue
+                archive = AuditArchiveService.archive_month(table, year_month)
+                if archive is None:
+                    continue
+                self.stdout.write(self.style.SUCCESS(
+                    f'{table} {year_month}: {archive.row_count}件 → {archive.file_path} '
+                    f'({archive.file_size} bytes, 保存期限 {archive.retain_until})'
+                ))
+
+    def _verify(self):
+        invalid = 0
+        for archive in AuditArchive.objects.order_by('table_name', 'year_month', 'part'):
+            if AuditArchiveService.verify(archive):
+                continue
+            invalid += 1
+            self.stdout.write(self.style.ERROR(f'不一致またはファイルなし: {archive} {archive.file_path}'))
+        if invalid:
+            raise CommandError(f'{invalid}件のアーカイブが台帳と一致しません')
+        self.stdout.write(self.style.SUCCESS('全てのアーカイブが台帳と一致しました'))
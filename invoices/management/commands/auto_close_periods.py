@@ -1,7 +1,8 @@
 # invoices/management/commands/auto_close_periods.py
 """
 月次請求期間の自動締め処理
-cronジョブとして毎日実行し、25日になったら自動的に当月分を締める。
+cronジョブとして毎日実行し、25日になったら自動的に当月分を締める
+（提出済み請求書を一斉に承認待ちへ移す。--dry-run では移す請求書の変更前後を表示）。
 翌月分の期間が存在しなければ自動作成する。
 
 Usage:
@@ -14,6 +15,7 @@ import calendar
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from invoices.models import Company, MonthlyInvoicePeriod, User
+from invoices.services import PeriodCloseService
 
 
 class Command(BaseCommand):
@@ -85,18 +87,25 @@ class Command(BaseCommand):
                 )
                 
                 if not dry_run:
-                    current_period.is_closed = True
-                    current_period.closed_at = timezone.now()
-                    current_period.closed_by = system_user
                     current_period.notes = f'自動締め処理（{today.strftime("%Y/%m/%d")}実行）'
-                    current_period.save()
+                    processed_count = current_period.close_period(system_user, progress=self._progress)
                     self.stdout.write(self.style.SUCCESS(
-                        f"  ✅ {current_period.period_name} を締めました"
+                        f"  ✅ {current_period.period_name} を締めました（承認待ちへ {processed_count}件）"
                     ))
                 else:
+                    plan = PeriodCloseService(current_period, system_user).plan()
                     self.stdout.write(self.style.WARNING(
                         f"  [DRY] {current_period.period_name} を締め予定"
+                        f"（承認待ちへ {len(plan['changes'])}件、承認者未設定で対象外 {len(plan['skipped'])}件）"
                     ))
+                    for change in plan['changes']:
+                        old_approver, new_approver = change['current_approver_id']
+                        self.stdout.write(
+                            f"    {change['invoice_number']}: 提出済み → 承認待ち"
+                            f"（承認者 {old_approver or '-'} → {new_approver}）"
+                        )
+                    for skipped in plan['skipped']:
+                        self.stdout.write(f"    {skipped['invoice_number']}: 対象外（現場監督が未設定）")
             elif current_period and current_period.is_closed:
                 self.stdout.write(f"  {current_period.period_name}: 締め済み")
             elif today.day < deadline_day:
@@ -108,6 +117,9 @@ class Command(BaseCommand):
         self.stdout.write(f"\n{'='*60}")
         self.stdout.write(self.style.SUCCESS('自動締め処理完了'))
 
+    def _progress(self, done, total):
+        self.stdout.write(f"    {done}/{total}件")
+
     def _ensure_period_exists(self, company, year, month, deadline_day, dry_run):
         """期間が存在しなければ自動作成する"""
         period = MonthlyInvoicePeriod.objects.filter(
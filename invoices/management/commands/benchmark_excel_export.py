@@ -0,0 +1,105 @@
+# invoices/management/commands/benchmark_excel_export.py
+"""
+Excel出力のメモリ使用量比較
+通常ブック（全セルをメモリに保持してから書式設定）と
+write_only ブック（ExcelExportService.write_invoices）で、同じ行数の
+ダミー行を書き出したときのピークRSS（resource.getrusage の ru_maxrss）と所要時間を表示する。
+ru_maxrss はプロセスの最大値で下がらないため、方式ごとに子プロセスを fork して計測し、
+書き出し前からの増分を併せて表示する（openpyxl・lxml が確保する C 側のメモリも含む）。
+DBには触れない。
+
+Usage:
+    python manage.py benchmark_excel_export --rows 50000
+"""
+
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from invoices.services import ExcelExportService
+
+
+def _dummy_rows(count):
+    now = datetime.now()
+    for i in range(count):
+        yield [
+            f'INV-2026-{i:06d}', '協力会社A', 'テスト現場', '内装', now.strftime('%Y/%m/%d'),
+            181819, 18181, 200000, 600, 199400,
+            '承認済み', now.strftime('%Y/%m/%d %H:%M'), '太郎 経理',
+        ]
+
+
+def _write_in_memory_workbook(rows, fileobj):
+    """従来方式: 通常ブックに全行を追加してからセルごとに書式設定"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = '請求書一覧'
+    ws.append(ExcelExportService.INVOICE_HEADER)
+    thin = Side(style='thin', color='D0D0D0')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    for cell in ws[1]:
+        cell.fill = PatternFill('solid', fgColor='2F5496')
+        cell.font = Font(color='FFFFFF', bold=True)
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+        cell.border = border
+    for row in rows:
+        ws.append(row)
+    for row in ws.iter_rows(min_row=2, min_col=6, max_col=10):
+        for cell in row:
+            cell.number_format = '#,##0'
+            cell.border = border
+    wb.save(fileobj)
+
+
+WRITERS = {
+    '通常ブック': _write_in_memory_workbook,
+    'write_only': ExcelExportService.write_invoices,
+}
+
+
+def _max_rss_bytes():
+    # Linux は KB、macOS は bytes 単位
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _measure(label, rows):
+    """子プロセスで1方式を書き出し、(ピークRSS, 増分, 所要時間, ファイルサイズ) を返す"""
+    baseline = _max_rss_bytes()
+    with tempfile.TemporaryFile() as tmp:
+        started = time.perf_counter()
+        WRITERS[label](_dummy_rows(rows), tmp)
+        elapsed = time.perf_counter() - started
+        size = tmp.tell()
+    peak = _max_rss_bytes()
+    return peak, peak - baseline, elapsed, size
+
+
+class Command(BaseCommand):
+    help = 'Excel出力のピークRSSを通常ブックと write_only ブックで比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='書き出す行数（デフォルト: 20000）')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.stdout.write(f'行数: {rows}')
+
+        for label in WRITERS:
+            # 方式ごとに新しいプロセスで計測する（前の方式のピークを引き継がない）
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as executor:
+                peak, growth, elapsed, size = executor.submit(_measure, label, rows).result()
+
+            self.stdout.write(
+                f'  {label:<10} ピークRSS {peak / 1024 / 1024:8.1f} MB（増分 {growth / 1024 / 1024:8.1f} MB）  '
+                f'所要時間 {elapsed:6.2f} 秒  ファイル {size / 1024:8.0f} KB'
+            )
@@ -0,0 +1,96 @@
+# invoices/management/commands/benchmark_invoice_list_pdf.py
+"""
+請求書一覧PDFの所要時間・メモリ比較
+全行を1つの表にして出力する方式（従来）と、ページごとに表を分けて
+1ページずつ生成する方式（render_invoice_list_pdf）で、ダミー行を出力したときの
+所要時間とピークメモリを表示する。DBには触れない。
+
+Usage:
+    python manage.py benchmark_invoice_list_pdf --rows 1000 10000 50000
+    python manage.py benchmark_invoice_list_pdf --rows 50000 --legacy-max-rows 0   # 従来方式を省略
+"""
+
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from invoices.pdf_generator import (
+    render_invoice_list_pdf, register_japanese_fonts, _st, _ts,
+    LIST_HEADER, LIST_COL_WIDTHS, SimpleDocTemplate, Table, Paragraph, Spacer, A4, mm, colors,
+)
+
+
+def _dummy_rows(count):
+    for i in range(count):
+        yield (f'INV-2026-{i:06d}', '協力会社A', 'テスト現場', date(2026, 3, 1), 200000, '承認済み')
+
+
+def _render_single_table(rows, count, fileobj):
+    """従来方式: 全行を1つの表にまとめて出力（表の分割は ReportLab に任せる）"""
+    F = register_japanese_fonts()
+    doc = SimpleDocTemplate(
+        fileobj, pagesize=A4,
+        topMargin=15 * mm, bottomMargin=15 * mm,
+        leftMargin=12 * mm, rightMargin=12 * mm,
+    )
+    data = [LIST_HEADER]
+    total_sum = 0
+    for invoice_number, company_name, site_name, invoice_date, total_amount, status_display in rows:
+        total_sum += total_amount
+        data.append([
+            invoice_number, company_name, site_name,
+            invoice_date.strftime('%Y/%m/%d'), f'¥{total_amount:,}', status_display,
+        ])
+    data.append(['', '', '', '合計', f'¥{total_sum:,}', ''])
+    table = Table(data, colWidths=LIST_COL_WIDTHS, repeatRows=1)
+    table.setStyle(_ts(
+        ('FONTNAME', (0, 0), (-1, -1), F),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID',     (0, 0), (-1, -1), 0.4, colors.HexColor('#D0D0D0')),
+    ))
+    doc.build([
+        Paragraph('請求書一覧', _st(F, 14, leading=18)),
+        Paragraph(f'件数: {count}件', _st(F, 9, leading=12)),
+        Spacer(1, 4 * mm),
+        table,
+    ])
+
+
+class Command(BaseCommand):
+    help = '請求書一覧PDFの所要時間とピークメモリを従来方式とページ分割方式で比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[1000, 10000, 50000],
+            help='出力する行数（複数指定可。デフォルト: 1000 10000 50000）',
+        )
+        parser.add_argument(
+            '--legacy-max-rows', type=int, default=10000,
+            help='従来方式を測定する最大行数（これを超える行数では省略。デフォルト: 10000）',
+        )
+
+    def handle(self, *args, **options):
+        register_japanese_fonts()
+        for rows in options['rows']:
+            self.stdout.write(f'行数: {rows}')
+            writers = [('ページ分割', render_invoice_list_pdf)]
+            if rows <= options['legacy_max_rows']:
+                writers.insert(0, ('1つの表', _render_single_table))
+
+            for label, writer in writers:
+                with tempfile.TemporaryFile() as tmp:
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    writer(_dummy_rows(rows), rows, tmp)
+                    elapsed = time.perf_counter() - started
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    size = tmp.tell()
+
+                self.stdout.write(
+                    f'  {label:<6} 所要時間 {elapsed:7.2f} 秒  ピークメモリ {peak / 1024 / 1024:8.1f} MB  '
+                    f'ファイル {size / 1024:8.0f} KB'
+                )
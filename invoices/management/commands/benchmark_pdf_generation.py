@@ -0,0 +1,74 @@
+# invoices/management/commands/benchmark_pdf_generation.py
+"""
+請求書PDF生成のCPU時間比較
+フォント・スタイルのキャッシュを毎回破棄する場合（従来の動作）と、
+プロセス内で使い回す場合で、1件あたりのCPU時間と
+フォント読込・レイアウト・PDF出力の内訳を表示する。
+DBには触れない（ダミーの請求書で描画する）。
+
+Usage:
+    python manage.py benchmark_pdf_generation --count 50
+"""
+
+import time
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from invoices.pdf_generator import generate_invoice_pdf, clear_pdf_resource_cache
+
+
+def _dummy_invoice():
+    items = [
+        SimpleNamespace(
+            description=f'内装工事 第{i}工区 材料・施工一式', quantity=Decimal('1'),
+            unit='式', unit_price=Decimal('100000'), amount=Decimal('100000'),
+        )
+        for i in range(1, 11)
+    ]
+    receiving = SimpleNamespace(name='平野工務店', postal_code='000-0000', address='東京都', phone='03-0000-0000')
+    customer = SimpleNamespace(
+        name='協力会社A', postal_code='000-0000', address='神奈川県', phone='045-000-0000',
+        email='partner@example.com', bank_name='テスト銀行', bank_branch='本店',
+        bank_account='1234567', invoice_registration_number='T1234567890123', name_kana='キョウリョクガイシャ',
+    )
+    return SimpleNamespace(
+        receiving_company=receiving, customer_company=customer,
+        invoice_number='INV-2026-0001', invoice_date=date(2026, 3, 1), payment_due_date=date(2026, 4, 30),
+        subtotal=Decimal('1000000'), tax_amount=Decimal('100000'), total_amount=Decimal('1100000'),
+        notes='', items=SimpleNamespace(all=lambda: items),
+    )
+
+
+class Command(BaseCommand):
+    help = '請求書PDF生成のCPU時間をフォント・スタイルのキャッシュ有無で比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=30, help='生成件数（デフォルト: 30）')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        invoice = _dummy_invoice()
+        self.stdout.write(f'生成件数: {count}')
+
+        for label, clear_each_time in (('キャッシュなし', True), ('キャッシュあり', False)):
+            clear_pdf_resource_cache()
+            totals = {'font': 0.0, 'layout': 0.0, 'build': 0.0}
+            cpu_started = time.process_time()
+            for _ in range(count):
+                if clear_each_time:
+                    clear_pdf_resource_cache()
+                timings = {}
+                generate_invoice_pdf(invoice, timings=timings)
+                for key, value in timings.items():
+                    totals[key] += value
+            cpu_per_pdf = (time.process_time() - cpu_started) / count
+
+            self.stdout.write(
+                f'  {label}: CPU {cpu_per_pdf * 1000:7.1f} ms/件  '
+                f'(フォント {totals["font"] / count * 1000:6.1f} ms / '
+                f'レイアウト {totals["layout"] / count * 1000:6.1f} ms / '
+                f'PDF出力 {totals["build"] / count * 1000:6.1f} ms)'
+            )
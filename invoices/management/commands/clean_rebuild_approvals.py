@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.db.models import Q
-from invoices.models import Invoice, ConstructionSite, ApprovalStep, ApprovalHistory, InvoiceComment, ApprovalRoute
+from invoices.models import Invoice, ConstructionSite, ApprovalStep, ApprovalHistory, InvoiceComment, ApprovalRoute, ApprovalInbox
 
 User = get_user_model()
 
@@ -83,8 +84,17 @@ class Command(BaseCommand):
         # 工事現場
         ConstructionSite.objects.filter(supervisor=old_user).update(supervisor=new_user)
         
-        # 請求書（現在の承認者）
-        Invoice.objects.filter(current_approver=old_user).update(current_approver=new_user)
+        # 請求書（現在の承認者）— queryset.update は Invoice.save を通らないため、
+        # 付け替えと同じトランザクションで承認待ち受信箱も作り直す
+        with transaction.atomic():
+            approver_invoice_ids = list(
+                Invoice.objects.filter(current_approver=old_user).values_list('id', flat=True)
+            )
+            Invoice.objects.filter(id__in=approver_invoice_ids).update(current_approver=new_user)
+            ApprovalInbox.sync_invoices(approver_invoice_ids)
+
+        # 請求書（提出時に割り当てた現場監督）— 削除で空にならないよう付け替える
+        Invoice.objects.filter(approval_supervisor=old_user).update(approval_supervisor=new_user)
         
         # 請求書（作成者）
         Invoice.objects.filter(created_by=old_user).update(created_by=new_user)
@@ -29,7 +29,7 @@ class Command(BaseCommand):
             PurchaseOrder, PurchaseOrderItem,
             AuditLog, AccessLog, SystemNotification,
             BatchApprovalSchedule, ConstructionTypeUsage,
-            UserRegistrationRequest, MonthlyInvoicePeriod,
+            UserRegistrationRequest, MonthlyInvoicePeriod, ConstructionSite,
         )
 
         dry_run = options['dry_run']
@@ -92,6 +92,9 @@ class Command(BaseCommand):
                 )
                 self.stdout.write(self.style.SUCCESS(f'  ✅ MonthlyInvoicePeriod リセット: {reset} 件'))
 
+                # 請求書の一括削除は Invoice.delete を通らないため現場の累計請求額を再集計
+                ConstructionSite.recalculate_invoiced_totals()
+
             self.stdout.write('\n' + '=' * 60)
             self.stdout.write(self.style.SUCCESS('\n✅ 完了: 請求書データを全削除しました'))
             self.stdout.write('   ユーザー・会社・現場・マスターデータは保持されています')
@@ -0,0 +1,29 @@
+# invoices/management/commands/flush_audit_spool.py
+"""
+スプールファイルに退避したアクセスログ・監査ログの書き込み
+DB障害などでまとめ書き（invoices.audit）に失敗したログや、
+AUDIT_LOG_DURABILITY='spool' で書き込み前にプロセスが落ちたログを AccessLog / AuditLog に書き込む。
+
+Usage:
+    python manage.py flush_audit_spool                # cron で定期的に実行
+    python manage.py flush_audit_spool --min-age 0    # 作成直後のファイルも対象にする
+"""
+
+from django.core.management.base import BaseCommand
+from invoices.audit import replay_spool
+
+
+class Command(BaseCommand):
+    help = 'スプールファイルに退避したアクセスログ・監査ログを書き込む'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help='この秒数より新しいスプールファイルは処理中のリクエストのものとして対象外にする（デフォルト: 60）',
+        )
+
+    def handle(self, *args, **options):
+        files, rows = replay_spool(min_age=options['min_age'])
+        self.stdout.write(self.style.SUCCESS(f'スプールファイル {files}件から {rows}件のログを書き込みました'))
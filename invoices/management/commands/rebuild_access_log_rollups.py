@@ -0,0 +1,21 @@
+# invoices/management/commands/rebuild_access_log_rollups.py
+"""
+アクセスログの時間別集計（時間帯 × アクション × ユーザー）の再作成
+通常はアクセスログの書き込み時に同じトランザクションで加算されるため不要。
+SQL で直接アクセスログを書き換えた場合や、集計値がずれた疑いがある場合に実行する。
+ホットテーブルに残っている期間だけを作り直し、アーカイブ済みの期間の集計はそのまま残す。
+
+Usage:
+    python manage.py rebuild_access_log_rollups
+"""
+
+from django.core.management.base import BaseCommand
+from invoices.models import AccessLogHourlyRollup
+
+
+class Command(BaseCommand):
+    help = 'アクセスログの時間別集計をアクセスログから作り直す'
+
+    def handle(self, *args, **options):
+        rows = AccessLogHourlyRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'時間別集計を再作成しました: {rows}行'))
@@ -0,0 +1,41 @@
+# invoices/management/commands/rebuild_approval_inbox.py
+"""
+承認待ち受信箱（ApprovalInbox）の再構築
+承認待ちの請求書の承認状態から受信箱を作り直す
+（queryset.update などで承認状態を直接書き換えた後に実行）。
+
+Usage:
+    python manage.py rebuild_approval_inbox
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from invoices.models import Invoice, ApprovalInbox
+
+
+class Command(BaseCommand):
+    help = '承認待ち受信箱を再構築'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='一度に処理する請求書の件数（デフォルト: 500）',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        invoice_ids = list(
+            Invoice.objects.filter(status='pending_approval').values_list('id', flat=True)
+        )
+
+        with transaction.atomic():
+            # 承認待ちでなくなった請求書の行も含めて全削除してから作り直す
+            ApprovalInbox.objects.all().delete()
+            for i in range(0, len(invoice_ids), batch_size):
+                ApprovalInbox.sync_invoices(invoice_ids[i:i + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'承認待ち受信箱を再構築しました: 請求書{len(invoice_ids)}件 / {ApprovalInbox.objects.count()}行'
+        ))
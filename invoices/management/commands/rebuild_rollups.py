@@ -0,0 +1,21 @@
+# invoices/management/commands/rebuild_rollups.py
+"""
+月次集計（会社・協力会社・現場 × 計上年月 × ステータス区分）の再作成
+通常は請求書の保存・削除時に差分で更新されるため不要。
+SQL で直接請求書を書き換えた場合や、集計値がずれた疑いがある場合に実行する。
+再作成中の請求書の更新は反映されないことがあるため、更新の少ない時間帯に実行すること。
+
+Usage:
+    python manage.py rebuild_rollups
+"""
+
+from django.core.management.base import BaseCommand
+from invoices.models import InvoiceMonthlyRollup
+
+
+class Command(BaseCommand):
+    help = '請求書の月次集計を請求書から作り直す'
+
+    def handle(self, *args, **options):
+        rows = InvoiceMonthlyRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'月次集計を再作成しました: {rows}行'))
@@ -0,0 +1,31 @@
+# invoices/management/commands/rebuild_search_index.py
+"""
+請求書横断検索用ドキュメントの再構築
+全請求書の InvoiceSearchDocument を作り直す（検索結果がずれた場合・一括取込後に実行）。
+
+Usage:
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --batch-size 1000
+"""
+
+from django.core.management.base import BaseCommand
+from invoices.models import Invoice, InvoiceSearchDocument
+
+
+class Command(BaseCommand):
+    help = '請求書横断検索用ドキュメントを再構築'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='一括更新の件数（デフォルト: 500）',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # 削除済み請求書のドキュメントはCASCADEで消えるため、全件同期のみで整合する
+        count = InvoiceSearchDocument.sync_queryset(Invoice.objects.all(), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'検索用ドキュメントを再構築しました: {count}件'))
@@ -0,0 +1,25 @@
+# invoices/management/commands/rebuild_site_invoiced_totals.py
+"""
+工事現場の累計請求額（ConstructionSite.invoiced_total）の再集計
+請求書のステータス・金額から現場ごとの累計請求額を作り直す
+（queryset.update / queryset.delete などで請求書を直接書き換えた後に実行）。
+
+Usage:
+    python manage.py rebuild_site_invoiced_totals
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from invoices.models import ConstructionSite
+
+
+class Command(BaseCommand):
+    help = '工事現場の累計請求額を再集計'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = ConstructionSite.recalculate_invoiced_totals()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'累計請求額を再集計しました: 更新{changed}件'
+        ))
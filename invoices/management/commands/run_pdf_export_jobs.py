@@ -0,0 +1,64 @@
+# invoices/management/commands/run_pdf_export_jobs.py
+"""
+請求書PDF一括出力（ZIP）ジョブのワーカー
+API（POST /api/pdf-export-jobs/）で登録されたジョブを取り出し、
+プロセスプールで請求書PDFを描画して ZIP にまとめる（保存先: PDF_EXPORT_DIR）。
+月末の電子帳簿保存用の一括出力もこのワーカーで処理し、Webワーカーを塞がない。
+処理の前に、ワーカーが落ちて処理中のまま残ったジョブを失敗にし、保存期間を過ぎた ZIP を削除する
+（PDF_EXPORT_JOB_TIMEOUT_MINUTES / PDF_EXPORT_RETENTION_HOURS）。
+
+Usage:
+    python manage.py run_pdf_export_jobs                 # 待機中のジョブを全て処理して終了（cron 用）
+    python manage.py run_pdf_export_jobs --loop          # 常駐して定期的に処理
+    python manage.py run_pdf_export_jobs --processes 4   # 描画プロセス数を指定
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from invoices.services import PDFExportService
+
+
+class Command(BaseCommand):
+    help = '請求書PDF一括出力ジョブを処理'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=2,
+            help='PDFを描画するプロセス数（0 の場合はこのプロセスで描画。デフォルト: 2）',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='終了せずに常駐し、待機中のジョブを定期的に処理する',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help='--loop 時、待機中のジョブが無い場合の待機秒数（デフォルト: 10）',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            cleaned = PDFExportService.cleanup()
+            if cleaned['stale'] or cleaned['expired']:
+                self.stdout.write(
+                    f"中断されたジョブ: {cleaned['stale']}件を失敗に、保存期間切れの ZIP: {cleaned['expired']}件を削除"
+                )
+            while True:
+                job = PDFExportService.run_next(processes=options['processes'])
+                if job is None:
+                    break
+                if job.status == 'done':
+                    self.stdout.write(self.style.SUCCESS(
+                        f'ジョブ #{job.pk}: {job.total}件 → {job.file_path} ({job.file_size} bytes)'
+                    ))
+                else:
+                    self.stdout.write(self.style.ERROR(f'ジョブ #{job.pk}: 失敗 {job.error}'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
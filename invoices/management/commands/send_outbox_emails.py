@@ -0,0 +1,63 @@
+# invoices/management/commands/send_outbox_emails.py
+"""
+メール送信キュー（EmailOutbox）の送信ワーカー
+送信待ちのメールをバッチ単位で取り出し、1バッチにつき1本の SMTP 接続でまとめて送信する。
+失敗したメールは間隔を延ばしながら再試行し、上限回数に達したら failed にする。
+
+Usage:
+    python manage.py send_outbox_emails            # 送信待ちを全て送信して終了（cron 用）
+    python manage.py send_outbox_emails --loop     # 常駐して定期的に送信
+
+SMTP に接続できない環境では、ファイル出力のバックエンドで動作確認できる:
+    EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend python manage.py send_outbox_emails
+    （出力先は EMAIL_FILE_PATH、デフォルト: logs/emails）
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from invoices.services import EmailService
+
+
+class Command(BaseCommand):
+    help = 'メール送信キューの送信待ちメールを送信'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='1バッチ（1接続）で送信する件数（デフォルト: 100）',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='終了せずに常駐し、送信待ちを定期的に送信する',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help='--loop 時、送信待ちが無い場合の待機秒数（デフォルト: 10）',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                result = EmailService.deliver_outbox(batch_size=batch_size)
+                total_sent += result['sent']
+                total_failed += result['failed']
+                if result['sent'] + result['failed'] < batch_size:
+                    break
+
+            if total_sent or total_failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'送信済み: {total_sent}件 / 失敗（再試行待ち含む）: {total_failed}件'
+                ))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
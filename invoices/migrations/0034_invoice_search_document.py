@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    """PostgreSQL のみ: pg_trgm 拡張と GIN インデックスを作成"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS invoice_search_doc_trgm_idx '
+        'ON invoice_search_documents USING gin (document gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS invoice_search_doc_trgm_idx')
+
+
+def backfill_search_documents(apps, schema_editor):
+    """既存の請求書の検索用ドキュメントを作成"""
+    from invoices.search import build_document
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceSearchDocument = apps.get_model('invoices', 'InvoiceSearchDocument')
+
+    rows = Invoice.objects.values_list(
+        'id', 'invoice_number', 'unique_number', 'project_name',
+        'construction_site_name', 'construction_site__name',
+        'customer_company__name', 'customer_company__name_kana', 'notes',
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=500):
+        batch.append(InvoiceSearchDocument(
+            invoice_id=row[0],
+            document=build_document(*(value or '' for value in row[1:])),
+        ))
+        if len(batch) >= 500:
+            InvoiceSearchDocument.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        InvoiceSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0033_invoice_created_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSearchDocument',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='invoices.invoice', verbose_name='請求書')),
+                ('document', models.TextField(blank=True, verbose_name='検索用テキスト')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '請求書検索ドキュメント',
+                'verbose_name_plural': '請求書検索ドキュメント一覧',
+                'db_table': 'invoice_search_documents',
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
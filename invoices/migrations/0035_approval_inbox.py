@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_approval_inbox(apps, schema_editor):
+    """既存の承認待ち請求書から受信箱を作成"""
+    from invoices.inbox import build_inbox_entries
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceApprovalStep = apps.get_model('invoices', 'InvoiceApprovalStep')
+    ApprovalInbox = apps.get_model('invoices', 'ApprovalInbox')
+
+    invoice_rows = Invoice.objects.filter(status='pending_approval').values_list(
+        'id', 'status', 'current_approver_id', 'current_approval_step__approver_position'
+    )
+    workflow_rows = InvoiceApprovalStep.objects.filter(step_status='in_progress').values_list(
+        'workflow__invoice_id', 'approver_role'
+    )
+    ApprovalInbox.objects.bulk_create([
+        ApprovalInbox(invoice_id=invoice_id, user_id=user_id, approver_position=position, reason=reason)
+        for invoice_id, user_id, position, reason in build_inbox_entries(invoice_rows, workflow_rows)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0034_invoice_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approver_position', models.CharField(blank=True, max_length=30, verbose_name='承認者役職')),
+                ('reason', models.CharField(choices=[('approver', '現在の承認者'), ('accountant_step', '経理確認ステップ'), ('workflow_role', 'ワークフロー役職')], max_length=20, verbose_name='理由')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='invoices.invoice', verbose_name='請求書')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='approval_inbox', to=settings.AUTH_USER_MODEL, verbose_name='承認者')),
+            ],
+            options={
+                'verbose_name': '承認待ち受信箱',
+                'verbose_name_plural': '承認待ち受信箱一覧',
+                'db_table': 'approval_inbox',
+                'indexes': [models.Index(fields=['user', 'invoice'], name='approval_in_user_id_315311_idx'), models.Index(fields=['approver_position', 'invoice'], name='approval_in_approve_099099_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_approval_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:58
+
+from django.db import migrations, models
+
+
+def backfill_invoiced_total(apps, schema_editor):
+    """既存の請求書から現場ごとの累計請求額を集計"""
+    from django.db.models import Sum
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    ConstructionSite = apps.get_model('invoices', 'ConstructionSite')
+
+    totals = (
+        Invoice.objects.filter(
+            status__in=['approved', 'payment_preparing', 'paid'],
+            construction_site__isnull=False,
+        )
+        .order_by().values('construction_site_id')
+        .annotate(total=Sum('total_amount'))
+        .values_list('construction_site_id', 'total')
+    )
+    for site_id, total in totals:
+        ConstructionSite.objects.filter(pk=site_id).update(invoiced_total=total or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0035_approval_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='constructionsite',
+            name='invoiced_total',
+            field=models.DecimalField(decimal_places=0, default=0, help_text='承認済み・支払準備中・支払済みの請求書の合計（自動集計）', max_digits=15, verbose_name='累計請求額'),
+        ),
+        migrations.RunPython(backfill_invoiced_total, migrations.RunPython.noop),
+    ]
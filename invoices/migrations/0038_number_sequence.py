@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0037_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='採番キー')),
+                ('last_value', models.BigIntegerField(default=0, verbose_name='最終番号')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '採番カウンター',
+                'verbose_name_plural': '採番カウンター一覧',
+                'db_table': 'number_sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_approval_supervisor(apps, schema_editor):
+    """請求書ごとの承認ルートに保持していた現場監督を請求書側へ移す"""
+    from django.db.models import OuterRef, Subquery
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    ApprovalStep = apps.get_model('invoices', 'ApprovalStep')
+
+    supervisor_step = ApprovalStep.objects.filter(
+        route_id=OuterRef('approval_route_id'),
+        approver_position='site_supervisor',
+        approver_user__isnull=False,
+    ).values('approver_user_id')[:1]
+    Invoice.objects.filter(
+        approval_supervisor__isnull=True, approval_route__isnull=False
+    ).update(approval_supervisor_id=Subquery(supervisor_step))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0038_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approvalroute',
+            name='is_template',
+            field=models.BooleanField(default=False, verbose_name='共有テンプレート'),
+        ),
+        migrations.AddField(
+            model_name='approvalroute',
+            name='template_key',
+            field=models.CharField(blank=True, db_index=True, help_text='ステップ定義のハッシュ（定義が変わると新しい版を作成）', max_length=40, verbose_name='テンプレート定義キー'),
+        ),
+        migrations.AddField(
+            model_name='approvalroute',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='版'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='approval_supervisor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_supervisor_invoices', to=settings.AUTH_USER_MODEL, verbose_name='担当現場監督'),
+        ),
+        migrations.RunPython(backfill_approval_supervisor, migrations.RunPython.noop),
+    ]
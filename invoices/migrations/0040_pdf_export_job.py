@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0039_approval_route_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PDFExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invoice_ids', models.JSONField(default=list, verbose_name='対象請求書ID')),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('running', '処理中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=10, verbose_name='状態')),
+                ('total', models.IntegerField(default=0, verbose_name='対象件数')),
+                ('processed', models.IntegerField(default=0, verbose_name='処理済み件数')),
+                ('file_path', models.CharField(blank=True, max_length=500, verbose_name='ZIPファイル')),
+                ('file_size', models.BigIntegerField(blank=True, null=True, verbose_name='ファイルサイズ(bytes)')),
+                ('error', models.TextField(blank=True, verbose_name='エラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pdf_export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='依頼者')),
+            ],
+            options={
+                'verbose_name': 'PDF一括出力ジョブ',
+                'verbose_name_plural': 'PDF一括出力ジョブ一覧',
+                'db_table': 'pdf_export_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='pdf_export__status_a3b23b_idx')],
+            },
+        ),
+    ]
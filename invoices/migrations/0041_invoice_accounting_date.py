@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+
+def backfill_accounting_date(apps, schema_editor):
+    """既存の請求書の計上日（請求日 → 発行日 → 作成日）を1回の UPDATE で設定"""
+    from django.db.models import F
+    from django.db.models.functions import Coalesce, TruncDate
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Invoice.objects.update(
+        accounting_date=Coalesce(F('invoice_date'), F('issue_date'), TruncDate('created_at'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0040_pdf_export_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='accounting_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='計上日'),
+        ),
+        migrations.RunPython(backfill_accounting_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['receiving_company', 'accounting_date'], name='invoice_recv_acct_date_idx'),
+        ),
+    ]
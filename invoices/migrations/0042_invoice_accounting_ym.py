@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+def backfill_accounting_ym(apps, schema_editor):
+    """既存の請求書の計上年月（YYYYMM）を計上日から1回の UPDATE で設定"""
+    from django.db.models.functions import ExtractMonth, ExtractYear
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Invoice.objects.filter(accounting_date__isnull=False).update(
+        accounting_ym=ExtractYear('accounting_date') * 100 + ExtractMonth('accounting_date')
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0041_invoice_accounting_date'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_recv_acct_date_idx',
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='accounting_ym',
+            field=models.IntegerField(blank=True, editable=False, null=True, verbose_name='計上年月'),
+        ),
+        migrations.RunPython(backfill_accounting_ym, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['receiving_company', 'accounting_ym', 'status'], include=('construction_site', 'customer_company', 'total_amount', 'safety_cooperation_fee'), name='invoice_recv_acct_ym_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['accounting_ym', 'status'], include=('customer_company', 'construction_site', 'total_amount'), name='invoice_acct_ym_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['construction_site', 'accounting_ym'], include=('status', 'total_amount'), name='invoice_site_acct_ym_idx'),
+        ),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:34
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+STATUS_BUCKETS = {
+    'submitted': 'pending',
+    'pending_approval': 'pending',
+    'approved': 'approved',
+    'payment_preparing': 'settling',
+    'paid': 'settling',
+}
+
+
+def build_rollups(apps, schema_editor):
+    """既存の請求書から会社・協力会社・現場別の月次集計を作成"""
+    from django.db.models import Count, Sum
+
+    Invoice = apps.get_model('invoices', 'Invoice')
+    targets = (
+        ('CompanyMonthlyRollup', 'receiving_company_id', 'company_id'),
+        ('CustomerMonthlyRollup', 'customer_company_id', 'customer_company_id'),
+        ('SiteMonthlyRollup', 'construction_site_id', 'construction_site_id'),
+    )
+    for model_name, source_field, key_field in targets:
+        Rollup = apps.get_model('invoices', model_name)
+        grouped = (
+            Invoice.objects.filter(accounting_ym__isnull=False).order_by()
+            .values_list(source_field, 'accounting_ym', 'status')
+            .annotate(count=Count('id'), amount=Sum('total_amount'))
+        )
+        totals = {}
+        for key_id, year_month, status, count, amount in grouped:
+            key = (key_id, year_month, STATUS_BUCKETS.get(status, 'other'))
+            total_count, total_amount = totals.get(key, (0, 0))
+            totals[key] = (total_count + count, total_amount + (amount or 0))
+        Rollup.objects.bulk_create([
+            Rollup(**{key_field: key_id}, year_month=year_month, bucket=bucket,
+                   invoice_count=count, total_amount=amount)
+            for (key_id, year_month, bucket), (count, amount) in totals.items()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0042_invoice_accounting_ym'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year_month', models.IntegerField(verbose_name='計上年月')),
+                ('bucket', models.CharField(choices=[('pending', '承認中'), ('approved', '承認済み'), ('settling', '支払い準備中・支払い済み'), ('other', 'その他')], max_length=20, verbose_name='ステータス区分')),
+                ('invoice_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('total_amount', models.DecimalField(decimal_places=0, default=Decimal('0'), max_digits=17, verbose_name='合計金額')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='invoices.company', verbose_name='請求先会社')),
+            ],
+            options={
+                'verbose_name': '会社別月次集計',
+                'verbose_name_plural': '会社別月次集計一覧',
+                'db_table': 'invoice_rollup_company_monthly',
+                'indexes': [models.Index(fields=['year_month', 'bucket'], name='rollup_company_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('company', 'year_month', 'bucket'), name='rollup_company_month_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year_month', models.IntegerField(verbose_name='計上年月')),
+                ('bucket', models.CharField(choices=[('pending', '承認中'), ('approved', '承認済み'), ('settling', '支払い準備中・支払い済み'), ('other', 'その他')], max_length=20, verbose_name='ステータス区分')),
+                ('invoice_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('total_amount', models.DecimalField(decimal_places=0, default=Decimal('0'), max_digits=17, verbose_name='合計金額')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('customer_company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='invoices.customercompany', verbose_name='協力会社')),
+            ],
+            options={
+                'verbose_name': '協力会社別月次集計',
+                'verbose_name_plural': '協力会社別月次集計一覧',
+                'db_table': 'invoice_rollup_customer_monthly',
+                'indexes': [models.Index(fields=['year_month', 'bucket'], name='rollup_customer_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('customer_company', 'year_month', 'bucket'), name='rollup_customer_month_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SiteMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year_month', models.IntegerField(verbose_name='計上年月')),
+                ('bucket', models.CharField(choices=[('pending', '承認中'), ('approved', '承認済み'), ('settling', '支払い準備中・支払い済み'), ('other', 'その他')], max_length=20, verbose_name='ステータス区分')),
+                ('invoice_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('total_amount', models.DecimalField(decimal_places=0, default=Decimal('0'), max_digits=17, verbose_name='合計金額')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('construction_site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='invoices.constructionsite', verbose_name='工事現場')),
+            ],
+            options={
+                'verbose_name': '現場別月次集計',
+                'verbose_name_plural': '現場別月次集計一覧',
+                'db_table': 'invoice_rollup_site_monthly',
+                'indexes': [models.Index(fields=['year_month', 'bucket'], name='rollup_site_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('construction_site', 'year_month', 'bucket'), name='rollup_site_month_uniq')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
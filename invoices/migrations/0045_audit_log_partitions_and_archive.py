@@ -0,0 +1,147 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:50
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# (テーブル名, パーティションキー)
+PARTITIONED_TABLES = (
+    ('access_logs', 'timestamp'),
+    ('audit_logs', 'created_at'),
+)
+# 今月から何か月先までのパーティションを作っておくか（以降は archive_audit_logs が作成する）
+MONTHS_AHEAD = 3
+
+
+def _month_start(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def partition_audit_tables(apps, schema_editor):
+    """
+    PostgreSQL: access_logs / audit_logs を日時の月別レンジパーティションに作り替える
+    - 既存の行は新しいテーブルにコピーする（ログの量に比例して時間がかかるため、更新の少ない時間帯に適用すること）
+    - 主キーはパーティションキーを含める必要があるため (id, 日時)。id は専用のシーケンスで採番する
+    - インデックス・外部キーは元のテーブルと同じ名前・定義で作り直す
+    SQLite（開発用）では何もしない
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    qn = schema_editor.quote_name
+
+    with connection.cursor() as cursor:
+        for table, column in PARTITIONED_TABLES:
+            legacy = f'{table}_legacy'
+            sequence = f'{table}_part_id_seq'
+
+            cursor.execute(
+                'SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() '
+                'AND tablename = %s AND indexname <> %s',
+                [table, f'{table}_pkey']
+            )
+            index_definitions = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table]
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute(f'SELECT min({qn(column)}), coalesce(max(id), 0) FROM {qn(table)}')
+            oldest, max_id = cursor.fetchone()
+
+            # 元のテーブルを退避（インデックス名・主キー名を空けるため、インデックスは先に削除）
+            cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+            cursor.execute(f'ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(table + "_pkey")} TO {qn(legacy + "_pkey")}')
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() '
+                'AND tablename = %s AND indexname <> %s',
+                [legacy, f'{legacy}_pkey']
+            )
+            for (index_name,) in cursor.fetchall():
+                cursor.execute(f'DROP INDEX {qn(index_name)}')
+
+            cursor.execute(
+                f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                f'PARTITION BY RANGE ({qn(column)})'
+            )
+            cursor.execute(f'CREATE SEQUENCE {qn(sequence)} AS bigint START WITH {max_id + 1}')
+            cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+            cursor.execute(f'ALTER SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id')
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY (id, {qn(column)})')
+
+            # 月別パーティション（最も古いログの月 〜 今月 + MONTHS_AHEAD）と既定パーティション
+            today = timezone.localdate()
+            first = timezone.localtime(oldest) if oldest else today
+            month_index = first.year * 12 + first.month - 1
+            while month_index <= today.year * 12 + today.month - 1 + MONTHS_AHEAD:
+                year, month = divmod(month_index, 12)
+                start, end = _month_start(year, month + 1), _month_start(year, month + 2)
+                cursor.execute(
+                    f'CREATE TABLE {qn(f"{table}_y{year}m{month + 1:02d}")} PARTITION OF {qn(table)} '
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+                month_index += 1
+            cursor.execute(f'CREATE TABLE {qn(table + "_default")} PARTITION OF {qn(table)} DEFAULT')
+
+            cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}')
+            cursor.execute(f'DROP TABLE {qn(legacy)}')
+
+            for definition in index_definitions:
+                cursor.execute(definition)
+            for name, definition in foreign_keys:
+                cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0044_audit_log_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(choices=[('access_logs', 'アクセスログ'), ('audit_logs', '操作ログ')], max_length=30, verbose_name='対象テーブル')),
+                ('year_month', models.IntegerField(help_text='YYYYMM', verbose_name='対象年月')),
+                ('part', models.PositiveIntegerField(default=1, help_text='アーカイブ後に書き込まれた同じ月のログは次の連番のファイルに書き出す', verbose_name='連番')),
+                ('file_path', models.CharField(max_length=500, verbose_name='ファイルパス')),
+                ('row_count', models.IntegerField(verbose_name='件数')),
+                ('file_size', models.BigIntegerField(verbose_name='ファイルサイズ（バイト）')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('first_logged_at', models.DateTimeField(blank=True, null=True, verbose_name='最初のログの日時')),
+                ('last_logged_at', models.DateTimeField(blank=True, null=True, verbose_name='最後のログの日時')),
+                ('retain_until', models.DateField(verbose_name='保存期限')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='アーカイブ日時')),
+            ],
+            options={
+                'verbose_name': 'ログアーカイブ',
+                'verbose_name_plural': 'ログアーカイブ一覧',
+                'db_table': 'audit_archives',
+                'ordering': ['-year_month', 'table_name', 'part'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['timestamp'], name='access_log_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['created_at'], name='audit_log_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['target_model', 'target_id'], name='audit_log_target_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='auditarchive',
+            constraint=models.UniqueConstraint(fields=('table_name', 'year_month', 'part'), name='audit_archive_part_uniq'),
+        ),
+        # パーティション化は元に戻さない（パーティション化したままでも以前のマイグレーションの状態と互換）
+        migrations.RunPython(partition_audit_tables, migrations.RunPython.noop),
+    ]
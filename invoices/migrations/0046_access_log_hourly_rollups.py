@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_hourly_rollups(apps, schema_editor):
+    """既存のアクセスログから時間別集計を作成"""
+    from django.db.models import Count
+    from django.db.models.functions import TruncHour
+
+    AccessLog = apps.get_model('invoices', 'AccessLog')
+    AccessLogHourlyRollup = apps.get_model('invoices', 'AccessLogHourlyRollup')
+    grouped = (
+        AccessLog.objects.order_by()
+        .annotate(hour=TruncHour('timestamp'))
+        .values_list('hour', 'action', 'user_id')
+        .annotate(count=Count('id'))
+    )
+    AccessLogHourlyRollup.objects.bulk_create([
+        AccessLogHourlyRollup(hour=hour, action=action, user_id=user_id, log_count=count)
+        for hour, action, user_id, count in grouped.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0045_audit_log_partitions_and_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessLogHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='時間帯の開始日時（ローカル時刻の正時）', verbose_name='時間帯')),
+                ('action', models.CharField(max_length=20, verbose_name='アクション')),
+                ('log_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_log_rollups', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'アクセスログ時間別集計',
+                'verbose_name_plural': 'アクセスログ時間別集計一覧',
+                'db_table': 'access_log_hourly_rollups',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'action', 'user'), name='access_log_rollup_hour_uniq')],
+            },
+        ),
+        migrations.RunPython(build_hourly_rollups, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,15 @@
 # invoices/models.py
 
 import uuid
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
 from datetime import timedelta
 
+from . import audit
+
 
 # ==========================================
 # 工種マスタ（15種類）
@@ -336,6 +338,17 @@ class CustomerCompany(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.get_business_type_display()})"
+    
+    def save(self, *args, **kwargs):
+        # 会社名・ふりがなの変更は請求書の検索用ドキュメントに反映する
+        old_names = None
+        if self.pk:
+            old_names = CustomerCompany.objects.filter(pk=self.pk).values_list('name', 'name_kana').first()
+        
+        super().save(*args, **kwargs)
+        
+        if old_names is not None and old_names != (self.name, self.name_kana):
+            InvoiceSearchDocument.sync_queryset(Invoice.objects.filter(customer_company=self))
 
 
 class User(AbstractUser):
@@ -443,10 +456,39 @@ class User(AbstractUser):
             return f"{self.last_name} {self.first_name} ({position_display})"
         else:
             return f"{self.last_name} {self.first_name} ({self.customer_company})"
+    
+    # 承認者ディレクトリ（ApproverDirectory）に影響するフィールド
+    DIRECTORY_FIELDS = {'user_type', 'company', 'position', 'is_active', 'email', 'first_name', 'last_name'}
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # ログイン日時の更新などディレクトリに関係ない保存では無効化しない
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & self.DIRECTORY_FIELDS:
+            from .services import ApproverDirectory
+            transaction.on_commit(ApproverDirectory.invalidate)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from .services import ApproverDirectory
+        transaction.on_commit(ApproverDirectory.invalidate)
+        return result
 
 
 class ApprovalRoute(models.Model):
     """承認ルートマスター"""
+    # 請求書提出時の標準承認フロー (現場監督 -> 部長 -> 専務 -> 社長 -> 常務 -> 経理)
+    STANDARD_STEPS = [
+        (1, '現場所長承認', 'site_supervisor'),
+        (2, '部長承認', 'department_manager'),
+        (3, '専務承認', 'senior_managing_director'),
+        (4, '社長承認', 'president'),
+        (5, '常務承認', 'managing_director'),
+        (6, '経理確認', 'accountant'),
+    ]
+    # テンプレートの (ルートID, 最初のステップID) のキャッシュ有効期間（秒）
+    TEMPLATE_CACHE_TTL = 3600
+    
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     name = models.CharField(max_length=100, verbose_name="承認ルート名")
     description = models.TextField(verbose_name="説明", blank=True)
@@ -454,12 +496,65 @@ class ApprovalRoute(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="有効")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # 会社共通の承認ルートテンプレート（提出された請求書で共有する）
+    is_template = models.BooleanField(default=False, verbose_name="共有テンプレート")
+    template_key = models.CharField(
+        max_length=40, blank=True, db_index=True, verbose_name="テンプレート定義キー",
+        help_text="ステップ定義のハッシュ（定義が変わると新しい版を作成）"
+    )
+    version = models.PositiveIntegerField(default=1, verbose_name="版")
+    
     class Meta:
         verbose_name = "承認ルート"
         verbose_name_plural = "承認ルート一覧"
     
     def __str__(self):
         return f"{self.company.name} - {self.name}"
+    
+    @classmethod
+    def standard_template(cls, company):
+        """
+        会社の標準承認ルートテンプレートの (ルートID, 最初のステップID) を返す
+        STANDARD_STEPS の定義が変わった場合は新しい版を作成する（既存の請求書は旧版を参照し続ける）
+        """
+        import hashlib
+        from django.core.cache import cache
+
+        template_key = hashlib.sha1(repr(cls.STANDARD_STEPS).encode('utf-8')).hexdigest()
+        cache_key = f'approval_route_template:{company.pk}:{template_key}'
+        cached = cache.get(cache_key)
+        # キャッシュはプロセスごとのため、ルートの削除（force_reset_routes 等）・無効化を
+        # 他のプロセスから消せない。使う前にルートとステップが残っているか確かめる
+        if cached and ApprovalStep.objects.filter(
+            pk=cached[1], route_id=cached[0], route__is_active=True
+        ).exists():
+            return cached
+
+        with transaction.atomic():
+            route = cls.objects.filter(
+                company=company, is_template=True, template_key=template_key, is_active=True
+            ).order_by('-version').first()
+            if route is None:
+                latest = cls.objects.filter(company=company, is_template=True).aggregate(
+                    latest=models.Max('version')
+                )['latest'] or 0
+                route = cls.objects.create(
+                    company=company,
+                    name=f'標準承認フロー v{latest + 1}',
+                    description='提出された請求書で共有する標準承認ルート（現場監督は請求書ごとに割り当て）',
+                    is_template=True,
+                    template_key=template_key,
+                    version=latest + 1,
+                )
+                ApprovalStep.objects.bulk_create([
+                    ApprovalStep(route=route, step_order=order, step_name=name, approver_position=position)
+                    for order, name, position in cls.STANDARD_STEPS
+                ])
+            first_step_id = route.steps.order_by('step_order').values_list('id', flat=True).first()
+
+        result = (route.pk, first_step_id)
+        transaction.on_commit(lambda: cache.set(cache_key, result, cls.TEMPLATE_CACHE_TTL))
+        return result
 
 
 class ApprovalStep(models.Model):
@@ -497,6 +592,60 @@ class ApprovalStep(models.Model):
         return f"{self.route.name} - Step{self.step_order}: {self.step_name}"
 
 
+class NumberSequence(models.Model):
+    """
+    採番カウンター（キーごとに最後に払い出した番号を保持）
+    行単位の UPDATE で加算するため同時採番でも重複せず、
+    採番した側のトランザクションが取り消されれば番号も戻る（欠番にならない）。
+    キー例: 'invoice_number:INV-2026' / 'unique_number:INV-2026' / 'project_code:PRJ-2026'
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name="採番キー")
+    last_value = models.BigIntegerField(default=0, verbose_name="最終番号")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+    
+    class Meta:
+        db_table = 'number_sequences'
+        verbose_name = "採番カウンター"
+        verbose_name_plural = "採番カウンター一覧"
+    
+    def __str__(self):
+        return f"{self.key}: {self.last_value}"
+    
+    @classmethod
+    def allocate(cls, key, count=1, seed=None):
+        """
+        番号を count 件まとめて払い出し、range で返す（一括登録時の事前確保にも使う）
+        seed: カウンターが未作成の場合に初期値（既存データの最大番号）を返す関数
+        """
+        with transaction.atomic():
+            updated = cls.objects.filter(key=key).update(
+                last_value=models.F('last_value') + count, updated_at=timezone.now()
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(key=key, last_value=(seed() if seed else 0) + count)
+                except IntegrityError:
+                    # 同時に作成された場合は加算し直す
+                    cls.objects.filter(key=key).update(
+                        last_value=models.F('last_value') + count, updated_at=timezone.now()
+                    )
+            last_value = cls.objects.filter(key=key).values_list('last_value', flat=True).get()
+        return range(last_value - count + 1, last_value + 1)
+    
+    @classmethod
+    def next_value(cls, key, seed=None):
+        """次の番号を1件払い出す"""
+        return cls.allocate(key, 1, seed)[0]
+    
+    @staticmethod
+    def max_suffix(queryset, field, prefix):
+        """既存データの「{prefix}NNNN」形式の番号のうち最大の NNNN（カウンター初期化用）"""
+        values = queryset.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+        numbers = [int(v[len(prefix):]) for v in values if v and v[len(prefix):].isdigit()]
+        return max(numbers, default=0)
+
+
 class ConstructionSite(models.Model):
     """工事現場モデル（設計書: project テーブル）"""
     # 🆕 工事コード（ユニーク、空の場合はnull）
@@ -618,6 +767,12 @@ class ConstructionSite(models.Model):
         default=90, verbose_name="予算アラート閾値(%)",
         help_text="この割合を超えたらアラートを表示"
     )
+    # 累計請求額（承認済み以降の請求書の合計。Invoice の保存・削除時に差分で更新）
+    invoiced_total = models.DecimalField(
+        max_digits=15, decimal_places=0, default=0,
+        verbose_name="累計請求額",
+        help_text="承認済み・支払準備中・支払済みの請求書の合計（自動集計）"
+    )
     
     # 予算アラート通知履歴
     budget_alert_80_notified = models.BooleanField(default=False, verbose_name="80%到達通知済み")
@@ -639,33 +794,34 @@ class ConstructionSite(models.Model):
         return f"{self.name}{supervisor_name}{status}"
     
     def save(self, *args, **kwargs):
-        # 工事コードの自動生成（空文字の場合もnullに変換）
-        if not self.project_code or self.project_code.strip() == '':
-            import datetime
-            today = datetime.date.today()
-            year = today.year
-            last_site = ConstructionSite.objects.filter(
-                project_code__startswith=f'PRJ-{year}-'
-            ).order_by('-project_code').first()
-            
-            if last_site and last_site.project_code:
-                try:
-                    last_number = int(last_site.project_code.split('-')[-1])
-                    new_number = last_number + 1
-                except (ValueError, IndexError):
-                    new_number = 1
-            else:
-                new_number = 1
-            
-            # 既存のコードと重複しないようにチェック
-            while True:
-                new_code = f'PRJ-{year}-{new_number:04d}'
-                if not ConstructionSite.objects.filter(project_code=new_code).exists():
-                    self.project_code = new_code
-                    break
-                new_number += 1
+        # 工事コードの自動生成（PRJ-YYYY-NNNN。採番カウンターから払い出す）
+        generate_code = not self.project_code or self.project_code.strip() == ''
         
-        super().save(*args, **kwargs)
+        # 現場名の変更は請求書の検索用ドキュメントに反映する
+        old_name = None
+        if self.pk:
+            old_name = ConstructionSite.objects.filter(pk=self.pk).values_list('name', flat=True).first()
+        
+        # 累計請求額は Invoice 側で差分更新するため、既存現場の保存では上書きしない
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'invoiced_total'
+            ]
+        
+        with transaction.atomic():
+            if generate_code:
+                year = timezone.localdate().year
+                prefix = f'PRJ-{year}-'
+                number = NumberSequence.next_value(
+                    f'project_code:PRJ-{year}',
+                    seed=lambda: NumberSequence.max_suffix(ConstructionSite.objects.all(), 'project_code', prefix),
+                )
+                self.project_code = f'{prefix}{number:04d}'
+            super().save(*args, **kwargs)
+        
+        if old_name is not None and old_name != self.name:
+            InvoiceSearchDocument.sync_queryset(Invoice.objects.filter(construction_site=self))
     
     def mark_as_completed(self, user):
         """現場を完成状態にする"""
@@ -680,6 +836,7 @@ class ConstructionSite(models.Model):
         self.cutoff_date = timezone.now().date()
         self.cutoff_by = user
         self.cutoff_reason = reason
+        self.refresh_from_db(fields=['invoiced_total'])
         self.final_invoiced_amount = self.get_total_invoiced_amount()
         self.save()
         
@@ -724,11 +881,44 @@ class ConstructionSite(models.Model):
         return False
     
     def get_total_invoiced_amount(self):
-        """この現場の累計請求額を取得"""
+        """この現場の累計請求額を取得（集計済みの invoiced_total を返す）"""
+        return self.invoiced_total
+    
+    @classmethod
+    def add_invoiced_amount(cls, site_id, amount):
+        """累計請求額に差分を加算（同時更新でも取りこぼさないよう F 式で更新）"""
+        if site_id and amount:
+            cls.objects.filter(pk=site_id).update(invoiced_total=models.F('invoiced_total') + amount)
+    
+    @classmethod
+    def recalculate_invoiced_totals(cls, site_ids=None):
+        """
+        累計請求額を請求書から再集計（1回のグループ集計で全現場分を取得）
+        site_ids を省略すると全現場が対象。更新した現場数を返す
+        """
         from django.db.models import Sum
-        return self.invoice_set.filter(
-            status__in=['approved', 'paid', 'payment_preparing']
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
+
+        invoices = Invoice.objects.filter(
+            status__in=Invoice.INVOICED_STATUSES, construction_site__isnull=False
+        )
+        sites = cls.objects.all()
+        if site_ids is not None:
+            invoices = invoices.filter(construction_site_id__in=site_ids)
+            sites = sites.filter(pk__in=site_ids)
+
+        totals = dict(
+            invoices.order_by().values('construction_site_id')
+            .annotate(total=Sum('total_amount'))
+            .values_list('construction_site_id', 'total')
+        )
+        changed = []
+        for site in sites.only('id', 'invoiced_total'):
+            total = totals.get(site.id) or 0
+            if site.invoiced_total != total:
+                site.invoiced_total = total
+                changed.append(site)
+        cls.objects.bulk_update(changed, ['invoiced_total'], batch_size=500)
+        return len(changed)
     
     def get_budget_consumption_rate(self):
         """予算消化率を計算（%）"""
@@ -749,6 +939,10 @@ class ConstructionSite(models.Model):
         if self.total_budget <= 0:
             return []
         
+        # 累計請求額は F 式で DB 側だけ加算されるため、読み込み済みのインスタンスの値は古いことがある
+        self.refresh_from_db(fields=[
+            'invoiced_total', 'budget_alert_80_notified', 'budget_alert_90_notified', 'budget_alert_100_notified',
+        ])
         rate = self.get_budget_consumption_rate()
         alerts_sent = []
         
@@ -771,7 +965,10 @@ class ConstructionSite(models.Model):
             alerts_sent.append(80)
         
         if alerts_sent:
-            self.save()
+            # 他の項目（累計請求額など）を読み込み時の値で上書きしない
+            self.save(update_fields=[
+                'budget_alert_80_notified', 'budget_alert_90_notified', 'budget_alert_100_notified',
+            ])
         
         return alerts_sent
     
@@ -814,6 +1011,21 @@ class Invoice(models.Model):
         ('paid', '支払い済み'),
     ]
     
+    # 現場の累計請求額（ConstructionSite.invoiced_total）に計上するステータス
+    INVOICED_STATUSES = ('approved', 'payment_preparing', 'paid')
+    
+    # 請求書PDFに描画する項目（変更時はキャッシュ済みPDFを削除）
+    PDF_SOURCE_FIELDS = (
+        'invoice_number', 'invoice_date', 'payment_due_date', 'subtotal', 'tax_amount',
+        'total_amount', 'notes', 'receiving_company_id', 'customer_company_id',
+    )
+    
+    # 月次集計（InvoiceMonthlyRollup）の集計対象項目（変更時は差分を加算）
+    ROLLUP_FIELDS = (
+        'status', 'total_amount', 'accounting_ym',
+        'receiving_company_id', 'customer_company_id', 'construction_site_id',
+    )
+    
     # 🆕 4.2 書類タイプ（請求書/納品書）
     DOCUMENT_TYPE_CHOICES = [
         ('invoice', '請求書'),
@@ -931,6 +1143,10 @@ class Invoice(models.Model):
     due_date = models.DateField(verbose_name="支払期日", null=True, blank=True)
     invoice_date = models.DateField(verbose_name="請求日", null=True, blank=True)
     payment_due_date = models.DateField(verbose_name="支払予定日", null=True, blank=True)
+    # 計上日（支払い表・月次集計の対象月の基準。請求日 → 発行日 → 作成日の順で決め、保存時に更新）
+    accounting_date = models.DateField(verbose_name="計上日", null=True, blank=True, editable=False)
+    # 計上年月（YYYYMM の整数。月・年・年度の絞り込みを索引の範囲検索にするため）
+    accounting_ym = models.IntegerField(verbose_name="計上年月", null=True, blank=True, editable=False)
     
     # プロジェクト情報
     project_name = models.CharField(max_length=100, verbose_name="工事名", blank=True)
@@ -971,6 +1187,15 @@ class Invoice(models.Model):
         related_name='pending_approvals',
         verbose_name="現在の承認者"
     )
+    # 現場監督ステップの承認者（提出時点の現場監督。承認ルートは会社共通テンプレートを共有する）
+    approval_supervisor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='assigned_supervisor_invoices',
+        verbose_name="担当現場監督"
+    )
     
     # 作成・更新情報
     created_by = models.ForeignKey(
@@ -1078,6 +1303,28 @@ class Invoice(models.Model):
         verbose_name = "請求書"
         verbose_name_plural = "請求書一覧"
         ordering = ['-created_at']
+        indexes = [
+            # キーセットページネーション用（created_at, id の降順）
+            models.Index(fields=['-created_at', '-id'], name='invoice_created_id_idx'),
+            # 支払い表（請求先会社・計上月・ステータスで絞り込み、現場 × 協力会社で集計）
+            models.Index(
+                fields=['receiving_company', 'accounting_ym', 'status'],
+                include=['construction_site', 'customer_company', 'total_amount', 'safety_cooperation_fee'],
+                name='invoice_recv_acct_ym_idx',
+            ),
+            # 月次推移・月別/業者別/現場別集計・出力（計上月・ステータスで絞り込み）
+            models.Index(
+                fields=['accounting_ym', 'status'],
+                include=['customer_company', 'construction_site', 'total_amount'],
+                name='invoice_acct_ym_status_idx',
+            ),
+            # 予算の配分額（現場・計上月で絞り込み）
+            models.Index(
+                fields=['construction_site', 'accounting_ym'],
+                include=['status', 'total_amount'],
+                name='invoice_site_acct_ym_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.customer_company.name}"
@@ -1091,56 +1338,6 @@ class Invoice(models.Model):
         return self.total_amount
     
     def save(self, *args, **kwargs):
-        # 請求書番号の自動生成
-        if not self.invoice_number:
-            import datetime
-            today = datetime.date.today()
-            year = today.year
-            
-            # 書類タイプに応じたプレフィックス
-            prefix = 'INV' if self.document_type == 'invoice' else 'DLV'
-            
-            last_invoice = Invoice.objects.filter(
-                invoice_number__startswith=f'{prefix}-{year}-'
-            ).order_by('-invoice_number').first()
-            
-            if last_invoice:
-                try:
-                    last_number = int(last_invoice.invoice_number.split('-')[-1])
-                    new_number = last_number + 1
-                except (ValueError, IndexError):
-                    new_number = 1
-            else:
-                new_number = 1
-            
-            self.invoice_number = f'{prefix}-{year}-{new_number:04d}'
-        
-        # 管理番号の自動生成
-        if not self.unique_number:
-            year = self.created_at.year if self.created_at else timezone.now().year
-            prefix = f'INV-{year}-'
-            
-            # count()ではなく、最新の番号を取得して+1する方式に変更（欠番対策）
-            last_record = Invoice.objects.filter(
-                unique_number__startswith=prefix
-            ).order_by('-unique_number').first()
-            
-            if last_record and last_record.unique_number:
-                try:
-                    last_number = int(last_record.unique_number.split('-')[-1])
-                    new_number = last_number + 1
-                except (ValueError, IndexError):
-                    new_number = Invoice.objects.filter(unique_number__startswith=prefix).count() + 1
-            else:
-                new_number = 1
-            
-            self.unique_number = f'{prefix}{str(new_number).zfill(3)}'
-            
-            # 安全策: 重複する場合はインクリメントし続ける
-            while Invoice.objects.filter(unique_number=self.unique_number).exists():
-                new_number += 1
-                self.unique_number = f'{prefix}{str(new_number).zfill(3)}'
-        
         # construction_site_nameを自動設定
         if self.construction_site and not self.construction_site_name:
             self.construction_site_name = self.construction_site.name
@@ -1156,6 +1353,13 @@ class Invoice(models.Model):
         elif self.due_date and not self.payment_due_date:
             self.payment_due_date = self.due_date
         
+        # 計上日・計上年月（日付を指定した部分保存でも合わせて更新）
+        self.accounting_date = self.get_accounting_date()
+        self.accounting_ym = self.accounting_date.year * 100 + self.accounting_date.month
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'invoice_date', 'issue_date'} & set(update_fields):
+            kwargs['update_fields'] = [*update_fields, 'accounting_date', 'accounting_ym']
+        
         # 🆕 2.1 訂正期限の自動設定（受領日時から2日後）
         if self.received_at and not self.correction_deadline:
             self.correction_deadline = self.received_at + timedelta(days=2)
@@ -1191,7 +1395,194 @@ class Invoice(models.Model):
         if self.construction_type and self.pk is None:  # 新規作成時のみ
             self.construction_type.increment_usage()
         
-        super().save(*args, **kwargs)
+        is_new = self._state.adding
+        if is_new:
+            # 新規作成時は承認待ちで作られた場合のみ
+            approval_state_changed = self.status == 'pending_approval'
+        else:
+            approval_state_changed = self._approval_state() != getattr(self, '_loaded_approval_state', None)
+        
+        with transaction.atomic():
+            # 月次集計の差分用に保存前の状態を確定（読み込み時の状態が不明な場合はDBから取得）
+            if is_new:
+                old_rollup_state = None
+            else:
+                old_rollup_state = getattr(self, '_loaded_rollup_state', None)
+                if old_rollup_state is None:
+                    old_rollup_state = type(self).objects.filter(pk=self.pk).values_list(
+                        *self.ROLLUP_FIELDS
+                    ).first()
+
+            # 請求書番号・管理番号の自動生成（採番カウンターから払い出す）
+            self.assign_numbers([self])
+            super().save(*args, **kwargs)
+
+            # 横断検索用ドキュメントの同期（検索対象項目が更新された場合のみ）
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None or set(update_fields) & set(InvoiceSearchDocument.SOURCE_FIELDS):
+                InvoiceSearchDocument.sync(self)
+
+            # 承認状態が変わった場合は承認待ち受信箱を更新
+            if approval_state_changed:
+                ApprovalInbox.sync_invoices([self.pk])
+
+            # 現場の累計請求額に差分を反映
+            self._apply_invoiced_delta(is_new)
+
+            # 会社・協力会社・現場別の月次集計に差分を反映
+            InvoiceMonthlyRollup.apply_changes([(old_rollup_state, self._rollup_state())])
+
+            # 描画項目が変わった場合はキャッシュ済みPDFを削除
+            if not is_new and self._pdf_state() != getattr(self, '_loaded_pdf_state', None):
+                from .services import InvoicePDFCache
+                invoice_id = self.pk
+                transaction.on_commit(lambda: InvoicePDFCache.invalidate(invoice_id))
+            
+            # 新規作成・ステータス変更時はダッシュボード統計のキャッシュを無効化
+            if is_new or approval_state_changed:
+                from .services import DashboardStatsService
+                receiving_company_id = self.receiving_company_id
+                customer_company_id = self.customer_company_id
+                transaction.on_commit(lambda: DashboardStatsService.invalidate(
+                    receiving_company_id=receiving_company_id,
+                    customer_company_id=customer_company_id,
+                ))
+        
+        self._loaded_approval_state = self._approval_state()
+        self._loaded_budget_state = self._budget_state()
+        self._loaded_pdf_state = self._pdf_state()
+        self._loaded_rollup_state = self._rollup_state()
+    
+    @classmethod
+    def assign_numbers(cls, invoices):
+        """
+        未採番の請求書に請求書番号・管理番号を割り当てる
+        - 請求書番号: {INV|DLV}-YYYY-NNNN（書類タイプ別）
+        - 管理番号: INV-YYYY-NNN（作成年）
+        同じ採番キーの請求書はまとめて1回で払い出す（一括登録時の事前確保）
+        """
+        groups = {}
+        for invoice in invoices:
+            if not invoice.invoice_number:
+                prefix = 'INV' if invoice.document_type == 'invoice' else 'DLV'
+                year = timezone.localdate().year
+                groups.setdefault(('invoice_number', f'{prefix}-{year}-', 4), []).append(invoice)
+            if not invoice.unique_number:
+                year = invoice.created_at.year if invoice.created_at else timezone.now().year
+                groups.setdefault(('unique_number', f'INV-{year}-', 3), []).append(invoice)
+
+        for (field, prefix, width), targets in groups.items():
+            numbers = NumberSequence.allocate(
+                f'{field}:{prefix.rstrip("-")}', len(targets),
+                seed=lambda: NumberSequence.max_suffix(cls.objects.all(), field, prefix),
+            )
+            for invoice, number in zip(targets, numbers):
+                setattr(invoice, field, f'{prefix}{str(number).zfill(width)}')
+    
+    def delete(self, *args, **kwargs):
+        from .search import ngram_index
+        from .services import InvoicePDFCache
+        invoice_id = self.pk
+        with transaction.atomic():
+            site_id, amount = self._invoiced_contribution(self._budget_state())
+            rollup_state = self._rollup_state()
+            result = super().delete(*args, **kwargs)
+            ConstructionSite.add_invoiced_amount(site_id, -amount)
+            InvoiceMonthlyRollup.apply_changes([(rollup_state, None)])
+            transaction.on_commit(lambda: InvoicePDFCache.invalidate(invoice_id))
+            transaction.on_commit(lambda: ngram_index.remove([invoice_id]))
+        return result
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 読み込み時点の承認状態（save時の変更検知用）
+        if {'status', 'current_approver_id', 'current_approval_step_id'} <= set(field_names):
+            instance._loaded_approval_state = instance._approval_state()
+        # 読み込み時点の計上状態（現場の累計請求額の差分更新用）
+        if {'status', 'total_amount', 'construction_site_id'} <= set(field_names):
+            instance._loaded_budget_state = instance._budget_state()
+        # 読み込み時点のPDF描画項目（キャッシュ済みPDFの削除判定用）
+        if set(cls.PDF_SOURCE_FIELDS) <= set(field_names):
+            instance._loaded_pdf_state = instance._pdf_state()
+        # 読み込み時点の月次集計の集計対象項目（月次集計の差分更新用）
+        if set(cls.ROLLUP_FIELDS) <= set(field_names):
+            instance._loaded_rollup_state = instance._rollup_state()
+        return instance
+    
+    def _approval_state(self):
+        return (self.status, self.current_approver_id, self.current_approval_step_id)
+    
+    def is_site_supervisor(self, user):
+        """現場監督ステップを承認できるか（提出時に割り当てた監督、または現在の現場監督）"""
+        if user is None:
+            return False
+        if self.approval_supervisor_id and self.approval_supervisor_id == user.pk:
+            return True
+        site = self.construction_site
+        return bool(site and site.supervisor_id == user.pk)
+    
+    @staticmethod
+    def accounting_period_q(year, month=None):
+        """
+        計上月（month 省略時は計上年）の絞り込み条件
+        accounting_ym の比較になるため、年・月の抽出と違って索引を使える
+        """
+        year = int(year)
+        if month:
+            return models.Q(accounting_ym=year * 100 + int(month))
+        return models.Q(accounting_ym__gte=year * 100 + 1, accounting_ym__lte=year * 100 + 12)
+    
+    @staticmethod
+    def fiscal_year_q(fiscal_year):
+        """計上年度（4月〜翌3月）の絞り込み条件"""
+        fiscal_year = int(fiscal_year)
+        return models.Q(accounting_ym__gte=fiscal_year * 100 + 4, accounting_ym__lte=(fiscal_year + 1) * 100 + 3)
+    
+    def get_accounting_date(self):
+        """計上日（請求日 → 発行日 → 作成日の順。作成日は現地時間の日付）"""
+        if self.invoice_date:
+            return self.invoice_date
+        if self.issue_date:
+            return self.issue_date
+        return timezone.localdate(self.created_at) if self.created_at else timezone.localdate()
+    
+    def _budget_state(self):
+        return (self.status, self.total_amount, self.construction_site_id)
+    
+    def _pdf_state(self):
+        return tuple(getattr(self, field) for field in self.PDF_SOURCE_FIELDS)
+    
+    def _rollup_state(self):
+        return tuple(getattr(self, field) for field in self.ROLLUP_FIELDS)
+    
+    @classmethod
+    def _invoiced_contribution(cls, budget_state):
+        """(現場ID, 累計請求額への計上額) を返す"""
+        status, total_amount, site_id = budget_state
+        if status in cls.INVOICED_STATUSES:
+            return site_id, total_amount or 0
+        return site_id, 0
+    
+    def _apply_invoiced_delta(self, is_new):
+        """保存前後の計上額の差分を現場の累計請求額に反映"""
+        new_site_id, new_amount = self._invoiced_contribution(self._budget_state())
+        if is_new:
+            ConstructionSite.add_invoiced_amount(new_site_id, new_amount)
+            return
+
+        loaded_state = getattr(self, '_loaded_budget_state', None)
+        if loaded_state is None:
+            # 読み込み時の状態が不明（一部フィールドのみ読み込んだ等）の場合は現場単位で再集計
+            ConstructionSite.recalculate_invoiced_totals(site_ids=[new_site_id] if new_site_id else [])
+            return
+
+        old_site_id, old_amount = self._invoiced_contribution(loaded_state)
+        if old_site_id == new_site_id:
+            ConstructionSite.add_invoiced_amount(new_site_id, new_amount - old_amount)
+        else:
+            ConstructionSite.add_invoiced_amount(old_site_id, -old_amount)
+            ConstructionSite.add_invoiced_amount(new_site_id, new_amount)
     
     def return_to_partner(self, user, comment='', reason='', note=''):
         """差し戻し処理"""
@@ -1330,7 +1721,7 @@ class Invoice(models.Model):
         if self.status != 'returned':
             raise ValueError("差し戻し状態の請求書のみ再提出できます")
 
-        if not (self.construction_site and self.construction_site.supervisor == user):
+        if not self.is_site_supervisor(user):
             raise ValueError("この請求書の担当現場所長のみ再提出できます")
 
         if not self.approval_route:
@@ -1401,6 +1792,77 @@ class Invoice(models.Model):
                 user.position == 'accountant')
 
 
+class InvoiceSearchDocument(models.Model):
+    """請求書横断検索用ドキュメント（請求書・現場・協力会社の検索対象項目を正規化して保持）"""
+    # 検索対象となる請求書側の項目
+    SOURCE_FIELDS = (
+        'invoice_number', 'unique_number', 'project_name',
+        'construction_site', 'construction_site_name',
+        'customer_company', 'notes',
+    )
+
+    invoice = models.OneToOneField(
+        Invoice,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name="請求書"
+    )
+    document = models.TextField(verbose_name="検索用テキスト", blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = 'invoice_search_documents'
+        verbose_name = "請求書検索ドキュメント"
+        verbose_name_plural = "請求書検索ドキュメント一覧"
+
+    def __str__(self):
+        return f"検索ドキュメント: {self.invoice_id}"
+
+    @classmethod
+    def sync(cls, invoice):
+        """1件の請求書の検索用ドキュメントを作成・更新"""
+        from .search import document_for_invoice
+
+        text = document_for_invoice(invoice)
+        updated = cls.objects.filter(invoice_id=invoice.pk).update(
+            document=text, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.create(invoice=invoice, document=text)
+
+    @classmethod
+    def sync_queryset(cls, invoices, batch_size=500):
+        """複数の請求書の検索用ドキュメントを一括で作成・更新（件数を返す）"""
+        from .search import document_for_invoice
+
+        invoices = invoices.select_related('construction_site', 'customer_company').order_by('pk')
+        now = timezone.now()
+        count = 0
+        batch = []
+        for invoice in invoices.iterator(chunk_size=batch_size):
+            batch.append(cls(invoice_id=invoice.pk, document=document_for_invoice(invoice), updated_at=now))
+            if len(batch) >= batch_size:
+                count += cls._write_batch(batch)
+                batch = []
+        if batch:
+            count += cls._write_batch(batch)
+        return count
+
+    @classmethod
+    def _write_batch(cls, batch):
+        existing = set(
+            cls.objects.filter(invoice_id__in=[doc.invoice_id for doc in batch])
+            .values_list('invoice_id', flat=True)
+        )
+        cls.objects.bulk_update(
+            [doc for doc in batch if doc.invoice_id in existing],
+            ['document', 'updated_at']
+        )
+        cls.objects.bulk_create([doc for doc in batch if doc.invoice_id not in existing])
+        return len(batch)
+
+
 class InvoiceItem(models.Model):
     """請求明細モデル"""
     invoice = models.ForeignKey(
@@ -1443,6 +1905,18 @@ class InvoiceItem(models.Model):
         """保存時に金額を自動計算"""
         self.amount = int(self.quantity * self.unit_price)
         super().save(*args, **kwargs)
+        self._invalidate_invoice_pdf()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._invalidate_invoice_pdf()
+        return result
+    
+    def _invalidate_invoice_pdf(self):
+        """明細の変更時は請求書のキャッシュ済みPDFを削除"""
+        from .services import InvoicePDFCache
+        invoice_id = self.invoice_id
+        transaction.on_commit(lambda: InvoicePDFCache.invalidate(invoice_id))
 
 
 # ==========================================
@@ -1569,6 +2043,327 @@ class ApprovalHistory(models.Model):
         return f"{self.invoice.invoice_number} - {self.get_action_display()} by {self.user}"
 
 
+class ApprovalInbox(models.Model):
+    """
+    承認待ち受信箱（請求書ごとの承認待ちの宛先）
+    - 現在の承認者本人宛ての行（user）
+    - 経理ステップ・ワークフロー役職宛ての行（approver_position: 該当役職の全員が対象）
+    Invoice.save で承認状態が変わるたびに同一トランザクション内で更新する。
+    """
+    REASON_CHOICES = [
+        ('approver', '現在の承認者'),
+        ('accountant_step', '経理確認ステップ'),
+        ('workflow_role', 'ワークフロー役職'),
+    ]
+
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        related_name='inbox_entries',
+        verbose_name="請求書"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='approval_inbox',
+        verbose_name="承認者"
+    )
+    approver_position = models.CharField(
+        max_length=30,
+        blank=True,
+        verbose_name="承認者役職"
+    )
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name="理由")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+
+    class Meta:
+        db_table = 'approval_inbox'
+        verbose_name = "承認待ち受信箱"
+        verbose_name_plural = "承認待ち受信箱一覧"
+        indexes = [
+            models.Index(fields=['user', 'invoice']),
+            models.Index(fields=['approver_position', 'invoice']),
+        ]
+
+    def __str__(self):
+        target = self.user if self.user_id else self.approver_position
+        return f"{self.invoice_id} → {target} ({self.get_reason_display()})"
+
+    @classmethod
+    def for_user(cls, user):
+        """ユーザーの受信箱（本人宛て＋役職宛て）"""
+        condition = models.Q(user=user)
+        position = getattr(user, 'position', '') or ''
+        if position:
+            condition |= models.Q(approver_position=position)
+        return cls.objects.filter(condition)
+
+    @classmethod
+    def invoices_for(cls, user):
+        """ユーザーの承認待ち請求書のクエリセット"""
+        return Invoice.objects.filter(
+            id__in=cls.for_user(user).values('invoice_id'),
+            status='pending_approval'
+        )
+
+    @classmethod
+    def sync_invoices(cls, invoice_ids):
+        """指定した請求書の受信箱の行を承認状態から作り直す"""
+        from .inbox import build_inbox_entries
+
+        invoice_ids = list(invoice_ids)
+        if not invoice_ids:
+            return
+        invoice_rows = Invoice.objects.filter(id__in=invoice_ids).values_list(
+            'id', 'status', 'current_approver_id', 'current_approval_step__approver_position'
+        )
+        workflow_rows = InvoiceApprovalStep.objects.filter(
+            workflow__invoice_id__in=invoice_ids,
+            step_status='in_progress'
+        ).values_list('workflow__invoice_id', 'approver_role')
+
+        entries = build_inbox_entries(invoice_rows, workflow_rows)
+        with transaction.atomic():
+            cls.objects.filter(invoice_id__in=invoice_ids).delete()
+            cls.objects.bulk_create([
+                cls(invoice_id=invoice_id, user_id=user_id, approver_position=position, reason=reason)
+                for invoice_id, user_id, position, reason in entries
+            ])
+
+
+class InvoiceMonthlyRollup(models.Model):
+    """
+    請求書の月次集計（ロールアップ）の共通部分
+    集計軸（会社・協力会社・現場）× 計上年月 × ステータス区分ごとに件数と合計金額を持ち、
+    Invoice.save / delete で保存前後の差分を同一トランザクション内で加算する。
+    読み出す側は集計軸・年月ごとに Sum して使う（区分をまたいだ集計もできるように）
+    """
+    BUCKET_CHOICES = [
+        ('pending', '承認中'),
+        ('approved', '承認済み'),
+        ('settling', '支払い準備中・支払い済み'),
+        ('other', 'その他'),
+    ]
+    # ステータス → 区分（下書き・却下・差し戻し等は other）
+    STATUS_BUCKETS = {
+        'submitted': 'pending',
+        'pending_approval': 'pending',
+        'approved': 'approved',
+        'payment_preparing': 'settling',
+        'paid': 'settling',
+    }
+    # 計上済み（Invoice.INVOICED_STATUSES）に当たる区分
+    INVOICED_BUCKETS = ('approved', 'settling')
+
+    # 集計軸: Invoice 側の項目名と、集計テーブル側の項目名（サブクラスで指定）
+    SOURCE_FIELD = None
+    KEY_FIELD = None
+
+    year_month = models.IntegerField(verbose_name="計上年月")
+    bucket = models.CharField(max_length=20, choices=BUCKET_CHOICES, verbose_name="ステータス区分")
+    invoice_count = models.IntegerField(default=0, verbose_name="件数")
+    total_amount = models.DecimalField(
+        max_digits=17,
+        decimal_places=0,
+        default=Decimal('0'),
+        verbose_name="合計金額"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def bucket_for(cls, status):
+        return cls.STATUS_BUCKETS.get(status, 'other')
+
+    @staticmethod
+    def period_q(year, month=None):
+        """計上月（month 省略時は計上年）の絞り込み条件（Invoice.accounting_period_q と同じ範囲）"""
+        year = int(year)
+        if month:
+            return models.Q(year_month=year * 100 + int(month))
+        return models.Q(year_month__gte=year * 100 + 1, year_month__lte=year * 100 + 12)
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        請求書の保存前後の状態（Invoice._rollup_state）の組を受け取り、全ての月次集計に差分を加算
+        新規作成は (None, 保存後の状態)、削除は (削除前の状態, None)。同じ行への差分はまとめて1回で更新する
+        """
+        deltas = {}
+        for old_state, new_state in changes:
+            for state, sign in ((old_state, -1), (new_state, 1)):
+                if state is None:
+                    continue
+                values = dict(zip(Invoice.ROLLUP_FIELDS, state))
+                if values['accounting_ym'] is None:
+                    continue
+                bucket = cls.bucket_for(values['status'])
+                for model in INVOICE_ROLLUP_MODELS:
+                    key = (model, values[model.SOURCE_FIELD], values['accounting_ym'], bucket)
+                    count, amount = deltas.get(key, (0, 0))
+                    deltas[key] = (count + sign, amount + sign * (values['total_amount'] or 0))
+
+        for (model, key_id, year_month, bucket), (count, amount) in deltas.items():
+            if count or amount:
+                model._add(key_id, year_month, bucket, count, amount)
+
+    @staticmethod
+    def status_changes(rows, new_status):
+        """
+        values(*Invoice.ROLLUP_FIELDS) の行をステータスだけ new_status に一括更新したときの
+        apply_changes 用の (変更前, 変更後) の組
+        """
+        for row in rows:
+            old_state = tuple(row[field] for field in Invoice.ROLLUP_FIELDS)
+            new_state = tuple(new_status if field == 'status' else row[field] for field in Invoice.ROLLUP_FIELDS)
+            yield old_state, new_state
+
+    @classmethod
+    def _add(cls, key_id, year_month, bucket, count, amount):
+        """1行に差分を加算（行が無ければ作成。同時更新でも取りこぼさないよう F 式で更新）"""
+        lookup = {cls.KEY_FIELD: key_id, 'year_month': year_month, 'bucket': bucket}
+        changes = {
+            'invoice_count': models.F('invoice_count') + count,
+            'total_amount': models.F('total_amount') + amount,
+            'updated_at': timezone.now(),
+        }
+        if cls.objects.filter(**lookup).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**lookup, invoice_count=count, total_amount=amount)
+        except IntegrityError:
+            # 同時に作成された場合は加算し直す
+            cls.objects.filter(**lookup).update(**changes)
+
+    @classmethod
+    def rebuild(cls):
+        """全ての月次集計を請求書から作り直す（作成した行数を返す）"""
+        with transaction.atomic():
+            return sum(model._rebuild() for model in INVOICE_ROLLUP_MODELS)
+
+    @classmethod
+    def _rebuild(cls):
+        from django.db.models import Count, Sum
+
+        grouped = (
+            Invoice.objects.filter(accounting_ym__isnull=False).order_by()
+            .values_list(cls.SOURCE_FIELD, 'accounting_ym', 'status')
+            .annotate(count=Count('id'), amount=Sum('total_amount'))
+        )
+        totals = {}
+        for key_id, year_month, status, count, amount in grouped:
+            key = (key_id, year_month, cls.bucket_for(status))
+            total_count, total_amount = totals.get(key, (0, 0))
+            totals[key] = (total_count + count, total_amount + (amount or 0))
+
+        cls.objects.all().delete()
+        cls.objects.bulk_create([
+            cls(**{cls.KEY_FIELD: key_id}, year_month=year_month, bucket=bucket,
+                invoice_count=count, total_amount=amount)
+            for (key_id, year_month, bucket), (count, amount) in totals.items()
+        ], batch_size=1000)
+        return len(totals)
+
+
+class CompanyMonthlyRollup(InvoiceMonthlyRollup):
+    """請求先会社 × 計上年月 × ステータス区分の月次集計（月次推移グラフ用）"""
+    SOURCE_FIELD = 'receiving_company_id'
+    KEY_FIELD = 'company_id'
+
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='monthly_rollups',
+        verbose_name="請求先会社"
+    )
+
+    class Meta:
+        db_table = 'invoice_rollup_company_monthly'
+        verbose_name = "会社別月次集計"
+        verbose_name_plural = "会社別月次集計一覧"
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'year_month', 'bucket'], name='rollup_company_month_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['year_month', 'bucket'], name='rollup_company_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id} {self.year_month} {self.bucket}: {self.invoice_count}件"
+
+
+class CustomerMonthlyRollup(InvoiceMonthlyRollup):
+    """協力会社 × 計上年月 × ステータス区分の月次集計（業者別集計用）"""
+    SOURCE_FIELD = 'customer_company_id'
+    KEY_FIELD = 'customer_company_id'
+
+    customer_company = models.ForeignKey(
+        CustomerCompany,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='monthly_rollups',
+        verbose_name="協力会社"
+    )
+
+    class Meta:
+        db_table = 'invoice_rollup_customer_monthly'
+        verbose_name = "協力会社別月次集計"
+        verbose_name_plural = "協力会社別月次集計一覧"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer_company', 'year_month', 'bucket'], name='rollup_customer_month_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['year_month', 'bucket'], name='rollup_customer_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_company_id} {self.year_month} {self.bucket}: {self.invoice_count}件"
+
+
+class SiteMonthlyRollup(InvoiceMonthlyRollup):
+    """工事現場 × 計上年月 × ステータス区分の月次集計（現場別集計・円グラフ用）"""
+    SOURCE_FIELD = 'construction_site_id'
+    KEY_FIELD = 'construction_site_id'
+
+    construction_site = models.ForeignKey(
+        ConstructionSite,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='monthly_rollups',
+        verbose_name="工事現場"
+    )
+
+    class Meta:
+        db_table = 'invoice_rollup_site_monthly'
+        verbose_name = "現場別月次集計"
+        verbose_name_plural = "現場別月次集計一覧"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['construction_site', 'year_month', 'bucket'], name='rollup_site_month_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['year_month', 'bucket'], name='rollup_site_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.construction_site_id} {self.year_month} {self.bucket}: {self.invoice_count}件"
+
+
+INVOICE_ROLLUP_MODELS = (CompanyMonthlyRollup, CustomerMonthlyRollup, SiteMonthlyRollup)
+
+
 class InvoiceComment(models.Model):
     """請求書コメント"""
     COMMENT_TYPE_CHOICES = [
@@ -1905,41 +2700,13 @@ class MonthlyInvoicePeriod(models.Model):
         
         return True, None
 
-    def close_period(self, user):
-        """期間を締める - 提出済み請求書を一斉に承認待ちへ"""
-        self.is_closed = True
-        self.closed_by = user
-        self.closed_at = timezone.now()
-        self.save()
-
-        # Batch Approval Logic: "submitted" -> "pending_approval"
-        # Invoice IS defined before MonthlyInvoicePeriod in this file, so we can use it directly.
-        
-        # この期間に紐づく提出済み請求書のみ対象（他月の請求書を巻き込まない）
-        invoices = Invoice.objects.filter(
-            invoice_period=self,
-            receiving_company=self.company,
-            status='submitted'
-        )
-        
-        processed_count = 0
-        for invoice in invoices:
-            if invoice.construction_site and invoice.construction_site.supervisor:
-                invoice.status = 'pending_approval'
-                invoice.current_approver = invoice.construction_site.supervisor
-                invoice.save()
-                
-                # History log
-                ApprovalHistory.objects.create(
-                    invoice=invoice,
-                    user=user, # The user who closed the period
-                    action='submitted', # Reuse submitted or use a new one. Let's use 'submitted' to imply it's now properly submitted to flow.
-                    comment='締め処理により承認フローが開始されました'
-                )
-                processed_count += 1
-                
-        return processed_count
-
+    def close_period(self, user, progress=None):
+        """
+        期間を締める - 提出済み請求書を一斉に承認待ちへ（PeriodCloseService で集合演算により実行）
+        承認待ちへ移した件数を返す。progress(処理済み件数, 対象件数) で進捗を受け取れる
+        """
+        from .services import PeriodCloseService
+        return PeriodCloseService(self, user, progress=progress).close()
 
     def reopen_period(self):
         """期間を再開する"""
@@ -2359,7 +3126,8 @@ class AccessLog(models.Model):
     ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name="IPアドレス")
     user_agent = models.TextField(blank=True, verbose_name="ユーザーエージェント")
     details = models.JSONField(default=dict, blank=True, verbose_name="詳細情報")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="日時")
+    # まとめ書き（invoices.audit）で書き込みが遅れても記録した時刻を残すため auto_now_add にしない
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name="日時")
     
     class Meta:
         db_table = 'access_logs'
@@ -2370,6 +3138,7 @@ class AccessLog(models.Model):
             models.Index(fields=['user', 'timestamp']),
             models.Index(fields=['action', 'timestamp']),
             models.Index(fields=['resource_type', 'resource_id']),
+            models.Index(fields=['timestamp'], name='access_log_timestamp_idx'),
         ]
     
     def __str__(self):
@@ -2377,8 +3146,8 @@ class AccessLog(models.Model):
     
     @classmethod
     def log(cls, user, action, resource_type, resource_id='', ip_address=None, user_agent='', details=None):
-        """アクセスログを記録するヘルパーメソッド"""
-        return cls.objects.create(
+        """アクセスログを記録するヘルパーメソッド（リクエスト中はレスポンス送信後にまとめて書き込む）"""
+        entry = cls(
             user=user,
             action=action,
             resource_type=resource_type,
@@ -2387,6 +3156,95 @@ class AccessLog(models.Model):
             user_agent=user_agent,
             details=details or {}
         )
+        audit.record(entry)
+        return entry
+
+    @classmethod
+    def after_bulk_insert(cls, logs):
+        """まとめ書き（invoices.audit）の直後に同じトランザクション内で時間別集計へ加算"""
+        AccessLogHourlyRollup.add_logs(logs)
+
+
+class AccessLogHourlyRollup(models.Model):
+    """
+    アクセスログの時間別集計（1時間 × アクション × ユーザーごとの件数）
+    アクセスログの書き込み（invoices.audit）と同じトランザクションで加算する。
+    アクセスログの集計（サマリー等）は生ログではなくこちらを読む。ログをアーカイブしても集計は残る
+    """
+    hour = models.DateTimeField(verbose_name="時間帯", help_text="時間帯の開始日時（ローカル時刻の正時）")
+    action = models.CharField(max_length=20, verbose_name="アクション")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='access_log_rollups',
+        verbose_name="ユーザー"
+    )
+    log_count = models.IntegerField(default=0, verbose_name="件数")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = 'access_log_hourly_rollups'
+        verbose_name = "アクセスログ時間別集計"
+        verbose_name_plural = "アクセスログ時間別集計一覧"
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'action', 'user'], name='access_log_rollup_hour_uniq'),
+        ]
+
+    @staticmethod
+    def hour_of(value):
+        return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def add_logs(cls, logs):
+        """書き込んだアクセスログを時間帯・アクション・ユーザーごとにまとめて加算"""
+        counts = {}
+        for log in logs:
+            key = (cls.hour_of(log.timestamp), log.action, log.user_id)
+            counts[key] = counts.get(key, 0) + 1
+        for (hour, action, user_id), count in counts.items():
+            cls._add(hour, action, user_id, count)
+
+    @classmethod
+    def _add(cls, hour, action, user_id, count):
+        """1行に加算（行が無ければ作成。同時更新でも取りこぼさないよう F 式で更新）"""
+        lookup = {'hour': hour, 'action': action, 'user_id': user_id}
+        changes = {'log_count': models.F('log_count') + count, 'updated_at': timezone.now()}
+        if cls.objects.filter(**lookup).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**lookup, log_count=count)
+        except IntegrityError:
+            # 同時に作成された場合は加算し直す
+            cls.objects.filter(**lookup).update(**changes)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        ホットテーブルに残っているアクセスログから時間別集計を作り直す（作成した行数を返す）
+        最も古いログの時間帯より前（アーカイブ済みの期間）の集計はそのまま残す
+        """
+        from django.db.models import Count, Min
+        from django.db.models.functions import TruncHour
+
+        with transaction.atomic():
+            oldest = AccessLog.objects.aggregate(oldest=Min('timestamp'))['oldest']
+            if oldest is None:
+                return 0
+            since = cls.hour_of(oldest)
+            grouped = (
+                AccessLog.objects.filter(timestamp__gte=since).order_by()
+                .annotate(hour=TruncHour('timestamp'))
+                .values_list('hour', 'action', 'user_id')
+                .annotate(count=Count('id'))
+            )
+            rows = [
+                cls(hour=hour, action=action, user_id=user_id, log_count=count)
+                for hour, action, user_id, count in grouped
+            ]
+            cls.objects.filter(hour__gte=since).delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+            return len(rows)
 
 
 # ==========================================
@@ -2460,6 +3318,109 @@ class SystemNotification(models.Model):
         self.save()
 
 
+class EmailOutbox(models.Model):
+    """
+    メール送信キュー（トランザクショナル・アウトボックス）
+    状態変更と同じトランザクションで登録し、send_outbox_emails コマンドがまとめて送信する。
+    """
+    STATUS_CHOICES = [
+        ('pending', '送信待ち'),
+        ('sent', '送信済み'),
+        ('failed', '送信失敗'),
+    ]
+    
+    # 再試行の上限回数と間隔（秒。回数ごとに倍々で延ばし、上限で打ち止め）
+    MAX_ATTEMPTS = 6
+    RETRY_BASE_SECONDS = 60
+    RETRY_MAX_SECONDS = 3600
+    
+    to_email = models.EmailField(verbose_name="宛先")
+    subject = models.CharField(max_length=255, verbose_name="件名")
+    body = models.TextField(verbose_name="本文")
+    html_body = models.TextField(blank=True, verbose_name="HTML本文")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="状態")
+    attempts = models.IntegerField(default=0, verbose_name="送信試行回数")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="次回送信日時")
+    last_error = models.TextField(blank=True, verbose_name="最終エラー")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="送信日時")
+    
+    class Meta:
+        db_table = 'email_outbox'
+        verbose_name = "メール送信キュー"
+        verbose_name_plural = "メール送信キュー一覧"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.get_status_display()})"
+    
+    @classmethod
+    def enqueue(cls, to_email, subject, body, html_body=''):
+        """送信待ちに登録（宛先のないユーザーは登録しない）"""
+        if not to_email:
+            return None
+        return cls.objects.create(to_email=to_email, subject=subject, body=body, html_body=html_body or '')
+    
+    def mark_failed(self, error):
+        """送信失敗を記録し、次回送信日時を延ばす（上限回数に達したら failed）"""
+        self.attempts += 1
+        self.last_error = str(error)[:2000]
+        if self.attempts >= self.MAX_ATTEMPTS:
+            self.status = 'failed'
+        else:
+            delay = min(self.RETRY_BASE_SECONDS * (2 ** (self.attempts - 1)), self.RETRY_MAX_SECONDS)
+            self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+
+class PDFExportJob(models.Model):
+    """
+    請求書PDFの一括出力ジョブ（ZIP）
+    API で登録し、run_pdf_export_jobs コマンドがプロセスプールで描画して ZIP にまとめる。
+    """
+    STATUS_CHOICES = [
+        ('pending', '待機中'),
+        ('running', '処理中'),
+        ('done', '完了'),
+        ('failed', '失敗'),
+    ]
+    
+    # 1ジョブで出力できる請求書の上限
+    MAX_INVOICES = 5000
+    
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='pdf_export_jobs',
+        verbose_name="依頼者"
+    )
+    invoice_ids = models.JSONField(default=list, verbose_name="対象請求書ID")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="状態")
+    total = models.IntegerField(default=0, verbose_name="対象件数")
+    processed = models.IntegerField(default=0, verbose_name="処理済み件数")
+    file_path = models.CharField(max_length=500, blank=True, verbose_name="ZIPファイル")
+    file_size = models.BigIntegerField(null=True, blank=True, verbose_name="ファイルサイズ(bytes)")
+    error = models.TextField(blank=True, verbose_name="エラー")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始日時")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完了日時")
+    
+    class Meta:
+        db_table = 'pdf_export_jobs'
+        verbose_name = "PDF一括出力ジョブ"
+        verbose_name_plural = "PDF一括出力ジョブ一覧"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"PDF一括出力 #{self.pk} ({self.get_status_display()})"
+
+
 # ==========================================
 # 1.2-1.3 月次締め処理の拡張
 # ==========================================
@@ -2497,41 +3458,15 @@ class BatchApprovalSchedule(models.Model):
         return f"{self.period.period_name} - {self.scheduled_datetime.strftime('%Y/%m/%d %H:%M')}"
     
     def execute(self, executed_by):
-        """一斉承認を実行"""
-        if self.is_executed:
+        """
+        一斉承認を実行（BatchApprovalExecutor で行ロック・一括更新・監督ごとのまとめ通知）
+        (成否, メッセージ) を返す
+        """
+        from .services import BatchApprovalExecutor
+        updated = BatchApprovalExecutor(self, executed_by).execute()
+        if updated is None:
             return False, "既に実行済みです"
-        
-        # 対象の請求書を取得（pending_batch_approval状態のもの）
-        invoices = Invoice.objects.filter(
-            invoice_period=self.period,
-            status='pending_batch_approval'
-        )
-        
-        # 各請求書の承認フローを開始
-        for invoice in invoices:
-            invoice.status = 'pending_approval'
-            invoice.batch_approval_scheduled_at = None
-            invoice.save()
-            
-            # 通知を送信
-            if invoice.construction_site and invoice.construction_site.supervisor:
-                SystemNotification.objects.create(
-                    recipient=invoice.construction_site.supervisor,
-                    notification_type='approval',
-                    priority='high',
-                    title=f'【一斉承認】{invoice.invoice_number}',
-                    message=f'{invoice.customer_company.name}からの請求書が承認待ちになりました。',
-                    action_url=f'/invoices/{invoice.id}',
-                    related_invoice=invoice
-                )
-        
-        self.is_executed = True
-        self.executed_at = timezone.now()
-        self.executed_by = executed_by
-        self.target_invoice_count = invoices.count()
-        self.save()
-        
-        return True, f"{invoices.count()}件の請求書を承認待ち状態にしました"
+        return True, f"{updated}件の請求書を承認待ち状態にしました"
 
 
 # ==========================================
@@ -2598,7 +3533,6 @@ class Budget(models.Model):
     def update_allocated_amount(self):
         """配賦済み金額を請求書から計算"""
         from django.db.models import Sum
-        from django.db.models.functions import ExtractYear, ExtractMonth
         
         invoices = Invoice.objects.filter(
             construction_site=self.project,
@@ -2607,19 +3541,10 @@ class Budget(models.Model):
         
         if self.budget_month:
             # 月別の場合
-            invoices = invoices.annotate(
-                inv_year=ExtractYear('invoice_date'),
-                inv_month=ExtractMonth('invoice_date')
-            ).filter(
-                inv_year=self.budget_year,
-                inv_month=self.budget_month
-            )
+            invoices = invoices.filter(Invoice.accounting_period_q(self.budget_year, self.budget_month))
         else:
             # 年度の場合（4月〜翌3月）
-            invoices = invoices.filter(
-                invoice_date__gte=f'{self.budget_year}-04-01',
-                invoice_date__lt=f'{self.budget_year + 1}-04-01'
-            )
+            invoices = invoices.filter(Invoice.fiscal_year_q(self.budget_year))
         
         total = invoices.aggregate(total=Sum('total_amount'))['total'] or 0
         self.allocated_amount = total
@@ -2933,6 +3858,12 @@ class InvoiceApprovalStep(models.Model):
     def __str__(self):
         return f"{self.workflow.invoice.invoice_number} - Step {self.step_number}: {self.get_approver_role_display()}"
     
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # ワークフロー役職宛ての承認待ちを更新
+            ApprovalInbox.sync_invoices([self.workflow.invoice_id])
+    
     def approve(self, user, comment=''):
         """承認"""
         self.step_status = 'approved'
@@ -3209,14 +4140,58 @@ class AuditLog(models.Model):
     details = models.JSONField(verbose_name="詳細情報", default=dict, blank=True)
     ip_address = models.GenericIPAddressField(verbose_name="IPアドレス", null=True, blank=True)
     user_agent = models.TextField(verbose_name="ユーザーエージェント", blank=True)
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="操作日時")
+    # まとめ書き（invoices.audit）で書き込みが遅れても操作した時刻を残すため auto_now_add にしない
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="操作日時")
 
     class Meta:
         db_table = 'audit_logs'
         verbose_name = "操作ログ"
         verbose_name_plural = "操作ログ一覧"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='audit_log_created_idx'),
+            models.Index(fields=['target_model', 'target_id'], name='audit_log_target_idx'),
+        ]
 
     def __str__(self):
         user_name = self.user.get_full_name() if self.user else 'System'
-        return f"{self.created_at} - {user_name} - {self.get_action_display()} - {self.target_model}"
\ No newline at end of file
+        return f"{self.created_at} - {user_name} - {self.get_action_display()} - {self.target_model}"
+
+
+class AuditArchive(models.Model):
+    """
+    アクセスログ・操作ログの月別アーカイブの台帳
+    archive_audit_logs コマンドが保持期間を過ぎた月のログを gzip 圧縮の JSON Lines に書き出し、
+    ファイルの場所・件数・SHA-256 を記録する（電子取引データの保存規程に従い retain_until まで保存）
+    """
+    TABLE_CHOICES = [
+        ('access_logs', 'アクセスログ'),
+        ('audit_logs', '操作ログ'),
+    ]
+
+    table_name = models.CharField(max_length=30, choices=TABLE_CHOICES, verbose_name="対象テーブル")
+    year_month = models.IntegerField(verbose_name="対象年月", help_text="YYYYMM")
+    part = models.PositiveIntegerField(
+        default=1, verbose_name="連番",
+        help_text="アーカイブ後に書き込まれた同じ月のログは次の連番のファイルに書き出す"
+    )
+    file_path = models.CharField(max_length=500, verbose_name="ファイルパス")
+    row_count = models.IntegerField(verbose_name="件数")
+    file_size = models.BigIntegerField(verbose_name="ファイルサイズ（バイト）")
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+    first_logged_at = models.DateTimeField(null=True, blank=True, verbose_name="最初のログの日時")
+    last_logged_at = models.DateTimeField(null=True, blank=True, verbose_name="最後のログの日時")
+    retain_until = models.DateField(verbose_name="保存期限")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="アーカイブ日時")
+
+    class Meta:
+        db_table = 'audit_archives'
+        verbose_name = "ログアーカイブ"
+        verbose_name_plural = "ログアーカイブ一覧"
+        ordering = ['-year_month', 'table_name', 'part']
+        constraints = [
+            models.UniqueConstraint(fields=['table_name', 'year_month', 'part'], name='audit_archive_part_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_table_name_display()} {self.year_month} #{self.part}"
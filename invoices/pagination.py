@@ -0,0 +1,111 @@
+# invoices/pagination.py
+
+import base64
+import hashlib
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class InvoiceCursorPagination(PageNumberPagination):
+    """
+    請求書一覧用ページネーション
+    - 通常は従来どおりページ番号方式（?page=）
+    - ?cursor= が指定された場合はキーセット方式（created_at, id の降順）に切り替え、
+      COUNT(*) と OFFSET を発生させない
+    - キーセット方式の件数は COUNT(*) の結果を同一ユーザー・同一条件ごとに短時間キャッシュして返す
+      （UIの件数表示用。推定値ではなく正確な件数だが、キャッシュ中は最大 count_cache_ttl 秒前の値になる）
+    """
+    cursor_query_param = 'cursor'
+    # 件数のキャッシュ有効期間（秒）
+    count_cache_ttl = 60
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.use_cursor = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.use_cursor = True
+        self.request = request
+        self.base_queryset = queryset
+        page_size = self.get_page_size(request)
+
+        position = self._decode_cursor(request.query_params.get(self.cursor_query_param))
+        qs = queryset.order_by('-created_at', '-id')
+        if position:
+            created_at, pk = position
+            qs = qs.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=pk)
+            )
+
+        # 1件余分に取得して次ページの有無を判定する
+        rows = list(qs[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('count', self.get_cached_count()),
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+    def get_next_cursor_link(self):
+        if not self.has_next or not self.page_rows:
+            return None
+        last = self.page_rows[-1]
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self._encode_cursor(last))
+
+    def get_cached_count(self):
+        """
+        件数（同一ユーザー・同一条件の COUNT 結果を count_cache_ttl 秒キャッシュ）
+        キャッシュが無いときは権限・検索条件で絞り込んだクエリセットを COUNT(*) で数える。
+        pg_class.reltuples による推定は絞り込み前のテーブル全体の行数しか分からず、
+        一覧は利用者ごとに絞り込まれるため使わない
+        """
+        params = sorted(
+            (key, value) for key, value in self.request.query_params.items()
+            if key not in (self.cursor_query_param, self.page_query_param)
+        )
+        signature = hashlib.md5(repr(params).encode('utf-8')).hexdigest()
+        cache_key = f'invoice_list_count:{self.request.user.pk}:{signature}'
+
+        count = cache.get(cache_key)
+        if count is None:
+            count = self.base_queryset.order_by().count()
+            cache.set(cache_key, count, self.count_cache_ttl)
+        return count
+
+    @staticmethod
+    def _encode_cursor(invoice):
+        raw = f'{invoice.created_at.isoformat()}|{invoice.id}'
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(value):
+        """空文字は先頭ページ、それ以外は (created_at, id) に復元"""
+        if not value:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8')
+            created_at_str, pk = raw.rsplit('|', 1)
+            created_at = parse_datetime(created_at_str)
+            if created_at is None:
+                raise ValueError(created_at_str)
+            return created_at, int(pk)
+        except (ValueError, UnicodeError, TypeError):
+            raise NotFound('無効なカーソルです')
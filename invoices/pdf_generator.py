@@ -6,19 +6,31 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from django.conf import settings
+import functools
+import hashlib
 import io
+import json
 import os
+import tempfile
+import time
 from datetime import datetime
 
+# 請求書PDFのレイアウト版数（レイアウトを変えたら上げる。PDFキャッシュのキーに含まれる）
+PDF_TEMPLATE_VERSION = 1
 
+
+@functools.lru_cache(maxsize=None)
 def register_japanese_fonts():
-    """日本語フォントを登録"""
+    """
+    日本語フォントを登録
+    フォントの探索・登録はプロセス内で最初の1回だけ行い、以降は登録済みのフォント名を返す。
+    """
     try:
         pdfmetrics.registerFont(UnicodeCIDFont('HeiseiKakuGo-W5'))
         return 'HeiseiKakuGo-W5'
@@ -69,11 +81,11 @@ GRAY_LINE = colors.HexColor('#D1D5DB')   # テーブル罫線
 LT_GRAY   = colors.HexColor('#F9FAFB')   # 偶数行背景
 
 
+@functools.lru_cache(maxsize=None)
 def _st(font, size=9, align=TA_LEFT, color=colors.black, leading=None, bold=False):
-    """ParagraphStyle ショートカット"""
-    import uuid
+    """ParagraphStyle ショートカット（同じ引数のスタイルはプロセス内で使い回す）"""
     return ParagraphStyle(
-        f'_s_{uuid.uuid4().hex[:6]}',
+        f'_s_{font}_{size}_{align}_{color.hexval()}_{leading}',
         fontName=font,
         fontSize=size,
         alignment=align,
@@ -82,17 +94,64 @@ def _st(font, size=9, align=TA_LEFT, color=colors.black, leading=None, bold=Fals
     )
 
 
-def generate_invoice_pdf(invoice):
+@functools.lru_cache(maxsize=None)
+def _ts(*commands):
+    """TableStyle ショートカット（同じコマンド列のスタイルはプロセス内で使い回す）"""
+    return TableStyle(list(commands))
+
+
+def clear_pdf_resource_cache():
+    """フォント・スタイルのキャッシュを破棄（ベンチマーク・フォント差し替え時用）"""
+    register_japanese_fonts.cache_clear()
+    _st.cache_clear()
+    _ts.cache_clear()
+    _list_table_style.cache_clear()
+
+
+def invoice_pdf_fingerprint(invoice):
+    """
+    請求書PDFの描画内容のハッシュ（PDFキャッシュのキー・ETag に使う）
+    generate_invoice_pdf が参照する項目・明細・フォント・レイアウト版数から計算する。
+    """
+    recv = invoice.receiving_company
+    cust = invoice.customer_company
+    company_fields = ('name', 'postal_code', 'address', 'phone')
+    customer_fields = company_fields + (
+        'email', 'bank_name', 'bank_branch', 'bank_account',
+        'invoice_registration_number', 'name_kana',
+    )
+    payload = {
+        'template': PDF_TEMPLATE_VERSION,
+        'font': register_japanese_fonts(),
+        'invoice': [
+            invoice.invoice_number, invoice.invoice_date, getattr(invoice, 'payment_due_date', None),
+            invoice.subtotal, invoice.tax_amount, invoice.total_amount, invoice.notes,
+        ],
+        'receiving': [getattr(recv, f, None) for f in company_fields] if recv else None,
+        'customer': [getattr(cust, f, None) for f in customer_fields] if cust else None,
+        'items': [
+            [item.description, item.quantity, item.unit, item.unit_price, item.amount]
+            for item in invoice.items.all()
+        ],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def generate_invoice_pdf(invoice, timings=None):
     """
     請求書PDFをkbtemplate形式で生成。
 
     Args:
         invoice: Invoice モデルインスタンス
+        timings: dict を渡すとフォント読込・レイアウト・PDF出力の所要時間（秒）を格納する
     Returns:
         io.BytesIO: PDF データ
     """
+    started = time.perf_counter()
     buffer = io.BytesIO()
     F = register_japanese_fonts()   # フォント名
+    font_loaded = time.perf_counter()
 
     CW = 180 * mm   # コンテンツ幅 (A4 - 左右 15mm×2)
 
@@ -148,13 +207,13 @@ def generate_invoice_pdf(invoice):
         [[Paragraph('請求書', _st(F, 18, TA_CENTER, colors.white))]],
         colWidths=[CW],
     )
-    title_tbl.setStyle(TableStyle([
+    title_tbl.setStyle(_ts(
         ('BACKGROUND',    (0, 0), (-1, -1), BLUE),
         ('TOPPADDING',    (0, 0), (-1, -1), 7),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 7),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
-    ]))
+    ))
     story.append(title_tbl)
     story.append(Spacer(1, 3 * mm))
 
@@ -170,7 +229,7 @@ def generate_invoice_pdf(invoice):
         ],
         colWidths=[85 * mm],
     )
-    amount_box.setStyle(TableStyle([
+    amount_box.setStyle(_ts(
         ('BACKGROUND',    (0, 0), (0, 0), BLUE),
         ('BACKGROUND',    (0, 1), (0, 1), LT_BLUE),
         ('BOX',           (0, 0), (-1, -1), 1, BLUE),
@@ -178,7 +237,7 @@ def generate_invoice_pdf(invoice):
         ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
-    ]))
+    ))
 
     # 宛先住所
     recv_postal_line = f'〒{r_postal}' if r_postal else ''
@@ -200,12 +259,12 @@ def generate_invoice_pdf(invoice):
     left_rows.append([amount_box])
 
     left_inner = Table(left_rows, colWidths=[92 * mm])
-    left_inner.setStyle(TableStyle([
+    left_inner.setStyle(_ts(
         ('TOPPADDING',    (0, 0), (-1, -1), 1),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 3),
-    ]))
+    ))
 
     # --- 差出人ボックス ---
     sender_rows = [[Paragraph(f'<b>{c_name}</b>', _st(F, 10, TA_RIGHT))]]
@@ -219,13 +278,13 @@ def generate_invoice_pdf(invoice):
         sender_rows.append([Paragraph(f'メール　{c_email}', _st(F, 8, TA_RIGHT))])
 
     sender_box = Table(sender_rows, colWidths=[80 * mm])
-    sender_box.setStyle(TableStyle([
+    sender_box.setStyle(_ts(
         ('BOX',           (0, 0), (-1, -1), 0.8, BLUE),
         ('TOPPADDING',    (0, 0), (-1, -1), 3),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
         ('LEFTPADDING',   (0, 0), (-1, -1), 5),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 5),
-    ]))
+    ))
 
     # RIGHT カラム内容
     right_rows = [
@@ -238,22 +297,22 @@ def generate_invoice_pdf(invoice):
         right_rows.append([Paragraph(f'登録番号　{c_reg_no}', _st(F, 8, TA_RIGHT))])
 
     right_inner = Table(right_rows, colWidths=[88 * mm])
-    right_inner.setStyle(TableStyle([
+    right_inner.setStyle(_ts(
         ('TOPPADDING',    (0, 0), (-1, -1), 1),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
-    ]))
+    ))
 
     # 2カラム結合
     header_tbl = Table([[left_inner, right_inner]], colWidths=[92 * mm, 88 * mm])
-    header_tbl.setStyle(TableStyle([
+    header_tbl.setStyle(_ts(
         ('VALIGN',        (0, 0), (-1, -1), 'TOP'),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
         ('TOPPADDING',    (0, 0), (-1, -1), 0),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-    ]))
+    ))
     story.append(header_tbl)
     story.append(Spacer(1, 3 * mm))
 
@@ -296,7 +355,7 @@ def generate_invoice_pdf(invoice):
             ('BOX',           (0, 0), (-1, -1), 0.5, BLUE),
             ('INNERGRID',     (0, 0), (-1, -1), 0.3, GRAY_LINE),
         ]
-        bank_tbl.setStyle(TableStyle(bank_ts))
+        bank_tbl.setStyle(_ts(*bank_ts))
         story.append(bank_tbl)
         story.append(Spacer(1, 3 * mm))
 
@@ -354,14 +413,14 @@ def generate_invoice_pdf(invoice):
         # 罫線
         ('GRID',          (0, 0), (-1, last_data), 0.4, GRAY_LINE),
         # 交互背景
-        ('ROWBACKGROUNDS',(0, 1), (-1, last_data), [colors.white, LT_GRAY]),
+        ('ROWBACKGROUNDS',(0, 1), (-1, last_data), (colors.white, LT_GRAY)),
         # パディング
         ('TOPPADDING',    (0, 0), (-1, -1), 4),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
         ('LEFTPADDING',   (0, 0), (-1, -1), 3),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 3),
     ]
-    item_tbl.setStyle(TableStyle(item_style))
+    item_tbl.setStyle(_ts(*item_style))
     story.append(item_tbl)
     story.append(Spacer(1, 3 * mm))
 
@@ -381,7 +440,7 @@ def generate_invoice_pdf(invoice):
         ['10%対象', f'¥{tax_amt:,}', f'¥{subtotal:,}'],
     ]
     tax_breakdown_tbl = Table(tax_breakdown_data, colWidths=[22*mm, 22*mm, 28*mm])
-    tax_breakdown_tbl.setStyle(TableStyle([
+    tax_breakdown_tbl.setStyle(_ts(
         ('FONTNAME',      (0, 0), (-1, -1), F),
         ('FONTSIZE',      (0, 0), (-1, -1), 7),
         ('BACKGROUND',    (0, 0), (-1, 0), colors.HexColor('#6B7280')),
@@ -393,18 +452,18 @@ def generate_invoice_pdf(invoice):
         ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
         ('LEFTPADDING',   (0, 0), (-1, -1), 3),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 3),
-    ]))
+    ))
 
     left_tax_inner = Table(
         [[tax_note], [Spacer(1, 1*mm)], [tax_breakdown_tbl]],
         colWidths=[75 * mm],
     )
-    left_tax_inner.setStyle(TableStyle([
+    left_tax_inner.setStyle(_ts(
         ('TOPPADDING',    (0, 0), (-1, -1), 1),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
-    ]))
+    ))
 
     # --- 右: 小計/消費税/合計 ---
     totals_data = [
@@ -413,7 +472,7 @@ def generate_invoice_pdf(invoice):
         ['合計',   f'¥{total:,}'],
     ]
     totals_tbl = Table(totals_data, colWidths=[30*mm, 35*mm])
-    totals_tbl.setStyle(TableStyle([
+    totals_tbl.setStyle(_ts(
         ('FONTNAME',      (0, 0), (-1, -1), F),
         ('FONTSIZE',      (0, 0), (-1, -1), 9),
         ('FONTSIZE',      (0, 2), (-1, 2), 10),
@@ -428,32 +487,32 @@ def generate_invoice_pdf(invoice):
         ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
         ('LEFTPADDING',   (0, 0), (-1, -1), 5),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 5),
-    ]))
+    ))
 
     right_totals_inner = Table(
         [[Spacer(1, 1)], [totals_tbl]],
         colWidths=[105 * mm],
         hAlign='RIGHT',
     )
-    right_totals_inner.setStyle(TableStyle([
+    right_totals_inner.setStyle(_ts(
         ('ALIGN',         (0, 0), (-1, -1), 'RIGHT'),
         ('TOPPADDING',    (0, 0), (-1, -1), 0),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
-    ]))
+    ))
 
     bottom_tbl = Table(
         [[left_tax_inner, right_totals_inner]],
         colWidths=[75 * mm, 105 * mm],
     )
-    bottom_tbl.setStyle(TableStyle([
+    bottom_tbl.setStyle(_ts(
         ('VALIGN',        (0, 0), (-1, -1), 'BOTTOM'),
         ('LEFTPADDING',   (0, 0), (-1, -1), 0),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 0),
         ('TOPPADDING',    (0, 0), (-1, -1), 0),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-    ]))
+    ))
     story.append(bottom_tbl)
     story.append(Spacer(1, 4 * mm))
 
@@ -464,80 +523,138 @@ def generate_invoice_pdf(invoice):
         [[Paragraph('備考', _st(F, 9, TA_LEFT, colors.white))]],
         colWidths=[CW],
     )
-    notes_header.setStyle(TableStyle([
+    notes_header.setStyle(_ts(
         ('BACKGROUND',    (0, 0), (-1, -1), BLUE),
         ('TOPPADDING',    (0, 0), (-1, -1), 4),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
         ('LEFTPADDING',   (0, 0), (-1, -1), 5),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 5),
-    ]))
+    ))
     story.append(notes_header)
 
     notes_text = str(invoice.notes).replace('\n', '<br/>') if invoice.notes else ''
     notes_body_data = [[Paragraph(notes_text, _st(F, 8)) if notes_text else Spacer(1, 12*mm)]]
     notes_body = Table(notes_body_data, colWidths=[CW])
-    notes_body.setStyle(TableStyle([
+    notes_body.setStyle(_ts(
         ('BOX',           (0, 0), (-1, -1), 0.5, GRAY_LINE),
         ('TOPPADDING',    (0, 0), (-1, -1), 6),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
         ('LEFTPADDING',   (0, 0), (-1, -1), 5),
         ('RIGHTPADDING',  (0, 0), (-1, -1), 5),
-    ]))
+    ))
     story.append(notes_body)
 
     # ================================================================== #
     # PDF 生成                                                             #
     # ================================================================== #
+    laid_out = time.perf_counter()
     doc.build(story)
     buffer.seek(0)
+    if timings is not None:
+        timings.update(
+            font=font_loaded - started,
+            layout=laid_out - font_loaded,
+            build=time.perf_counter() - laid_out,
+        )
     return buffer
 
 
 # ------------------------------------------------------------------ #
-# 一覧PDF（変更なし）                                                   #
+# 一覧PDF                                                              #
 # ------------------------------------------------------------------ #
-def generate_invoice_list_pdf(invoices):
-    """請求書一覧を表形式のPDFで出力する（経理向け帳票）。"""
-    F = register_japanese_fonts()
+# 1ページの明細行数（表はページごとに分け、ReportLab の表分割を起こさない）
+LIST_ROWS_PER_PAGE = 35
+# 一覧PDFの出力先（この大きさを超えたら一時ファイルに書き出す）
+LIST_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# 一覧の行を取得する単位（件）
+LIST_ITERATOR_CHUNK_SIZE = 2000
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer, pagesize=A4,
-        topMargin=15 * mm, bottomMargin=15 * mm,
-        leftMargin=12 * mm, rightMargin=12 * mm,
-    )
-    story = []
+LIST_HEADER = ['請求書番号', '協力会社', '工事現場', '請求日', '合計金額', 'ステータス']
+LIST_COL_WIDTHS = [32*mm, 38*mm, 34*mm, 24*mm, 30*mm, 22*mm]
 
-    from reportlab.lib.enums import TA_LEFT
-    title_style = ParagraphStyle('ListTitle', fontName=F, fontSize=14, leading=18, alignment=TA_LEFT)
-    meta_style  = ParagraphStyle('ListMeta',  fontName=F, fontSize=9,  leading=12, textColor=colors.grey)
-    story.append(Paragraph('請求書一覧', title_style))
-    story.append(Paragraph(
-        f'出力日時: {datetime.now().strftime("%Y/%m/%d %H:%M")}　件数: {len(invoices)}件',
-        meta_style,
-    ))
-    story.append(Spacer(1, 4 * mm))
 
-    header = ['請求書番号', '協力会社', '工事現場', '請求日', '合計金額', 'ステータス']
-    data   = [header]
-    total_sum = 0
+class _PagedStory(list):
+    """
+    1ページ分ずつ作るフロウアブルのリスト
+    doc.build は先頭から取り出しながら len() で残りを確認するため、残りが少なくなった時点で
+    次のページ分を生成する（全ページの表を一度にメモリに載せない）。
+    """
+
+    def __init__(self, head, pages):
+        super().__init__(head)
+        self._pages = iter(pages)
+
+    def __len__(self):
+        while super().__len__() < 2:
+            try:
+                self.extend(next(self._pages))
+            except StopIteration:
+                break
+        return super().__len__()
+
+
+def _invoice_list_rows(invoices):
+    """一覧PDFの行 (請求書番号, 協力会社, 工事現場, 請求日, 合計金額, ステータス表示) を順次返す"""
+    if hasattr(invoices, 'values_list'):
+        status_display = dict(invoices.model.STATUS_CHOICES)
+        for (invoice_number, company_name, site_name, site_name_text,
+             invoice_date, total_amount, status) in invoices.values_list(
+            'invoice_number', 'customer_company__name', 'construction_site__name',
+            'construction_site_name', 'invoice_date', 'total_amount', 'status',
+        ).iterator(chunk_size=LIST_ITERATOR_CHUNK_SIZE):
+            yield (invoice_number, company_name, site_name or site_name_text,
+                   invoice_date, total_amount, status_display.get(status, status))
+        return
+
     for inv in invoices:
-        amount = int(inv.total_amount or 0)
-        total_sum += amount
-        data.append([
-            inv.invoice_number or '',
-            (inv.customer_company.name if inv.customer_company else '')[:18],
-            (inv.construction_site.name if inv.construction_site
-             else (inv.construction_site_name or ''))[:16],
-            inv.invoice_date.strftime('%Y/%m/%d') if inv.invoice_date else '',
+        yield (
+            inv.invoice_number,
+            inv.customer_company.name if inv.customer_company else '',
+            inv.construction_site.name if inv.construction_site else inv.construction_site_name,
+            inv.invoice_date, inv.total_amount, inv.get_status_display(),
+        )
+
+
+def _list_page_tables(F, rows):
+    """LIST_ROWS_PER_PAGE 行ごとに [表, 改ページ] を返す（各ページに小計、最終ページに総合計）"""
+    def page_table(data, footer_rows):
+        table = Table(data, colWidths=LIST_COL_WIDTHS, repeatRows=1)
+        table.setStyle(_list_table_style(F, footer_rows))
+        return table
+
+    grand_total = 0
+    page = []
+    page_total = 0
+    for invoice_number, company_name, site_name, invoice_date, total_amount, status_display in rows:
+        # 満杯のページは次の行が来てから出力する（最終ページに総合計を載せるため）
+        if len(page) == LIST_ROWS_PER_PAGE:
+            grand_total += page_total
+            yield [page_table([LIST_HEADER] + page + [['', '', '', '小計', f'¥{page_total:,}', '']], 1), PageBreak()]
+            page = []
+            page_total = 0
+        amount = int(total_amount or 0)
+        page_total += amount
+        page.append([
+            invoice_number or '',
+            (company_name or '')[:18],
+            (site_name or '')[:16],
+            invoice_date.strftime('%Y/%m/%d') if invoice_date else '',
             f'¥{amount:,}',
-            inv.get_status_display(),
+            status_display or '',
         ])
-    data.append(['', '', '', '合計', f'¥{total_sum:,}', ''])
 
-    col_widths = [32*mm, 38*mm, 34*mm, 24*mm, 30*mm, 22*mm]
-    table = Table(data, colWidths=col_widths, repeatRows=1)
-    table.setStyle(TableStyle([
+    grand_total += page_total
+    footer = []
+    if page:
+        footer.append(['', '', '', '小計', f'¥{page_total:,}', ''])
+    footer.append(['', '', '', '合計', f'¥{grand_total:,}', ''])
+    yield [page_table([LIST_HEADER] + page + footer, len(footer))]
+
+
+@functools.lru_cache(maxsize=None)
+def _list_table_style(F, footer_rows):
+    """一覧の表スタイル（末尾 footer_rows 行が小計・合計行）"""
+    commands = [
         ('FONTNAME',       (0, 0), (-1, -1), F),
         ('FONTSIZE',       (0, 0), (-1, -1), 8),
         ('BACKGROUND',     (0, 0), (-1, 0),  colors.HexColor('#2F5496')),
@@ -547,17 +664,66 @@ def generate_invoice_list_pdf(invoices):
         ('ALIGN',          (5, 0), (5, -1),  'CENTER'),
         ('VALIGN',         (0, 0), (-1, -1), 'MIDDLE'),
         ('GRID',           (0, 0), (-1, -1), 0.4, colors.HexColor('#D0D0D0')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#F5F7FA')]),
-        ('BACKGROUND',     (0, -1), (-1, -1), colors.HexColor('#E8EEF7')),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1 - footer_rows), (colors.white, colors.HexColor('#F5F7FA'))),
+        ('BACKGROUND',     (0, -footer_rows), (-1, -1), colors.HexColor('#E8EEF7')),
         ('FONTSIZE',       (0, -1), (-1, -1), 9),
         ('TOPPADDING',     (0, 0), (-1, -1), 3),
         ('BOTTOMPADDING',  (0, 0), (-1, -1), 3),
-    ]))
-    story.append(table)
+    ]
+    return _ts(*commands)
+
+
+def render_invoice_list_pdf(rows, count, fileobj, timings=None):
+    """
+    一覧の行（_invoice_list_rows と同じ形のタプル）を1ページずつ表にして fileobj に書き出す
+    timings は generate_invoice_pdf と同じ（layout は1ページ目の準備まで、以降の表の作成は build に含む）
+    """
+    started = time.perf_counter()
+    F = register_japanese_fonts()
+    font_loaded = time.perf_counter()
 
+    doc = SimpleDocTemplate(
+        fileobj, pagesize=A4,
+        topMargin=15 * mm, bottomMargin=15 * mm,
+        leftMargin=12 * mm, rightMargin=12 * mm,
+    )
+    head = [
+        Paragraph('請求書一覧', _st(F, 14, leading=18)),
+        Paragraph(
+            f'出力日時: {datetime.now().strftime("%Y/%m/%d %H:%M")}　件数: {count}件',
+            _st(F, 9, color=colors.grey, leading=12),
+        ),
+        Spacer(1, 4 * mm),
+    ]
+    story = _PagedStory(head, _list_page_tables(F, rows))
+
+    laid_out = time.perf_counter()
     doc.build(story)
-    buffer.seek(0)
-    return buffer
+    if timings is not None:
+        timings.update(
+            font=font_loaded - started,
+            layout=laid_out - font_loaded,
+            build=time.perf_counter() - laid_out,
+        )
+
+
+def generate_invoice_list_pdf(invoices, timings=None):
+    """
+    請求書一覧を表形式のPDFで出力する（経理向け帳票）。timings は generate_invoice_pdf と同じ。
+    クエリセットは分割して読み込み、ページごとに小計、最終ページに総合計を出す。
+
+    Returns:
+        tempfile.SpooledTemporaryFile: PDF データ（先頭に位置づけ済み）
+    """
+    count = invoices.count() if hasattr(invoices, 'values_list') else len(invoices)
+    fileobj = tempfile.SpooledTemporaryFile(max_size=LIST_SPOOL_MAX_BYTES)
+    try:
+        render_invoice_list_pdf(_invoice_list_rows(invoices), count, fileobj, timings=timings)
+    except Exception:
+        fileobj.close()
+        raise
+    fileobj.seek(0)
+    return fileobj
 
 
 def generate_invoice_pdf_simple(invoice):
@@ -0,0 +1,238 @@
+# invoices/profiling.py
+"""
+リクエストごとのクエリ数・DB時間・シリアライザー時間の計測
+- QueryProfilingMiddleware: ビュー（URL名）ごとにクエリ数・DB時間・シリアライザー時間・全体時間を計測する。
+  直近の計測値はプロセス内に保持し、管理者用APIで集計を確認できる。
+  Server-Timing ヘッダーは内部の情報を含むため、DEBUG 時とスタッフ・スーパーアドミンへのレスポンスにだけ付ける
+- StreamingHttpResponse（CSVのストリーミング出力など）は本文を生成する間のクエリが計測の外で実行されるため、
+  クエリ数・DB時間・全体時間は少なく出る（レスポンスを返すまでの分だけ）
+- クエリ数の上限（QUERY_BUDGETS）を超えたらログに出力（QUERY_BUDGET_RAISE=True ならテストを失敗させる）
+- timed(): 任意の区間の時間を計測して Server-Timing に含める
+
+settings:
+    QUERY_PROFILING        計測の有効/無効
+    QUERY_BUDGETS          {'URL名' または 'メソッド URL名': クエリ数の上限}
+    QUERY_BUDGET_DEFAULT   QUERY_BUDGETS に無いビューの上限（None なら上限なし）
+    QUERY_BUDGET_RAISE     上限を超えたら QueryBudgetExceeded を送出する（テスト用）
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# 計測中のリクエストの計測値（スレッド・非同期タスクごと）
+_current = ContextVar('query_profile', default=None)
+
+# 全体時間のヒストグラムの区切り（ミリ秒）
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# ビューごとに保持する直近の計測件数
+WINDOW_SIZE = 500
+
+
+class QueryBudgetExceeded(AssertionError):
+    """クエリ数が上限を超えた（QUERY_BUDGET_RAISE=True の場合のみ送出）"""
+
+
+class RequestProfile:
+    """1リクエスト分の計測値"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = {}
+        self._depth = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper から呼ばれる
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def section(self, name):
+        # 入れ子になった同名の区間は外側だけを数える
+        depth = self._depth.get(name, 0)
+        self._depth[name] = depth + 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] = depth
+            if depth == 0:
+                self.sections[name] = self.sections.get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def timed(name):
+    """計測中のリクエストに区間の時間を加算（計測していない場合は何もしない）"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.section(name):
+        yield
+
+
+class ProfileStore:
+    """ビューごとの直近の計測値（プロセス内）"""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, total_ms, queries, db_ms, serializer_ms):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window_size)
+            samples.append((total_ms, queries, db_ms, serializer_ms))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """ビューごとの件数・平均・p50/p95・最大と、全体時間のヒストグラム（遅い順）"""
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+
+        result = []
+        for key, samples in snapshot.items():
+            totals = sorted(s[0] for s in samples)
+            queries = sorted(s[1] for s in samples)
+            count = len(samples)
+            histogram = {}
+            for total_ms in totals:
+                bucket = next(
+                    (f'<={b}ms' for b in HISTOGRAM_BUCKETS_MS if total_ms <= b),
+                    f'>{HISTOGRAM_BUCKETS_MS[-1]}ms'
+                )
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            result.append({
+                'endpoint': key,
+                'count': count,
+                'total_ms': {
+                    'avg': round(sum(totals) / count, 1),
+                    'p50': round(_percentile(totals, 50), 1),
+                    'p95': round(_percentile(totals, 95), 1),
+                    'max': round(totals[-1], 1),
+                },
+                'queries': {
+                    'avg': round(sum(queries) / count, 1),
+                    'p95': _percentile(queries, 95),
+                    'max': queries[-1],
+                },
+                'db_ms_avg': round(sum(s[2] for s in samples) / count, 1),
+                'serializer_ms_avg': round(sum(s[3] for s in samples) / count, 1),
+                'histogram': histogram,
+            })
+        result.sort(key=lambda row: row['total_ms']['p95'], reverse=True)
+        return result
+
+
+def _percentile(sorted_values, percent):
+    index = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[index]
+
+
+store = ProfileStore()
+
+
+def query_budget(method, view_name):
+    """ビューのクエリ数の上限（'メソッド URL名' → 'URL名' → QUERY_BUDGET_DEFAULT の順）"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    for key in (f'{method} {view_name}', view_name):
+        if key in budgets:
+            return budgets[key]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+def _exposes_timing(request):
+    """Server-Timing を返してよいか（DEBUG 時、またはスタッフ・スーパーアドミン）"""
+    if settings.DEBUG:
+        return True
+    # DRF で認証したユーザーもビューの実行後は request.user に反映されている
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and (
+        user.is_staff or user.is_superuser or getattr(user, 'is_super_admin', False)
+    ))
+
+
+class QueryProfilingMiddleware:
+    """ビューごとのクエリ数・DB時間・シリアライザー時間・全体時間を計測"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_PROFILING', True):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # 全てのDB接続にクエリの計測を差し込む（DEBUG でなくても計測できる）
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+
+        view_name = match.view_name or match.route
+        db_ms = profile.db_time * 1000
+        serializer_ms = profile.sections.get('serializer', 0.0) * 1000
+        store.record(f'{request.method} {view_name}', total_ms, profile.queries, db_ms, serializer_ms)
+
+        if _exposes_timing(request):
+            metrics = [f'db;desc="DB {profile.queries} queries";dur={db_ms:.1f}']
+            metrics += [
+                f'{name};dur={seconds * 1000:.1f}' for name, seconds in profile.sections.items()
+            ]
+            metrics.append(f'total;dur={total_ms:.1f}')
+            response['Server-Timing'] = ', '.join(metrics)
+
+        budget = query_budget(request.method, view_name)
+        if budget is not None and profile.queries > budget:
+            message = f'クエリ数が上限を超えました: {request.method} {view_name} {profile.queries}件（上限 {budget}件）'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def install_serializer_timing():
+    """
+    DRF のシリアライザーの .data の取得時間を「serializer」区間として計測する
+    （入れ子のシリアライザーは最も外側の .data だけが数えられる）
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, '_profiled', False):
+        return
+
+    def profiled_data(self):
+        with timed('serializer'):
+            return data.fget(self)
+
+    profiled_data._profiled = True
+    BaseSerializer.data = property(profiled_data)
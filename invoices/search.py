@@ -0,0 +1,213 @@
+# invoices/search.py
+"""
+請求書の横断検索
+- 請求書ごとに検索用ドキュメント（正規化済みテキスト）を InvoiceSearchDocument に保持
+- PostgreSQL: pg_trgm の GIN インデックスで部分一致し、類似度順に並べる
+- SQLite（開発・テスト）: プロセス内のバイグラム転置インデックスで代替
+  （順位付けした結果は、権限で絞り込んだクエリセットに含まれるものだけを上位から MAX_FALLBACK_RESULTS 件返す）
+"""
+
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, When, Value, FloatField
+
+
+NGRAM_SIZE = 2
+
+# SQLite 時に順位付けして返す最大件数（IN句・CASE式の肥大化防止）
+MAX_FALLBACK_RESULTS = 1000
+
+
+def normalize_text(value):
+    """
+    検索用の正規化
+    - NFKC（全角英数・半角カナの統一）
+    - 小文字化
+    - カタカナ → ひらがな（ふりがなのカナ表記ゆれ対策）
+    - 空白の圧縮
+    """
+    if not value:
+        return ''
+    text = unicodedata.normalize('NFKC', str(value)).lower()
+    text = ''.join(
+        chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch
+        for ch in text
+    )
+    return ' '.join(text.split())
+
+
+def split_terms(query):
+    """検索語を空白で分割（AND検索）"""
+    return [term for term in normalize_text(query).split(' ') if term]
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """文字 n-gram の集合"""
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def build_document(invoice_number='', unique_number='', project_name='',
+                   construction_site_name='', site_name='',
+                   company_name='', company_name_kana='', notes=''):
+    """検索対象の各項目を正規化して1つのテキストにまとめる（項目間は改行で区切る）"""
+    parts = [
+        invoice_number, unique_number, project_name,
+        construction_site_name, site_name,
+        company_name, company_name_kana, notes,
+    ]
+    return '\n'.join(normalize_text(part) for part in parts if part)
+
+
+def document_for_invoice(invoice):
+    """請求書インスタンスから検索用ドキュメントを生成"""
+    site = invoice.construction_site if invoice.construction_site_id else None
+    company = invoice.customer_company if invoice.customer_company_id else None
+    return build_document(
+        invoice_number=invoice.invoice_number,
+        unique_number=invoice.unique_number,
+        project_name=invoice.project_name,
+        construction_site_name=invoice.construction_site_name,
+        site_name=site.name if site else '',
+        company_name=company.name if company else '',
+        company_name_kana=company.name_kana if company else '',
+        notes=invoice.notes,
+    )
+
+
+class NgramIndex:
+    """
+    プロセス内のバイグラム転置インデックス（SQLite 用フォールバック）
+    検索のたびに updated_at の差分だけを読み込み、他プロセスの更新も取り込む。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._postings = defaultdict(set)
+        self._synced_at = None
+
+    def clear(self):
+        with self._lock:
+            self._documents = {}
+            self._postings = defaultdict(set)
+            self._synced_at = None
+
+    def _put(self, invoice_id, text):
+        old = self._documents.get(invoice_id)
+        if old is not None:
+            for gram in ngrams(old):
+                self._postings[gram].discard(invoice_id)
+        self._documents[invoice_id] = text
+        for gram in ngrams(text):
+            self._postings[gram].add(invoice_id)
+
+    def remove(self, invoice_ids):
+        """削除された請求書をインデックスから外す"""
+        with self._lock:
+            for invoice_id in invoice_ids:
+                old = self._documents.pop(invoice_id, None)
+                if old is None:
+                    continue
+                for gram in ngrams(old):
+                    self._postings[gram].discard(invoice_id)
+
+    def refresh(self):
+        from .models import InvoiceSearchDocument
+
+        qs = InvoiceSearchDocument.objects.all()
+        if self._synced_at is not None:
+            # 同一時刻の更新を取りこぼさないよう境界を含める（再適用は冪等）
+            qs = qs.filter(updated_at__gte=self._synced_at)
+        rows = list(qs.values_list('invoice_id', 'document', 'updated_at'))
+        with self._lock:
+            for invoice_id, text, updated_at in rows:
+                self._put(invoice_id, text)
+                if self._synced_at is None or updated_at > self._synced_at:
+                    self._synced_at = updated_at
+
+        # 他プロセスでの削除・クエリセットでの一括削除は updated_at では追えないため、
+        # 件数が減っていたら残っている請求書IDと突き合わせて外す
+        if InvoiceSearchDocument.objects.count() < len(self._documents):
+            existing = set(InvoiceSearchDocument.objects.values_list('invoice_id', flat=True))
+            self.remove([invoice_id for invoice_id in list(self._documents) if invoice_id not in existing])
+
+    def search(self, terms):
+        """{invoice_id: score} を返す（全検索語を含むもののみ）"""
+        self.refresh()
+        with self._lock:
+            candidates = None
+            for term in terms:
+                grams = ngrams(term)
+                if len(term) < NGRAM_SIZE:
+                    # 1文字の検索語はバイグラムで引けないため全件照合
+                    matched = set(self._documents)
+                else:
+                    matched = set.intersection(*(self._postings.get(g, set()) for g in grams))
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    return {}
+
+            scores = {}
+            for invoice_id in candidates:
+                text = self._documents[invoice_id]
+                if not all(term in text for term in terms):
+                    continue
+                # 出現回数 × 語長を、文書長で緩やかに正規化
+                hits = sum(text.count(term) * len(term) for term in terms)
+                scores[invoice_id] = hits / (len(text) ** 0.5)
+            return scores
+
+
+ngram_index = NgramIndex()
+
+
+def uses_trigram_index():
+    return connection.vendor == 'postgresql'
+
+
+def search_invoices(queryset, query):
+    """
+    請求書クエリセットを検索語で絞り込み、search_rank（関連度）を付与して返す
+    """
+    terms = split_terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    if uses_trigram_index():
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        for term in terms:
+            queryset = queryset.filter(search_document__document__contains=term)
+        return queryset.annotate(
+            search_rank=TrigramWordSimilarity(' '.join(terms), 'search_document__document')
+        )
+
+    scores = ngram_index.search(terms)
+    if not scores:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    # 見えない請求書（他社分など）で上限の枠を埋めないよう、クエリセットに含まれるものだけを上位から取る
+    ranked = []
+    candidates = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    for start in range(0, len(candidates), MAX_FALLBACK_RESULTS):
+        chunk = candidates[start:start + MAX_FALLBACK_RESULTS]
+        visible = set(queryset.filter(id__in=[invoice_id for invoice_id, _ in chunk]).values_list('id', flat=True))
+        ranked += [(invoice_id, score) for invoice_id, score in chunk if invoice_id in visible]
+        if len(ranked) >= MAX_FALLBACK_RESULTS:
+            break
+    ranked = ranked[:MAX_FALLBACK_RESULTS]
+    if not ranked:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    return queryset.filter(id__in=[invoice_id for invoice_id, _ in ranked]).annotate(
+        search_rank=Case(
+            *[When(id=invoice_id, then=Value(score)) for invoice_id, score in ranked],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
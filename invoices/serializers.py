@@ -24,7 +24,7 @@ from .models import (
     PaymentCalendar,
     DeadlineNotificationBanner,
     # Phase 6追加
-    AuditLog
+    AuditLog, PDFExportJob, AuditArchive
 )
 
 User = get_user_model()
@@ -177,13 +177,13 @@ class InvoiceCommentSerializer(serializers.ModelSerializer):
     def get_replies(self, obj):
         """直接の返信コメントを取得"""
         # 再帰を防ぐため、1レベルのみ
-        if obj.parent_comment is None:  # ルートコメントのみ返信を取得
+        if obj.parent_comment_id is None:  # ルートコメントのみ返信を取得
             replies = obj.replies.all()
             return InvoiceCommentSerializer(replies, many=True, context=self.context).data
         return []
     
     def get_is_reply(self, obj):
-        return obj.parent_comment is not None
+        return obj.parent_comment_id is not None
 
 
 class ApprovalHistorySerializer(serializers.ModelSerializer):
@@ -638,7 +638,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'approval_route', 'approval_route_detail',
             'current_approval_step', 'current_step_name',
             'current_approver', 'current_approver_name', 'current_approver_email',
-            'construction_site_supervisor_id',
+            'construction_site_supervisor_id', 'approval_supervisor',
             'created_by', 'created_by_name',
             'created_at', 'updated_at',
             'comments', 'approval_histories',
@@ -651,7 +651,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             'id', 'invoice_number', 'subtotal', 'tax_amount', 'total_amount',
-            'created_by', 'created_at', 'updated_at'
+            'created_by', 'created_at', 'updated_at', 'approval_supervisor'
         ]
     
     def get_construction_site_name_display(self, obj):
@@ -1376,4 +1376,32 @@ class AuditLogSerializer(serializers.ModelSerializer):
             'target_model', 'target_id', 'target_label',
             'details', 'ip_address', 'user_agent', 'created_at'
         ]
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+
+class AuditArchiveSerializer(serializers.ModelSerializer):
+    """アクセスログ・操作ログのアーカイブ台帳"""
+    table_name_display = serializers.CharField(source='get_table_name_display', read_only=True)
+
+    class Meta:
+        model = AuditArchive
+        fields = [
+            'id', 'table_name', 'table_name_display', 'year_month', 'part',
+            'row_count', 'file_size', 'sha256', 'first_logged_at', 'last_logged_at',
+            'retain_until', 'archived_at'
+        ]
+        read_only_fields = fields
+
+
+class PDFExportJobSerializer(serializers.ModelSerializer):
+    """請求書PDF一括出力ジョブ"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    requested_by_name = serializers.CharField(source='requested_by.get_full_name', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = PDFExportJob
+        fields = [
+            'id', 'status', 'status_display', 'total', 'processed', 'file_size', 'error',
+            'requested_by', 'requested_by_name', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
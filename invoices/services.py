@@ -5,22 +5,35 @@ KEYRON BIM - サービス層
 """
 
 import csv
+import gzip
+import hashlib
 import io
+import json
+import os
+import tempfile
 from datetime import datetime, timedelta
 from decimal import Decimal
+from pathlib import Path
 from typing import Optional, List, Dict, Any
 
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.utils import timezone
-from django.db.models import Sum, Count, Q, F
-from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Sum, Count, Q, F, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
 
+from . import audit
 from .models import (
     Invoice, InvoiceItem, User, CustomerCompany, ConstructionSite,
     SystemNotification, AccessLog, AuditLog, MonthlyInvoicePeriod, SafetyFee,
-    InvoiceChangeHistory, ApprovalHistory, InvoiceCorrection
+    InvoiceChangeHistory, ApprovalHistory, InvoiceCorrection, ApprovalInbox,
+    ApprovalStep, EmailOutbox, PDFExportJob, BatchApprovalSchedule, AuditArchive,
+    InvoiceMonthlyRollup, CompanyMonthlyRollup, CustomerMonthlyRollup, SiteMonthlyRollup,
 )
 
 
@@ -39,25 +52,14 @@ class EmailService:
         html_message: Optional[str] = None,
         related_invoice: Optional[Invoice] = None
     ) -> bool:
-        """通知メールを送信"""
+        """通知メールを送信キューに登録（実際の送信は send_outbox_emails コマンド）"""
         try:
-            if html_message:
-                email = EmailMultiAlternatives(
-                    subject=f"{settings.EMAIL_SUBJECT_PREFIX}{subject}",
-                    body=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=[recipient.email]
-                )
-                email.attach_alternative(html_message, "text/html")
-                email.send()
-            else:
-                send_mail(
-                    subject=f"{settings.EMAIL_SUBJECT_PREFIX}{subject}",
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[recipient.email],
-                    fail_silently=False
-                )
+            EmailOutbox.enqueue(
+                to_email=recipient.email,
+                subject=subject,
+                body=message,
+                html_body=html_message or '',
+            )
             
             # システム通知も作成
             SystemNotification.objects.create(
@@ -74,6 +76,67 @@ class EmailService:
             print(f"メール送信エラー: {e}")
             return False
     
+    @staticmethod
+    def deliver_outbox(batch_size: int = 100) -> Dict[str, int]:
+        """
+        送信キューから送信待ちのメールをまとめて送信
+        - 送信対象は行ロック（SKIP LOCKED）で確保し、複数ワーカーでも二重送信しない
+        - 1バッチにつき SMTP 接続は1本
+        - 失敗したメールは間隔を延ばして再試行（上限回数で failed）
+        - 件名の EMAIL_SUBJECT_PREFIX は送信時にここで付ける（キューには付けずに登録する）
+        """
+        with transaction.atomic():
+            messages = list(
+                EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=timezone.now())
+                .order_by('next_attempt_at', 'id')
+                .select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not messages:
+                return {'sent': 0, 'failed': 0}
+            
+            sent = failed = 0
+            connection = get_connection()
+            try:
+                connection.open()
+            except Exception as e:
+                # 接続できない場合はバッチ全体を再試行に回す
+                for message in messages:
+                    message.mark_failed(e)
+                EmailOutbox.objects.bulk_update(messages, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+                return {'sent': 0, 'failed': len(messages)}
+            
+            prefix = settings.EMAIL_SUBJECT_PREFIX
+            try:
+                for message in messages:
+                    # 以前の登録分は接頭辞付きでキューに入っているため二重に付けない
+                    subject = message.subject if message.subject.startswith(prefix) else f'{prefix}{message.subject}'
+                    email = EmailMultiAlternatives(
+                        subject=subject,
+                        body=message.body,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        to=[message.to_email],
+                        connection=connection,
+                    )
+                    if message.html_body:
+                        email.attach_alternative(message.html_body, "text/html")
+                    try:
+                        email.send()
+                    except Exception as e:
+                        message.mark_failed(e)
+                        failed += 1
+                    else:
+                        message.status = 'sent'
+                        message.sent_at = timezone.now()
+                        message.attempts += 1
+                        sent += 1
+            finally:
+                connection.close()
+            
+            EmailOutbox.objects.bulk_update(
+                messages, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+            )
+        return {'sent': sent, 'failed': failed}
+    
     @classmethod
     def send_submission_notification(cls, invoice: Invoice):
         """請求書提出通知"""
@@ -248,8 +311,11 @@ class AuditLogService:
         user_agent: str = '',
         details: Dict = None
     ):
-        """監査ログを AuditLog テーブルに記録（旧実装が AccessLog に書いていたバグを修正）"""
-        return AuditLog.objects.create(
+        """
+        監査ログを AuditLog テーブルに記録（旧実装が AccessLog に書いていたバグを修正）
+        リクエスト中はレスポンス送信後にまとめて書き込む（invoices.audit）
+        """
+        entry = AuditLog(
             user=user,
             action=cls._normalize_action(action),
             target_model=resource_type,
@@ -259,6 +325,8 @@ class AuditLogService:
             user_agent=user_agent or '',
             details=details or {}
         )
+        audit.record(entry)
+        return entry
     
     @staticmethod
     def get_client_info(request) -> Dict:
@@ -278,7 +346,7 @@ class AuditLogService:
     def log_invoice_action(cls, request, invoice: Invoice, action: str, details: Dict = None):
         """請求書関連のアクションをログ"""
         client_info = cls.get_client_info(request)
-        return AuditLog.objects.create(
+        entry = AuditLog(
             user=request.user,
             action=cls._normalize_action(action),
             target_model='Invoice',
@@ -292,15 +360,258 @@ class AuditLogService:
                 **(details or {})
             }
         )
+        audit.record(entry)
+        return entry
+
+
+class AuditArchiveService:
+    """
+    アクセスログ・操作ログの月別パーティションとアーカイブ
+    - PostgreSQL では access_logs / audit_logs を日時の月別レンジパーティションにしている（migration 0045）。
+      どの月にも当たらないログは既定パーティション（<テーブル名>_default）に入る
+    - archive_month() は1か月分のログを gzip 圧縮の JSON Lines に書き出し、件数と SHA-256 を
+      台帳（AuditArchive）に記録してからホットテーブルから消す（パーティションがあれば DROP）
+    - SQLite（開発用）はパーティションを使わず、書き出した行を DELETE する
+    - アーカイブファイルは電子取引データの保存規程の法定保存期間（retain_until）まで削除しない
+    """
+    TABLES = {
+        'access_logs': (AccessLog, 'timestamp'),
+        'audit_logs': (AuditLog, 'created_at'),
+    }
+    CHUNK_SIZE = 2000
+
+    @staticmethod
+    def shift_month(year_month: int, months: int) -> int:
+        index = (year_month // 100) * 12 + (year_month % 100 - 1) + months
+        return (index // 12) * 100 + index % 12 + 1
+
+    @classmethod
+    def month_range(cls, year_month: int):
+        """対象年月の [月初, 翌月初)（ローカル時刻）"""
+        next_month = cls.shift_month(year_month, 1)
+        return (
+            timezone.make_aware(datetime(year_month // 100, year_month % 100, 1)),
+            timezone.make_aware(datetime(next_month // 100, next_month % 100, 1)),
+        )
+
+    @staticmethod
+    def partition_name(table: str, year_month: int) -> str:
+        return f'{table}_y{year_month // 100}m{year_month % 100:02d}'
+
+    @staticmethod
+    def _table_exists(name: str) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            return cursor.fetchone()[0] is not None
+
+    @staticmethod
+    def is_partitioned(table: str) -> bool:
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+                'WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace',
+                [table]
+            )
+            return cursor.fetchone() is not None
+
+    @classmethod
+    def ensure_partitions(cls, months_ahead: int = 3) -> Dict[str, List[str]]:
+        """
+        PostgreSQL: 今月から months_ahead か月先までのパーティションを作成
+        {'created': [...], 'skipped': [...]} を返す（既定パーティションに同じ月のログが入っている月は作れないため skipped）
+        """
+        result = {'created': [], 'skipped': []}
+        this_month = int(timezone.localdate().strftime('%Y%m'))
+        qn = connection.ops.quote_name
+        for table, (model, column) in cls.TABLES.items():
+            if not cls.is_partitioned(table):
+                continue
+            for offset in range(months_ahead + 1):
+                year_month = cls.shift_month(this_month, offset)
+                name = cls.partition_name(table, year_month)
+                if cls._table_exists(name):
+                    continue
+                start, end = cls.month_range(year_month)
+                if model.objects.filter(**{f'{column}__gte': start, f'{column}__lt': end}).exists():
+                    result['skipped'].append(name)
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} '
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    )
+                result['created'].append(name)
+        return result
+
+    @classmethod
+    def months_to_archive(cls, table: str, keep_months: int) -> List[int]:
+        """保持期間（今月を含めて keep_months か月）より前でログが残っている月"""
+        model, column = cls.TABLES[table]
+        cutoff = cls.shift_month(int(timezone.localdate().strftime('%Y%m')), -(keep_months - 1))
+        oldest = model.objects.filter(
+            **{f'{column}__lt': cls.month_range(cutoff)[0]}
+        ).aggregate(oldest=Min(column))['oldest']
+        if oldest is None:
+            return []
+        months = []
+        year_month = int(timezone.localtime(oldest).strftime('%Y%m'))
+        while year_month < cutoff:
+            months.append(year_month)
+            year_month = cls.shift_month(year_month, 1)
+        return months
+
+    @classmethod
+    def archive_month(cls, table: str, year_month: int, retention_years: Optional[int] = None) -> Optional[AuditArchive]:
+        """1か月分のログをアーカイブしてホットテーブルから消す（ログが無ければ None）"""
+        model, column = cls.TABLES[table]
+        start, end = cls.month_range(year_month)
+        if retention_years is None:
+            retention_years = getattr(settings, 'AUDIT_ARCHIVE_RETENTION_YEARS', 7)
+        partition = cls.partition_name(table, year_month)
+        if not (cls.is_partitioned(table) and cls._table_exists(partition)):
+            partition = None
+
+        directory = Path(settings.AUDIT_ARCHIVE_DIR) / table / str(year_month // 100)
+        directory.mkdir(parents=True, exist_ok=True)
+        with transaction.atomic():
+            if partition:
+                # 書き出し中にこの月へ書き込まれたログを、書き出さずに DROP しないようにする
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE {connection.ops.quote_name(partition)} IN EXCLUSIVE MODE')
+
+            part = (AuditArchive.objects.filter(
+                table_name=table, year_month=year_month
+            ).aggregate(last=Max('part'))['last'] or 0) + 1
+            path = directory / f'{table}_{year_month}_{part}.jsonl.gz'
+            rows = model.objects.filter(
+                **{f'{column}__gte': start, f'{column}__lt': end}
+            ).order_by('pk').values()
+
+            ids = []
+            first_logged_at = last_logged_at = None
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='wb') as archive_file:
+                        for row in rows.iterator(chunk_size=cls.CHUNK_SIZE):
+                            archive_file.write(
+                                (json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
+                            )
+                            ids.append(row['id'])
+                            logged_at = row[column]
+                            if first_logged_at is None or logged_at < first_logged_at:
+                                first_logged_at = logged_at
+                            if last_logged_at is None or logged_at > last_logged_at:
+                                last_logged_at = logged_at
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                if not ids:
+                    os.unlink(tmp_path)
+                    return None
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+            archive = AuditArchive.objects.create(
+                table_name=table,
+                year_month=year_month,
+                part=part,
+                file_path=str(path),
+                row_count=len(ids),
+                file_size=path.stat().st_size,
+                sha256=cls.checksum(path),
+                first_logged_at=first_logged_at,
+                last_logged_at=last_logged_at,
+                retain_until=end.date().replace(year=end.year + retention_years) - timedelta(days=1),
+            )
+            if cls.count_rows(path) != archive.row_count:
+                raise RuntimeError(f'アーカイブの件数が一致しません: {path}')
+
+            if partition:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE {connection.ops.quote_name(partition)}')
+            else:
+                for offset in range(0, len(ids), cls.CHUNK_SIZE):
+                    model.objects.filter(pk__in=ids[offset:offset + cls.CHUNK_SIZE]).delete()
+        return archive
+
+    @staticmethod
+    def checksum(path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def count_rows(path) -> int:
+        with gzip.open(path, 'rb') as f:
+            return sum(1 for _ in f)
+
+    @classmethod
+    def verify(cls, archive: AuditArchive) -> bool:
+        """アーカイブファイルが存在し、SHA-256 が台帳と一致するか"""
+        path = Path(archive.file_path)
+        return path.exists() and cls.checksum(path) == archive.sha256
+
+    @staticmethod
+    def read(archive: AuditArchive):
+        """アーカイブのログを1行ずつ dict で返す"""
+        with gzip.open(archive.file_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
 
 
 # ====================
 # CSV出力サービス
 # ====================
 
+class _EchoBuffer:
+    """csv.writer の書き込み先（書いた1行をそのまま返す）"""
+    
+    def write(self, value):
+        return value
+
+
 class CSVExportService:
     """CSV出力サービス"""
     
+    # DBから1回に取得する行数（PostgreSQL ではサーバーサイドカーソルで順次取得）
+    ITERATOR_CHUNK_SIZE = 2000
+    # 1回に送出する行数
+    STREAM_ROWS_PER_CHUNK = 500
+    
+    @classmethod
+    def stream_csv(cls, header, rows):
+        """
+        CSVを少しずつ UTF-8 のバイト列で生成（Excel 用の BOM は先頭に1回だけ）
+        rows はイテレータのまま1行ずつ処理するため、件数によらずメモリ使用量は一定
+        """
+        writer = csv.writer(_EchoBuffer())
+        yield '\ufeff'.encode('utf-8') + writer.writerow(header).encode('utf-8')
+        
+        buffer = []
+        for row in rows:
+            buffer.append(writer.writerow(row))
+            if len(buffer) >= cls.STREAM_ROWS_PER_CHUNK:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
+    
+    @classmethod
+    def streaming_response(cls, filename: str, header, rows) -> StreamingHttpResponse:
+        """CSVをストリーミングで返すレスポンス"""
+        response = StreamingHttpResponse(
+            cls.stream_csv(header, rows), content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
     @staticmethod
     def _safe_str(value, default=''):
         """安全に文字列変換"""
@@ -318,71 +629,54 @@ class CSVExportService:
         except (ValueError, TypeError):
             return default
     
-    @staticmethod
+    INVOICE_HEADER = [
+        '請求書番号', '協力会社', '工事現場', '工種', '請求日',
+        '小計', '消費税', '合計金額', '協力会費', '差引支払額',
+        'ステータス', '作成日', '作成者'
+    ]
+    
+    INVOICE_COLUMNS = (
+        'invoice_number', 'customer_company__name', 'construction_site__name',
+        'construction_type__name', 'invoice_date',
+        'subtotal', 'tax_amount', 'total_amount', 'safety_cooperation_fee',
+        'status', 'created_at', 'created_by__first_name', 'created_by__last_name',
+    )
+    
+    @classmethod
+    def invoice_rows(cls, queryset):
+        """請求書一覧の行（モデルを生成せず values_list のタプルから組み立てる）"""
+        status_display = dict(Invoice.STATUS_CHOICES)
+        for (invoice_number, company_name, site_name, type_name, invoice_date,
+             subtotal, tax_amount, total_amount, safety_fee,
+             status, created_at, first_name, last_name) in (
+            queryset.values_list(*cls.INVOICE_COLUMNS).iterator(chunk_size=cls.ITERATOR_CHUNK_SIZE)
+        ):
+            total = cls._safe_number(total_amount)
+            fee = cls._safe_number(safety_fee)
+            yield [
+                cls._safe_str(invoice_number),
+                company_name or '',
+                site_name or '',
+                type_name or '',
+                invoice_date.strftime('%Y/%m/%d') if invoice_date else '',
+                cls._safe_number(subtotal),
+                cls._safe_number(tax_amount),
+                total,
+                fee,
+                total - fee,
+                status_display.get(status, ''),
+                created_at.strftime('%Y/%m/%d %H:%M') if created_at else '',
+                f'{first_name or ""} {last_name or ""}'.strip(),
+            ]
+    
+    @classmethod
     def export_invoices(
+        cls,
         queryset,
         filename: str = 'invoices.csv'
-    ) -> HttpResponse:
-        """請求書一覧をCSV出力"""
-        response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        writer = csv.writer(response)
-        
-        # ヘッダー
-        writer.writerow([
-            '請求書番号', '協力会社', '工事現場', '工種', '請求日',
-            '小計', '消費税', '合計金額', '協力会費', '差引支払額',
-            'ステータス', '作成日', '作成者'
-        ])
-        
-        # データ
-        for invoice in queryset:
-            try:
-                total = CSVExportService._safe_number(invoice.total_amount)
-                safety_fee = CSVExportService._safe_number(
-                    getattr(invoice, 'safety_cooperation_fee', 0)
-                )
-                net_amount = total - safety_fee
-                
-                # 関連オブジェクトの安全な取得
-                company_name = ''
-                if invoice.customer_company:
-                    company_name = getattr(invoice.customer_company, 'name', '')
-                
-                site_name = ''
-                if invoice.construction_site:
-                    site_name = getattr(invoice.construction_site, 'name', '')
-                
-                type_name = ''
-                if hasattr(invoice, 'construction_type') and invoice.construction_type:
-                    type_name = getattr(invoice.construction_type, 'name', '')
-                
-                creator_name = ''
-                if invoice.created_by:
-                    creator_name = invoice.created_by.get_full_name() or ''
-                
-                writer.writerow([
-                    CSVExportService._safe_str(invoice.invoice_number),
-                    company_name,
-                    site_name,
-                    type_name,
-                    invoice.invoice_date.strftime('%Y/%m/%d') if invoice.invoice_date else '',
-                    CSVExportService._safe_number(invoice.subtotal),
-                    CSVExportService._safe_number(invoice.tax_amount),
-                    total,
-                    safety_fee,
-                    net_amount,
-                    invoice.get_status_display() if hasattr(invoice, 'get_status_display') else '',
-                    invoice.created_at.strftime('%Y/%m/%d %H:%M') if invoice.created_at else '',
-                    creator_name
-                ])
-            except Exception as e:
-                # エラーが発生した行はスキップするか、エラー情報を記録
-                print(f"CSV行出力エラー (Invoice {getattr(invoice, 'id', 'unknown')}): {e}")
-                continue
-        
-        return response
+    ) -> StreamingHttpResponse:
+        """請求書一覧をCSV出力（ストリーミング）"""
+        return cls.streaming_response(filename, cls.INVOICE_HEADER, cls.invoice_rows(queryset))
     
     @staticmethod
     def export_monthly_summary(year: int, month: int = None) -> HttpResponse:
@@ -405,17 +699,10 @@ class CSVExportService:
         
         # クエリ
         invoices = Invoice.objects.filter(
+            Invoice.accounting_period_q(year, month),
             status__in=['approved', 'paid', 'payment_preparing']
         )
         
-        if month:
-            invoices = invoices.filter(
-                invoice_date__year=year,
-                invoice_date__month=month
-            )
-        else:
-            invoices = invoices.filter(invoice_date__year=year)
-        
         # 集計
         summary = invoices.values(
             'customer_company__name',
@@ -465,17 +752,10 @@ class CSVExportService:
         
         # クエリ
         invoices = Invoice.objects.filter(
+            Invoice.accounting_period_q(year, month),
             status__in=['approved', 'paid', 'payment_preparing']
         )
         
-        if month:
-            invoices = invoices.filter(
-                invoice_date__year=year,
-                invoice_date__month=month
-            )
-        else:
-            invoices = invoices.filter(invoice_date__year=year)
-        
         # 集計
         summary = invoices.values(
             'customer_company__name',
@@ -522,17 +802,10 @@ class CSVExportService:
         
         # クエリ
         invoices = Invoice.objects.filter(
+            Invoice.accounting_period_q(year, month),
             status__in=['approved', 'paid', 'payment_preparing']
         )
         
-        if month:
-            invoices = invoices.filter(
-                invoice_date__year=year,
-                invoice_date__month=month
-            )
-        else:
-            invoices = invoices.filter(invoice_date__year=year)
-        
         # 集計
         summary = invoices.values(
             'construction_site__id',
@@ -615,6 +888,375 @@ class CSVExportService:
         return response
 
 
+# ====================
+# Excel出力サービス
+# ====================
+
+class ExcelExportService:
+    """
+    Excel(.xlsx)出力サービス
+    - openpyxl の write_only ブックに1行ずつ書き込み、書き終えた行はメモリに残さない
+    - 書式は名前付きスタイルとして1回だけ登録し、セルには名前で割り当てる
+    - 保存先は一時ファイル（FileResponse で分割して送信）
+    """
+    CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    
+    # 列構成は CSV 出力と同じ
+    INVOICE_HEADER = CSVExportService.INVOICE_HEADER
+    INVOICE_COLUMN_WIDTHS = [16, 22, 22, 14, 12, 12, 10, 13, 10, 13, 12, 17, 14]
+    # 金額列（0始まりの列番号）
+    INVOICE_AMOUNT_COLUMNS = range(5, 10)
+    
+    INVOICE_COLUMNS = (
+        'invoice_number', 'customer_company__name',
+        'construction_site__name', 'construction_site_name',
+        'construction_type__name', 'construction_type_other', 'invoice_date',
+        'subtotal', 'tax_amount', 'total_amount', 'safety_cooperation_fee',
+        'status', 'created_at', 'created_by__first_name', 'created_by__last_name',
+    )
+    
+    @staticmethod
+    def _named_styles():
+        """ヘッダー・金額セル用の名前付きスタイル"""
+        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+        
+        thin = Side(style='thin', color='D0D0D0')
+        border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        
+        header = NamedStyle(name='invoice_header')
+        header.fill = PatternFill('solid', fgColor='2F5496')
+        header.font = Font(color='FFFFFF', bold=True)
+        header.alignment = Alignment(horizontal='center', vertical='center')
+        header.border = border
+        
+        amount = NamedStyle(name='invoice_amount')
+        amount.number_format = '#,##0'
+        amount.border = border
+        return header, amount
+    
+    @classmethod
+    def invoice_rows(cls, queryset):
+        """請求書一覧の行（values_list のタプルを順次取得）"""
+        status_display = dict(Invoice.STATUS_CHOICES)
+        for (invoice_number, company_name, site_name, site_name_text,
+             type_name, type_other, invoice_date,
+             subtotal, tax_amount, total_amount, safety_fee,
+             status, created_at, first_name, last_name) in (
+            queryset.values_list(*cls.INVOICE_COLUMNS)
+            .iterator(chunk_size=CSVExportService.ITERATOR_CHUNK_SIZE)
+        ):
+            safety = safety_fee or 0
+            yield [
+                invoice_number,
+                company_name or '',
+                site_name or site_name_text or '',
+                type_name or type_other or '',
+                invoice_date.strftime('%Y/%m/%d') if invoice_date else '',
+                int(subtotal or 0), int(tax_amount or 0), int(total_amount or 0),
+                int(safety), int((total_amount or 0) - safety),
+                status_display.get(status, ''),
+                created_at.strftime('%Y/%m/%d %H:%M') if created_at else '',
+                f'{first_name or ""} {last_name or ""}'.strip(),
+            ]
+    
+    @classmethod
+    def write_invoices(cls, rows, fileobj):
+        """請求書一覧の行を xlsx として fileobj に書き込む"""
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+        
+        wb = Workbook(write_only=True)
+        header_style, amount_style = cls._named_styles()
+        wb.add_named_style(header_style)
+        wb.add_named_style(amount_style)
+        
+        ws = wb.create_sheet('請求書一覧')
+        # write_only では列幅は行を書く前に設定する
+        for i, width in enumerate(cls.INVOICE_COLUMN_WIDTHS, 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+        
+        header_cells = []
+        for title in cls.INVOICE_HEADER:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.style = header_style.name
+            header_cells.append(cell)
+        ws.append(header_cells)
+        
+        amount_columns = set(cls.INVOICE_AMOUNT_COLUMNS)
+        for row in rows:
+            for i in amount_columns:
+                cell = WriteOnlyCell(ws, value=row[i])
+                cell.style = amount_style.name
+                row[i] = cell
+            ws.append(row)
+        
+        wb.save(fileobj)
+    
+    @classmethod
+    def export_invoices(cls, queryset, filename: str) -> FileResponse:
+        """請求書一覧をExcel出力（一時ファイル経由で送信）"""
+        tmp = tempfile.TemporaryFile()
+        try:
+            cls.write_invoices(cls.invoice_rows(queryset), tmp)
+        except Exception:
+            tmp.close()
+            raise
+        tmp.seek(0)
+        # FileResponse が送信後に一時ファイルを閉じる（閉じると削除される）
+        return FileResponse(tmp, as_attachment=True, filename=filename, content_type=cls.CONTENT_TYPE)
+
+
+# ====================
+# 請求書PDFキャッシュ
+# ====================
+
+class InvoicePDFCache:
+    """
+    請求書PDFのレンダリング結果キャッシュ（ディスク保存）
+    - キーは描画内容のハッシュ（invoice_pdf_fingerprint）。内容が変わらない限り再描画しない
+    - ファイル名は {請求書ID}-{ハッシュ}.pdf。請求書の保存時と新しい版の書き込み時に古い版を削除
+    - 合計サイズが上限を超えたら最終利用日時（mtime）の古いものから削除（LRU）
+    """
+    
+    @staticmethod
+    def _directory() -> Path:
+        return Path(settings.INVOICE_PDF_CACHE_DIR)
+    
+    @classmethod
+    def _path(cls, invoice_id, fingerprint: str) -> Path:
+        return cls._directory() / f'{invoice_id}-{fingerprint}.pdf'
+    
+    @staticmethod
+    def fingerprint(invoice) -> str:
+        from .pdf_generator import invoice_pdf_fingerprint
+        return invoice_pdf_fingerprint(invoice)
+    
+    @classmethod
+    def get_or_render(cls, invoice, fingerprint: str):
+        """
+        キャッシュ済みPDFを開く（無ければ描画して保存）
+        Returns: (ファイルオブジェクト, 再描画したか)
+        """
+        path = cls._path(invoice.pk, fingerprint)
+        try:
+            fileobj = open(path, 'rb')
+        except FileNotFoundError:
+            pass
+        else:
+            # LRU 用に最終利用日時を更新（削除と競合しても開いたファイルは読める）
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return fileobj, False
+        
+        from .pdf_generator import generate_invoice_pdf
+        content = generate_invoice_pdf(invoice).getvalue()
+        cls._store(invoice.pk, path, content)
+        return io.BytesIO(content), True
+    
+    @classmethod
+    def _store(cls, invoice_id, path: Path, content: bytes):
+        directory = cls._directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        # 書きかけのファイルを読まれないよう一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(content)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        cls.invalidate(invoice_id, keep=path.name)
+        cls.evict()
+    
+    @classmethod
+    def invalidate(cls, invoice_id, keep: Optional[str] = None):
+        """請求書のキャッシュ済みPDFを削除（keep に指定したファイルは残す）"""
+        for path in cls._directory().glob(f'{invoice_id}-*.pdf'):
+            if path.name != keep:
+                path.unlink(missing_ok=True)
+    
+    @classmethod
+    def evict(cls):
+        """合計サイズが上限以下になるまで最終利用日時の古いものから削除"""
+        entries = []
+        total = 0
+        for path in cls._directory().glob('*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        max_bytes = settings.INVOICE_PDF_CACHE_MAX_BYTES
+        if total <= max_bytes:
+            return
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= max_bytes:
+                break
+
+
+# ====================
+# 請求書PDF一括出力（ZIP）
+# ====================
+
+def _render_invoice_pdf(invoice_id):
+    """
+    請求書PDFを1件描画して (ZIP内のファイル名, PDFデータ) を返す（プロセスプールの子プロセスで実行）
+    描画済みのPDFは InvoicePDFCache から読み出す。削除済みの請求書は None。
+    """
+    invoice = Invoice.objects.select_related('receiving_company', 'customer_company').filter(pk=invoice_id).first()
+    if invoice is None:
+        return None
+    fileobj, _ = InvoicePDFCache.get_or_render(invoice, InvoicePDFCache.fingerprint(invoice))
+    with fileobj:
+        return f'invoice_{invoice.invoice_number or invoice.pk}.pdf', fileobj.read()
+
+
+def _init_pdf_worker():
+    """プロセスプールの子プロセスの初期化（spawn 方式でも Django を使えるようにする）"""
+    import django
+    django.setup()
+
+
+class PDFExportService:
+    """
+    請求書PDFの一括出力
+    - API は PDFExportJob を登録するだけで、描画は run_pdf_export_jobs コマンドが行う（Webワーカーを塞がない）
+    - 描画はプロセスプールで並列に行い、終わった順に ZIP へ書き込む（PDFを全件メモリに溜めない）
+    - ワーカーが落ちて処理中のまま残ったジョブは失敗にし、保存期間を過ぎた ZIP は削除する（cleanup）
+    """
+    # 処理済み件数を更新する間隔（件）
+    PROGRESS_INTERVAL = 20
+    STALE_JOB_ERROR = '処理中にワーカーが停止したため中断しました。再度出力してください'
+    
+    @staticmethod
+    def create_job(user: User, invoice_ids) -> PDFExportJob:
+        invoice_ids = list(invoice_ids)
+        return PDFExportJob.objects.create(requested_by=user, invoice_ids=invoice_ids, total=len(invoice_ids))
+    
+    @staticmethod
+    def _claim_job() -> Optional[PDFExportJob]:
+        """待機中のジョブを1件確保（SKIP LOCKED で複数ワーカーでも二重処理しない）"""
+        with transaction.atomic():
+            job = (
+                PDFExportJob.objects.filter(status='pending')
+                .order_by('created_at', 'id')
+                .select_for_update(skip_locked=True)
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = 'running'
+            job.started_at = timezone.now()
+            job.save(update_fields=['status', 'started_at'])
+        return job
+    
+    @classmethod
+    def run_next(cls, processes: int = 2) -> Optional[PDFExportJob]:
+        """
+        待機中のジョブを1件処理する（無ければ None）
+        processes=0 の場合はプロセスプールを使わずに同じプロセスで描画する
+        """
+        job = cls._claim_job()
+        if job is None:
+            return None
+        
+        directory = Path(settings.PDF_EXPORT_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'invoices_{job.pk}.zip'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                cls._write_zip(job, tmp, processes)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            job.status = 'failed'
+            job.error = str(e)[:2000]
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'finished_at'])
+            return job
+        
+        job.status = 'done'
+        job.processed = job.total
+        job.file_path = str(path)
+        job.file_size = path.stat().st_size
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'processed', 'file_path', 'file_size', 'finished_at'])
+        return job
+    
+    @classmethod
+    def cleanup(cls) -> Dict[str, int]:
+        """
+        - 開始から PDF_EXPORT_JOB_TIMEOUT_MINUTES を過ぎても処理中のジョブを失敗にする
+          （描画中のワーカーが落ちると running のまま残り、利用者が待ち続けるため）
+        - 完了から PDF_EXPORT_RETENTION_HOURS を過ぎた ZIP と、落ちたワーカーの書きかけの一時ファイルを削除する
+        """
+        now = timezone.now()
+        timeout = timedelta(minutes=settings.PDF_EXPORT_JOB_TIMEOUT_MINUTES)
+        stale = PDFExportJob.objects.filter(status='running', started_at__lt=now - timeout).update(
+            status='failed', error=cls.STALE_JOB_ERROR, finished_at=now,
+        )
+
+        expired_jobs = list(
+            PDFExportJob.objects.filter(
+                status='done', finished_at__lt=now - timedelta(hours=settings.PDF_EXPORT_RETENTION_HOURS),
+            ).exclude(file_path='').values_list('pk', 'file_path')
+        )
+        for _, file_path in expired_jobs:
+            Path(file_path).unlink(missing_ok=True)
+        PDFExportJob.objects.filter(pk__in=[pk for pk, _ in expired_jobs]).update(file_path='', file_size=None)
+
+        directory = Path(settings.PDF_EXPORT_DIR)
+        if directory.exists():
+            cutoff = (now - timeout).timestamp()
+            for tmp_path in directory.glob('*.tmp'):
+                try:
+                    if tmp_path.stat().st_mtime < cutoff:
+                        tmp_path.unlink()
+                except FileNotFoundError:
+                    pass
+        return {'stale': stale, 'expired': len(expired_jobs)}
+
+    @classmethod
+    def _write_zip(cls, job: PDFExportJob, fileobj, processes: int):
+        import zipfile
+        from concurrent.futures import ProcessPoolExecutor
+        from django.db import connections
+        
+        # PDFは圧縮済みのため ZIP では再圧縮しない
+        with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED) as archive:
+            if processes > 0:
+                # 親プロセスのDB接続を子プロセスに引き継がない
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=processes, initializer=_init_pdf_worker) as executor:
+                    cls._add_results(job, archive, executor.map(_render_invoice_pdf, job.invoice_ids, chunksize=4))
+            else:
+                cls._add_results(job, archive, map(_render_invoice_pdf, job.invoice_ids))
+    
+    @classmethod
+    def _add_results(cls, job: PDFExportJob, archive, results):
+        names = set()
+        for processed, result in enumerate(results, 1):
+            if result is not None:
+                name, content = result
+                if name in names:
+                    name = f'{name[:-4]}_{processed}.pdf'
+                names.add(name)
+                archive.writestr(name, content)
+            if processed % cls.PROGRESS_INTERVAL == 0:
+                PDFExportJob.objects.filter(pk=job.pk).update(processed=processed)
+
+
 # ====================
 # 月次締め処理サービス
 # ====================
@@ -670,6 +1312,220 @@ class MonthlyClosingService:
         return True, f"{period.period_name}を締めました"
 
 
+class PeriodCloseService:
+    """
+    月次締め（提出済み請求書を一斉に承認待ちへ）
+    - 対象の請求書と承認者（提出時に割り当てた現場監督 → 現在の現場監督）を1回の問い合わせで取得
+    - ステータスと承認者は UPDATE 1回（BATCH_SIZE 件ごと）、承認履歴は bulk_create でまとめて書き込む
+    - 承認者への通知は承認者ごとに1通にまとめて送信キュー（EmailOutbox）に登録する
+    - Invoice.save を通らないため、受信箱・月次集計・統計キャッシュもここで更新する
+    """
+    BATCH_SIZE = 1000
+    COMMENT = '締め処理により承認フローが開始されました'
+
+    def __init__(self, period: MonthlyInvoicePeriod, user: Optional[User], progress=None):
+        self.period = period
+        self.user = user
+        # 進捗の通知先: progress(処理済み件数, 対象件数)
+        self.progress = progress
+
+    def _rows(self, lock: bool = False) -> List[Dict]:
+        """この期間に紐づく提出済み請求書（他月の請求書を巻き込まない）"""
+        invoices = Invoice.objects.filter(
+            invoice_period=self.period,
+            receiving_company=self.period.company,
+            status='submitted',
+        ).order_by('pk')
+        if lock:
+            invoices = invoices.select_for_update(of=('self',))
+        rows = list(invoices.values(
+            'id', 'invoice_number', 'current_approver_id',
+            'approval_supervisor_id', 'construction_site__supervisor_id',
+            *Invoice.ROLLUP_FIELDS,
+        ))
+        for row in rows:
+            row['approver_id'] = row['approval_supervisor_id'] or row['construction_site__supervisor_id']
+        return rows
+
+    def plan(self) -> Dict:
+        """ドライラン: 請求書ごとの変更前後と、承認者が決まらず対象外になる請求書"""
+        changes, skipped = [], []
+        for row in self._rows():
+            if not row['approver_id']:
+                skipped.append({'id': row['id'], 'invoice_number': row['invoice_number']})
+                continue
+            changes.append({
+                'id': row['id'],
+                'invoice_number': row['invoice_number'],
+                'status': ['submitted', 'pending_approval'],
+                'current_approver_id': [row['current_approver_id'], row['approver_id']],
+            })
+        return {'period': self.period.period_name, 'changes': changes, 'skipped': skipped}
+
+    def close(self) -> int:
+        """期間を締めて、承認待ちへ移した件数を返す"""
+        period = self.period
+        with transaction.atomic():
+            period.is_closed = True
+            period.closed_by = self.user
+            period.closed_at = timezone.now()
+            period.save()
+
+            targets = [row for row in self._rows(lock=True) if row['approver_id']]
+            site_supervisor = ConstructionSite.objects.filter(
+                pk=OuterRef('construction_site_id')
+            ).values('supervisor_id')[:1]
+            now = timezone.now()
+
+            for start in range(0, len(targets), self.BATCH_SIZE):
+                batch = targets[start:start + self.BATCH_SIZE]
+                ids = [row['id'] for row in batch]
+                # 承認者は UPDATE の中で決める（提出時に割り当てた現場監督 → 現在の現場監督）
+                Invoice.objects.filter(pk__in=ids).update(
+                    status='pending_approval',
+                    current_approver=Coalesce(F('approval_supervisor'), Subquery(site_supervisor)),
+                    updated_at=now,
+                )
+                ApprovalHistory.objects.bulk_create([
+                    ApprovalHistory(invoice_id=invoice_id, user=self.user, action='submitted', comment=self.COMMENT)
+                    for invoice_id in ids
+                ])
+                ApprovalInbox.sync_invoices(ids)
+                if self.progress:
+                    self.progress(start + len(batch), len(targets))
+
+            InvoiceMonthlyRollup.apply_changes(InvoiceMonthlyRollup.status_changes(targets, 'pending_approval'))
+            EmailOutbox.objects.bulk_create(self._notifications(targets))
+
+            company_id = period.company_id
+            customer_company_ids = {row['customer_company_id'] for row in targets}
+            transaction.on_commit(lambda: [
+                DashboardStatsService.invalidate(receiving_company_id=company_id, customer_company_id=customer)
+                for customer in customer_company_ids
+            ])
+        return len(targets)
+
+    def _notifications(self, targets: List[Dict]) -> List[EmailOutbox]:
+        """承認者ごとに1通（件数と請求書番号をまとめる）"""
+        invoice_numbers: Dict[int, List[str]] = {}
+        for row in targets:
+            invoice_numbers.setdefault(row['approver_id'], []).append(row['invoice_number'])
+        recipients = User.objects.filter(pk__in=invoice_numbers, is_active=True).exclude(email='')
+        period_name = self.period.period_name
+        return [
+            EmailOutbox(
+                to_email=email,
+                subject=f'【承認依頼】{period_name} 締め処理（{len(invoice_numbers[user_id])}件）',
+                body=(
+                    f'{period_name}の締め処理により、承認待ちの請求書が{len(invoice_numbers[user_id])}件あります。\n'
+                    + '\n'.join(f'請求書番号: {number}' for number in invoice_numbers[user_id])
+                ),
+            )
+            for user_id, email in recipients.values_list('id', 'email')
+        ]
+
+
+class BatchApprovalExecutor:
+    """
+    一斉承認の実行（一斉承認待ちの請求書を承認待ちへ）
+    - スケジュールと対象の請求書を行ロックしてから処理するため、同時に実行されても二重に処理しない
+    - ステータスは UPDATE 1回（BATCH_SIZE 件ごと）、件数は UPDATE の更新件数から数える
+    - 現場監督への通知は監督ごとに1件のまとめ通知にして bulk_create で書き込む
+    - 全体を1トランザクションで実行するため、途中で中断しても何も反映されず、
+      再実行すると一斉承認待ちのまま残っている請求書から処理し直せる
+    - Invoice.save を通らないため、受信箱・月次集計・統計キャッシュもここで更新する
+    """
+    BATCH_SIZE = 1000
+    # まとめ通知に載せる請求書の最大件数（超えた分は件数のみ）
+    DIGEST_MAX_LINES = 50
+
+    def __init__(self, schedule: BatchApprovalSchedule, user: Optional[User]):
+        self.schedule = schedule
+        self.user = user
+
+    def _rows(self) -> List[Dict]:
+        invoices = Invoice.objects.filter(
+            invoice_period_id=self.schedule.period_id,
+            status='pending_batch_approval',
+        ).order_by('pk').select_for_update(of=('self',))
+        return list(invoices.values(
+            'id', 'invoice_number', 'customer_company__name', 'construction_site__supervisor_id',
+            *Invoice.ROLLUP_FIELDS,
+        ))
+
+    def execute(self) -> Optional[int]:
+        """一斉承認を実行して、承認待ちへ移した件数を返す（実行済みの場合は None）"""
+        with transaction.atomic():
+            schedule = BatchApprovalSchedule.objects.select_for_update().get(pk=self.schedule.pk)
+            if schedule.is_executed:
+                return None
+
+            targets = self._rows()
+            now = timezone.now()
+            updated = 0
+            for start in range(0, len(targets), self.BATCH_SIZE):
+                ids = [row['id'] for row in targets[start:start + self.BATCH_SIZE]]
+                updated += Invoice.objects.filter(pk__in=ids, status='pending_batch_approval').update(
+                    status='pending_approval',
+                    batch_approval_scheduled_at=None,
+                    updated_at=now,
+                )
+                ApprovalInbox.sync_invoices(ids)
+
+            InvoiceMonthlyRollup.apply_changes(InvoiceMonthlyRollup.status_changes(targets, 'pending_approval'))
+            digests = self._digests(targets)
+            SystemNotification.objects.bulk_create(digests)
+
+            schedule.is_executed = True
+            schedule.executed_at = now
+            schedule.executed_by = self.user
+            schedule.target_invoice_count = updated
+            schedule.target_supervisor_count = len(digests)
+            schedule.save(update_fields=[
+                'is_executed', 'executed_at', 'executed_by',
+                'target_invoice_count', 'target_supervisor_count',
+            ])
+
+            company_pairs = {(row['receiving_company_id'], row['customer_company_id']) for row in targets}
+            transaction.on_commit(lambda: [
+                DashboardStatsService.invalidate(receiving_company_id=company, customer_company_id=customer)
+                for company, customer in company_pairs
+            ])
+
+        # 呼び出し元のインスタンスにも結果を反映する
+        for field in ('is_executed', 'executed_at', 'executed_by',
+                      'target_invoice_count', 'target_supervisor_count'):
+            setattr(self.schedule, field, getattr(schedule, field))
+        return updated
+
+    def _digests(self, targets: List[Dict]) -> List[SystemNotification]:
+        """現場監督ごとに1件（件数と請求書番号・協力会社名をまとめる）"""
+        by_supervisor: Dict[int, List[Dict]] = {}
+        for row in targets:
+            if row['construction_site__supervisor_id']:
+                by_supervisor.setdefault(row['construction_site__supervisor_id'], []).append(row)
+
+        notifications = []
+        for supervisor_id, rows in by_supervisor.items():
+            lines = [
+                f'{row["invoice_number"]}（{row["customer_company__name"]}）'
+                for row in rows[:self.DIGEST_MAX_LINES]
+            ]
+            if len(rows) > self.DIGEST_MAX_LINES:
+                lines.append(f'ほか{len(rows) - self.DIGEST_MAX_LINES}件')
+            single = rows[0] if len(rows) == 1 else None
+            notifications.append(SystemNotification(
+                recipient_id=supervisor_id,
+                notification_type='approval',
+                priority='high',
+                title=f'【一斉承認】承認待ちの請求書 {len(rows)}件',
+                message=f'一斉承認により{len(rows)}件の請求書が承認待ちになりました。\n' + '\n'.join(lines),
+                action_url=f'/invoices/{single["id"]}' if single else '/my-approvals',
+                related_invoice_id=single['id'] if single else None,
+            ))
+        return notifications
+
+
 # ====================
 # 安全衛生協力会費サービス
 # ====================
@@ -838,13 +1694,13 @@ class ChartDataService:
     
     @staticmethod
     def get_site_payment_chart_data() -> Dict:
-        """現場別支払い割合のチャートデータ"""
+        """現場別支払い割合のチャートデータ（現場別月次集計から集計）"""
         sites = ConstructionSite.objects.filter(
             is_active=True
         ).annotate(
             total_invoiced=Sum(
-                'invoice__total_amount',
-                filter=Q(invoice__status__in=['approved', 'paid', 'payment_preparing'])
+                'monthly_rollups__total_amount',
+                filter=Q(monthly_rollups__bucket__in=InvoiceMonthlyRollup.INVOICED_BUCKETS)
             )
         ).exclude(
             total_invoiced__isnull=True
@@ -889,29 +1745,422 @@ class ChartDataService:
         }
     
     @staticmethod
-    def get_monthly_trend_data(year: int) -> List[Dict]:
-        """月別推移データ"""
-        data = []
+    def get_invoiced_monthly_totals(start_ym: int, end_ym: int) -> Dict[int, Dict]:
+        """
+        計上済み（承認済み・支払い準備中・支払い済み）の月別合計
+        会社別月次集計から1回の集計で取得し、{計上年月(YYYYMM): {'total': 金額, 'count': 件数}} で返す
+        """
+        rows = CompanyMonthlyRollup.objects.filter(
+            year_month__gte=start_ym,
+            year_month__lte=end_ym,
+            bucket__in=InvoiceMonthlyRollup.INVOICED_BUCKETS,
+        ).order_by().values('year_month').annotate(
+            total=Sum('total_amount'),
+            count=Sum('invoice_count')
+        )
+        return {row['year_month']: row for row in rows}
+    
+    @classmethod
+    def get_monthly_trend_data(cls, year: int) -> List[Dict]:
+        """月別推移データ（データの無い月は0で埋める）"""
+        monthly = cls.get_invoiced_monthly_totals(year * 100 + 1, year * 100 + 12)
         
+        data = []
         for month in range(1, 13):
-            invoices = Invoice.objects.filter(
-                invoice_date__year=year,
-                invoice_date__month=month,
-                status__in=['approved', 'paid', 'payment_preparing']
-            ).aggregate(
-                total=Sum('total_amount'),
-                count=Count('id')
-            )
-            
+            row = monthly.get(year * 100 + month, {})
             data.append({
                 'month': month,
-                'total_amount': invoices['total'] or 0,
-                'invoice_count': invoices['count'] or 0
+                'total_amount': row.get('total') or 0,
+                'invoice_count': row.get('count') or 0
             })
         
         return data
 
 
+# ====================
+# ダッシュボード統計サービス
+# ====================
+
+class DashboardStatsService:
+    """
+    ダッシュボード統計
+    - 請求書テーブルへの集計は条件付き集計（filter=）1回にまとめる
+    - 会社単位・ユーザー単位で短時間キャッシュし、ステータス変更時は世代番号を進めて無効化
+    """
+    CACHE_TTL = 45  # 秒
+
+    @staticmethod
+    def _generation_key(scope: str, scope_id) -> str:
+        return f'dashboard_stats_gen:{scope}:{scope_id}'
+
+    @classmethod
+    def _generation(cls, scope: str, scope_id) -> int:
+        return cache.get_or_set(cls._generation_key(scope, scope_id), 0, None)
+
+    @classmethod
+    def invalidate(cls, receiving_company_id=None, customer_company_id=None):
+        """請求書のステータス変更時に関連するキャッシュを無効化"""
+        targets = [('company', 'all')]
+        if receiving_company_id:
+            targets.append(('company', receiving_company_id))
+        if customer_company_id:
+            targets.append(('customer', customer_company_id))
+        for scope, scope_id in targets:
+            key = cls._generation_key(scope, scope_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+
+    @classmethod
+    def _cached(cls, key: str, compute) -> Dict:
+        data = cache.get(key)
+        if data is None:
+            data = compute()
+            cache.set(key, data, cls.CACHE_TTL)
+        return data
+
+    @classmethod
+    def internal_stats(cls, user: User) -> Dict:
+        """社内ユーザー向け統計（自社全体＋自分の承認状況）"""
+        company_key = user.company_id or 'all'
+        generation = cls._generation('company', company_key)
+        company_stats = cls._cached(
+            f'dashboard_stats:company:{company_key}:{generation}',
+            lambda: cls._compute_company_stats(user.company)
+        )
+        user_stats = cls._cached(
+            f'dashboard_stats:user:{user.pk}:{generation}',
+            lambda: cls._compute_user_stats(user)
+        )
+        return {**company_stats, **user_stats}
+
+    @classmethod
+    def customer_stats(cls, user: User) -> Dict:
+        """協力会社ユーザー向け統計（自社の請求書のみ）"""
+        customer_company_id = user.customer_company_id
+        generation = cls._generation('customer', customer_company_id)
+        return cls._cached(
+            f'dashboard_stats:customer:{customer_company_id}:{generation}',
+            lambda: cls._compute_customer_stats(customer_company_id)
+        )
+
+    @staticmethod
+    def _compute_company_stats(company) -> Dict:
+        today = timezone.localdate()
+        current_month = today.replace(day=1)
+        next_month = (current_month + timedelta(days=32)).replace(day=1)
+
+        # 自社フィルター（company未設定の場合は全件）
+        company_filter = Q(receiving_company=company) if company else Q()
+        in_progress = Q(status__in=['submitted', 'pending_approval'])
+        totals = Invoice.objects.filter(company_filter).aggregate(
+            pending_invoices=Count('id', filter=Q(status='pending_approval')),
+            monthly_payment=Sum('total_amount', filter=Q(
+                payment_due_date__gte=current_month,
+                payment_due_date__lt=next_month,
+                status__in=['approved', 'paid']
+            )),
+            # C: 全社の進行中（提出済み・承認待ち）合計金額・件数
+            submitted_total_amount=Sum('total_amount', filter=in_progress),
+            submitted_count=Count('id', filter=in_progress),
+        )
+        return {
+            'pending_invoices': totals['pending_invoices'],
+            'monthly_payment': totals['monthly_payment'] or 0,
+            'partner_companies': CustomerCompany.objects.filter(is_active=True).count(),
+            'submitted_total_amount': totals['submitted_total_amount'] or 0,
+            'submitted_count': totals['submitted_count'],
+        }
+
+    @staticmethod
+    def _compute_user_stats(user: User) -> Dict:
+        # B: 自分の承認待ち（承認待ち受信箱）／ A: 自分が承認してきた累計
+        pending = Q(
+            id__in=ApprovalInbox.for_user(user).values('invoice_id'),
+            status='pending_approval'
+        )
+        approved = Q(
+            id__in=ApprovalHistory.objects.filter(user=user, action='approved').values('invoice_id')
+        )
+        totals = Invoice.objects.filter(pending | approved).aggregate(
+            my_pending_approvals=Count('id', filter=pending),
+            my_pending_amount=Sum('total_amount', filter=pending),
+            my_approved_count=Count('id', filter=approved),
+            my_approved_total=Sum('total_amount', filter=approved),
+        )
+        return {
+            'my_pending_approvals': totals['my_pending_approvals'],
+            'my_pending_amount': totals['my_pending_amount'] or 0,
+            'my_approved_count': totals['my_approved_count'],
+            'my_approved_total': totals['my_approved_total'] or 0,
+        }
+
+    @staticmethod
+    def _compute_customer_stats(customer_company_id) -> Dict:
+        totals = Invoice.objects.filter(customer_company_id=customer_company_id).aggregate(
+            draft_count=Count('id', filter=Q(status='draft')),
+            submitted_count=Count('id', filter=Q(status__in=['submitted', 'pending_approval'])),
+            returned_count=Count('id', filter=Q(status='returned')),
+            approved_count=Count('id', filter=Q(status='approved')),
+            total_amount_pending=Sum('total_amount', filter=Q(
+                status__in=['submitted', 'pending_approval', 'approved']
+            )),
+        )
+        totals['total_amount_pending'] = totals['total_amount_pending'] or 0
+        return totals
+
+
+# ====================
+# 承認者ディレクトリ
+# ====================
+
+class ApproverDirectory:
+    """
+    会社ごとの「役職 → 有効な社内ユーザー（id の降順）」の対応表
+    承認ステップの次の承認者・通知先の解決に使う。ユーザーの保存・削除時に世代番号を進めて無効化する。
+    """
+    CACHE_TTL = 600  # 秒
+    GENERATION_KEY = 'approver_directory_gen'
+
+    @classmethod
+    def invalidate(cls):
+        try:
+            cache.incr(cls.GENERATION_KEY)
+        except ValueError:
+            cache.set(cls.GENERATION_KEY, 1, None)
+
+    @classmethod
+    def for_company(cls, company_id) -> Dict[str, List[User]]:
+        generation = cache.get_or_set(cls.GENERATION_KEY, 0, None)
+        cache_key = f'approver_directory:{company_id}:{generation}'
+        directory = cache.get(cache_key)
+        if directory is None:
+            directory = {}
+            for user in User.objects.filter(
+                user_type='internal', company_id=company_id, is_active=True
+            ).exclude(position='').order_by('-id'):
+                directory.setdefault(user.position, []).append(user)
+            cache.set(cache_key, directory, cls.CACHE_TTL)
+        return directory
+
+    @classmethod
+    def users(cls, company_id, position: str) -> List[User]:
+        """その役職の有効な社内ユーザー一覧"""
+        return cls.for_company(company_id).get(position, [])
+
+    @classmethod
+    def first(cls, company_id, position: str) -> Optional[User]:
+        """その役職の承認者（従来どおり最も新しく登録されたユーザー）"""
+        users = cls.users(company_id, position)
+        return users[0] if users else None
+
+
+# ====================
+# 一括承認サービス
+# ====================
+
+class BulkApprovalService:
+    """
+    請求書の一括承認
+    - 承認ルート・ステップ・承認済み履歴を対象全件分まとめて取得（次の承認者は ApproverDirectory から解決）
+    - 状態遷移はメモリ上で計算し、bulk_update / bulk_create で1トランザクションにまとめて書き込む
+    - 通知メールは同じトランザクションで送信キュー（EmailOutbox）に登録する
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, user: User, comment: str = '一括承認'):
+        self.user = user
+        self.comment = comment
+        self.errors: List[Dict] = []
+        self.notifications: List[EmailOutbox] = []
+
+    def _error(self, invoice: Invoice, message: str, **extra):
+        self.errors.append({
+            'id': invoice.id, 'invoice_number': invoice.invoice_number, 'error': message, **extra
+        })
+
+    def _load_steps(self, invoices: List[Invoice]) -> Dict[int, List[ApprovalStep]]:
+        """承認ルートごとのステップ（step_order 順）"""
+        route_ids = {invoice.approval_route_id for invoice in invoices if invoice.approval_route_id}
+        steps_by_route: Dict[int, List[ApprovalStep]] = {}
+        steps = ApprovalStep.objects.filter(route_id__in=route_ids).select_related('approver_user')
+        for step in steps.order_by('route_id', 'step_order'):
+            steps_by_route.setdefault(step.route_id, []).append(step)
+        return steps_by_route
+
+    def _resolve_current_step(self, invoice: Invoice, steps) -> Optional[ApprovalStep]:
+        """現在のステップ（未設定の場合は現在の承認者から復元）"""
+        if invoice.current_approval_step_id:
+            return next((s for s in steps if s.id == invoice.current_approval_step_id), None) \
+                or invoice.current_approval_step
+        if not (invoice.current_approver_id and invoice.approval_route_id):
+            return None
+        if invoice.is_site_supervisor(invoice.current_approver):
+            position = 'site_supervisor'
+        else:
+            position = invoice.current_approver.position
+        return next((s for s in steps if s.approver_position == position), None)
+
+    def _can_approve(self, invoice: Invoice, step: ApprovalStep) -> Optional[str]:
+        """承認できない場合はエラーメッセージを返す"""
+        user = self.user
+        if user.position == 'accountant':
+            if step.approver_position == 'accountant':
+                return None
+            return '経理の承認は全ての役職者承認後に実施してください'
+        if step.approver_position == 'site_supervisor':
+            allowed = invoice.is_site_supervisor(user)
+        elif step.approver_user_id:
+            allowed = step.approver_user_id == user.id
+        elif invoice.current_approver_id:
+            # 共有テンプレートのステップは approver_user を持たないため、割り当て済みの承認者本人のみ
+            allowed = invoice.current_approver_id == user.id
+        else:
+            allowed = user.position == step.approver_position
+        return None if allowed else '承認権限がありません'
+
+    def _notify(self, recipient: User, subject: str, message: str):
+        if recipient and recipient.email:
+            self.notifications.append(EmailOutbox(to_email=recipient.email, subject=subject, body=message))
+
+    def approve(self, invoice_ids) -> int:
+        """承認を実行し、承認件数を返す（エラーは self.errors に格納）"""
+        with transaction.atomic():
+            invoices = list(
+                Invoice.objects.filter(id__in=list(invoice_ids)).order_by('id')
+                .select_for_update(of=('self',))
+                .select_related('current_approval_step', 'current_approver', 'construction_site', 'created_by')
+            )
+            if not invoices:
+                return 0
+
+            already_approved = set(
+                ApprovalHistory.objects.filter(
+                    invoice_id__in=[invoice.id for invoice in invoices],
+                    user=self.user, action='approved',
+                ).values_list('invoice_id', flat=True)
+            )
+            steps_by_route = self._load_steps(invoices)
+
+            now = timezone.now()
+            approved: List[Invoice] = []
+            histories: List[ApprovalHistory] = []
+            for invoice in invoices:
+                if invoice.status != 'pending_approval':
+                    self._error(invoice, '承認待ちではありません')
+                    continue
+                if invoice.id in already_approved:
+                    self._error(invoice, '既に承認済みです')
+                    continue
+
+                steps = steps_by_route.get(invoice.approval_route_id, [])
+                current_step = self._resolve_current_step(invoice, steps)
+                if not current_step:
+                    self._error(
+                        invoice, '承認ステップが設定されていません',
+                        detail=f'承認ルート: {invoice.approval_route_id or "未設定"}, '
+                               f'現在の承認者: {invoice.current_approver.username if invoice.current_approver else "未設定"}'
+                    )
+                    continue
+
+                error = self._can_approve(invoice, current_step)
+                if error:
+                    self._error(invoice, error)
+                    continue
+
+                histories.append(ApprovalHistory(
+                    invoice=invoice, approval_step=current_step, user=self.user,
+                    action='approved', comment=self.comment,
+                ))
+                self._advance(invoice, current_step, steps)
+                invoice.updated_at = now
+                approved.append(invoice)
+
+            if approved:
+                self._persist(approved, histories)
+        return len(approved)
+
+    def _advance(self, invoice: Invoice, current_step: ApprovalStep, steps):
+        """次のステップへ進める（最終ステップなら承認完了）"""
+        next_step = next((s for s in steps if s.step_order == current_step.step_order + 1), None)
+        if not next_step:
+            invoice.status = 'approved'
+            invoice.current_approval_step = None
+            invoice.current_approver = None
+            self._notify(invoice.created_by, f'【承認完了】{invoice.invoice_number}', '請求書が一括承認されました。')
+            return
+
+        invoice.current_approval_step = next_step
+        subject = f'【請求書承認依頼】{invoice.invoice_number}'
+        if next_step.approver_position == 'accountant':
+            # 経理ステップ: 誰でも承認可能（全経理に通知）
+            invoice.current_approver = None
+            for accountant in ApproverDirectory.users(invoice.receiving_company_id, 'accountant'):
+                self._notify(accountant, subject, '一括承認により経理確認依頼が届いています。')
+            return
+
+        if next_step.approver_user_id:
+            invoice.current_approver = next_step.approver_user
+        else:
+            next_approver = ApproverDirectory.first(invoice.receiving_company_id, next_step.approver_position)
+            if next_approver:
+                invoice.current_approver = next_approver
+        if invoice.current_approver:
+            self._notify(invoice.current_approver, subject, '一括承認により承認依頼が届いています。')
+
+    def _persist(self, approved: List[Invoice], histories: List[ApprovalHistory]):
+        """
+        まとめて書き込む
+        bulk_update は Invoice.save を通らないため、受信箱・現場の累計請求額・月次集計・統計キャッシュもここで更新する
+        """
+        Invoice.objects.bulk_update(
+            approved,
+            ['status', 'current_approval_step', 'current_approver', 'updated_at'],
+            batch_size=self.BATCH_SIZE,
+        )
+        ApprovalHistory.objects.bulk_create(histories, batch_size=self.BATCH_SIZE)
+
+        ids = [invoice.id for invoice in approved]
+        ApprovalInbox.sync_invoices(ids)
+
+        site_totals: Dict[int, Decimal] = {}
+        for invoice in approved:
+            if invoice.status == 'approved' and invoice.construction_site_id:
+                site_totals[invoice.construction_site_id] = (
+                    site_totals.get(invoice.construction_site_id, 0) + invoice.total_amount
+                )
+        for site_id, amount in site_totals.items():
+            ConstructionSite.add_invoiced_amount(site_id, amount)
+
+        InvoiceMonthlyRollup.apply_changes(
+            (invoice._loaded_rollup_state, invoice._rollup_state()) for invoice in approved
+        )
+
+        # アクセスログ・監査ログはリクエスト中ならレスポンス送信後にまとめて書き込む
+        audit.record(*[
+            AccessLog(
+                user=self.user, action='bulk_approve', resource_type='Invoice',
+                resource_id=str(invoice.id), details={'comment': self.comment},
+            )
+            for invoice in approved
+        ], *[
+            AuditLog(
+                user=self.user, action='approve', target_model='Invoice',
+                target_id=str(invoice.id), target_label=invoice.invoice_number,
+                details={'comment': self.comment, 'type': 'bulk'},
+            )
+            for invoice in approved
+        ])
+        EmailOutbox.objects.bulk_create(self.notifications, batch_size=self.BATCH_SIZE)
+
+        companies = {(invoice.receiving_company_id, invoice.customer_company_id) for invoice in approved}
+        transaction.on_commit(lambda: [
+            DashboardStatsService.invalidate(receiving_company_id=receiving, customer_company_id=customer)
+            for receiving, customer in companies
+        ])
+
+
 # ====================
 # 変更履歴サービス
 # ====================
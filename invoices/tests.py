@@ -1,3 +1,1686 @@
+import io
+from datetime import date
+
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import (
+    Company, CustomerCompany, User, ConstructionSite, ConstructionType,
+    Invoice, InvoiceItem, InvoiceComment, ApprovalHistory,
+    ApprovalRoute, ApprovalStep, ApprovalInbox, EmailOutbox, NumberSequence,
+    InvoiceMonthlyRollup, CompanyMonthlyRollup, CustomerMonthlyRollup, SiteMonthlyRollup,
+    INVOICE_ROLLUP_MODELS, MonthlyInvoicePeriod, BatchApprovalSchedule, SystemNotification,
+    AccessLog, AuditLog, AuditArchive, AccessLogHourlyRollup,
+)
+
+
+class InvoiceTestCase(TestCase):
+    """
+    請求書まわりのテストの共通データ
+    自社（平野工務店）・協力会社A・経理担当（self.user / self.accountant）と、経理担当でログインした APIClient
+    """
+
+    def setUp(self):
+        self.company = Company.objects.create(name='平野工務店')
+        self.customer_company = CustomerCompany.objects.create(name='協力会社A')
+        self.user = self.accountant = self._create_user('accountant', 'accountant')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_user(self, username, position, **kwargs):
+        """自社の社内ユーザー"""
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com', password='pass',
+            user_type='internal', company=self.company, position=position, **kwargs
+        )
+
+    def _create_invoice(self, **kwargs):
+        """自社宛ての請求書（協力会社・作成者は省略時に共通データ）"""
+        kwargs.setdefault('customer_company', self.customer_company)
+        kwargs.setdefault('created_by', self.user)
+        return Invoice.objects.create(receiving_company=self.company, **kwargs)
+
+    def _create_invoices(self, count, **kwargs):
+        return [self._create_invoice(**kwargs) for _ in range(count)]
+
+
+class InvoiceQueryCountTest(InvoiceTestCase):
+    """請求書API のアクション別クエリ数（件数に比例して増えないこと）"""
+
+    def setUp(self):
+        super().setUp()
+        construction_type = ConstructionType.objects.create(code='test_type', name='テスト工事')
+        self.site = ConstructionSite.objects.create(
+            name='テスト現場', company=self.company, supervisor=self.user,
+            construction_type=construction_type,
+        )
+
+    def _create_invoices(self, count):
+        invoices = []
+        for i in range(count):
+            invoice = self._create_invoice(
+                construction_site=self.site, current_approver=self.user, project_name=f'工事{i}',
+            )
+            InvoiceItem.objects.create(invoice=invoice, item_number=1, description='材料', quantity=1, unit_price=1000)
+            root = InvoiceComment.objects.create(invoice=invoice, user=self.user, comment='確認お願いします')
+            reply = InvoiceComment.objects.create(invoice=invoice, user=self.user, comment='了解', parent_comment=root)
+            reply.mentioned_users.add(self.user)
+            ApprovalHistory.objects.create(invoice=invoice, user=self.user, action='submitted')
+            invoices.append(invoice)
+        return invoices
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self._create_invoices(2)
+        small = self._count_queries('/api/invoices/')
+        self._create_invoices(8)
+        large = self._count_queries('/api/invoices/')
+        self.assertEqual(small, large)
+        # 認証ユーザー取得なし（force_authenticate）: COUNT + 本体
+        self.assertLessEqual(large, 2)
+
+    def test_list_does_not_prefetch_children(self):
+        self._create_invoices(3)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/invoices/')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('invoice_comments', sql)
+        self.assertNotIn('invoices_approvalhistory', sql)
+        self.assertNotIn('invoices_invoiceitem', sql)
+
+    def test_retrieve_query_count_is_constant(self):
+        first = self._create_invoices(1)[0]
+        small = self._count_queries(f'/api/invoices/{first.id}/')
+        invoice = self._create_invoices(1)[0]
+        for _ in range(5):
+            reply = InvoiceComment.objects.create(
+                invoice=invoice, user=self.user, comment='追記',
+                parent_comment=invoice.comments.filter(parent_comment__isnull=True).first(),
+            )
+            reply.mentioned_users.add(self.user)
+            ApprovalHistory.objects.create(invoice=invoice, user=self.user, action='approved')
+        large = self._count_queries(f'/api/invoices/{invoice.id}/')
+        self.assertEqual(small, large)
+
+
+class InvoiceCursorPaginationTest(InvoiceTestCase):
+    """請求書一覧のキーセット方式ページネーション（?cursor=）と件数のキャッシュ"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        super().setUp()
+
+    def _get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_pages_are_stable_across_inserts(self):
+        invoices = self._create_invoices(15)
+        first = self._get('/api/invoices/', {'cursor': '', 'page_size': 10})
+        self.assertIsNone(first['previous'])
+
+        # 1ページ目の取得後に追加された請求書は、以降のページに紛れ込まない
+        self._create_invoices(3)
+        second = self._get(first['next'])
+        self.assertIsNone(second['next'])
+
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, [invoice.id for invoice in reversed(invoices)])
+
+        response = self.client.get('/api/invoices/', {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_count_is_cached_per_user_and_filter(self):
+        self._create_invoices(2, status='approved')
+        self._create_invoices(1, status='draft')
+        self.assertEqual(self._get('/api/invoices/', {'cursor': ''})['count'], 3)
+
+        # キャッシュ中は COUNT を実行せず、追加分は有効期間が切れるまで反映されない
+        self._create_invoices(1, status='approved')
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._get('/api/invoices/', {'cursor': ''})
+        self.assertEqual(data['count'], 3)
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in ctx.captured_queries))
+
+        # 条件が違えば別に数える
+        data = self._get('/api/invoices/', {'cursor': '', 'status': 'approved'})
+        self.assertEqual(data['count'], 3)
+
+        # カーソル位置はキーに含めないため、続きのページも同じキャッシュを使う
+        from .pagination import InvoiceCursorPagination
+        self._create_invoices(1, status='approved')
+        oldest = Invoice.objects.order_by('created_at', 'id').first()
+        cursor = InvoiceCursorPagination._encode_cursor(oldest)
+        self.assertEqual(self._get('/api/invoices/', {'cursor': cursor, 'status': 'approved'})['count'], 3)
+
+
+class InvoiceSearchTest(InvoiceTestCase):
+    """請求書横断検索（SQLite ではバイグラム転置インデックスで検索）"""
+
+    def setUp(self):
+        from .search import ngram_index
+        ngram_index.clear()
+
+        super().setUp()
+        self.site = ConstructionSite.objects.create(name='渋谷駅前ビル新築工事', company=self.company)
+
+    def _search(self, query):
+        response = self.client.get('/api/invoices/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_search_matches_kana_regardless_of_script(self):
+        company = CustomerCompany.objects.create(name='山田建設', name_kana='ヤマダケンセツ')
+        invoice = self._create_invoice(customer_company=company)
+        self._create_invoice(customer_company=CustomerCompany.objects.create(name='鈴木塗装', name_kana='スズキトソウ'))
+
+        self.assertEqual(self._search('やまだ'), [invoice.id])
+        self.assertEqual(self._search('ﾔﾏﾀﾞ'), [invoice.id])
+
+    def test_search_across_fields_with_multiple_terms(self):
+        company = CustomerCompany.objects.create(name='山田建設', name_kana='やまだけんせつ')
+        invoice = self._create_invoice(customer_company=company, construction_site=self.site, notes='足場追加分')
+        self._create_invoice(customer_company=company, notes='足場追加分')
+
+        self.assertEqual(self._search('渋谷 足場'), [invoice.id])
+
+    def test_search_ranks_more_relevant_invoice_first(self):
+        company = CustomerCompany.objects.create(name='山田建設')
+        # 新しい順では weak が先になるが、関連度で strong が先に来る
+        strong = self._create_invoice(customer_company=company, project_name='配管', notes='配管 配管')
+        weak = self._create_invoice(customer_company=company, notes='配管')
+
+        self.assertEqual(self._search('配管'), [strong.id, weak.id])
+
+    def test_renaming_company_updates_search_document(self):
+        company = CustomerCompany.objects.create(name='山田建設')
+        invoice = self._create_invoice(customer_company=company)
+
+        company.name = '山田工業'
+        company.save()
+
+        self.assertEqual(self._search('工業'), [invoice.id])
+        self.assertEqual(self._search('建設'), [])
+
+    def test_fallback_limit_applies_after_permission_filter(self):
+        from unittest import mock
+        from .search import ngram_index
+
+        other = CustomerCompany.objects.create(name='鈴木塗装')
+        for _ in range(3):
+            self._create_invoice(customer_company=other, project_name='配管', notes='配管 配管')
+        own = self._create_invoice(notes='配管')
+        partner = User.objects.create_user(
+            username='partner', email='partner@example.com', password='pass',
+            user_type='customer', customer_company=self.customer_company,
+        )
+        self.client.force_authenticate(partner)
+
+        # 他社の請求書の方が上位でも、見える請求書が上限の枠から漏れないこと
+        with mock.patch('invoices.search.MAX_FALLBACK_RESULTS', 2):
+            self.assertEqual(self._search('配管'), [own.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            own.delete()
+        self.assertNotIn(own.id, ngram_index._documents)
+        self.assertEqual(self._search('配管'), [])
+
+        # クエリセットでの一括削除は次の検索時に外れる
+        self.client.force_authenticate(self.user)
+        Invoice.objects.filter(customer_company=other).delete()
+        self.assertEqual(self._search('配管'), [])
+        self.assertEqual(ngram_index._documents, {})
+
+
+class ApprovalInboxTest(InvoiceTestCase):
+    """承認待ち受信箱（承認状態の変更に追随すること）"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        super().setUp()
+        self.supervisor = self._create_user('supervisor', 'site_supervisor')
+        route = ApprovalRoute.objects.create(company=self.company, name='テストルート')
+        self.supervisor_step = ApprovalStep.objects.create(
+            route=route, step_order=1, step_name='現場所長承認', approver_position='site_supervisor'
+        )
+        self.accountant_step = ApprovalStep.objects.create(
+            route=route, step_order=2, step_name='経理確認', approver_position='accountant'
+        )
+        self.invoice = self._create_invoice(created_by=self.supervisor, approval_route=route)
+
+    def test_draft_invoice_is_not_in_inbox(self):
+        self.assertFalse(ApprovalInbox.invoices_for(self.supervisor).exists())
+
+    def test_inbox_follows_approval_state(self):
+        self.invoice.status = 'pending_approval'
+        self.invoice.current_approver = self.supervisor
+        self.invoice.current_approval_step = self.supervisor_step
+        self.invoice.save()
+        self.assertEqual(list(ApprovalInbox.invoices_for(self.supervisor)), [self.invoice])
+        self.assertFalse(ApprovalInbox.invoices_for(self.accountant).exists())
+
+        # 経理ステップ: 経理担当全員の承認待ちになる
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        invoice.current_approver = None
+        invoice.current_approval_step = self.accountant_step
+        invoice.save()
+        self.assertFalse(ApprovalInbox.invoices_for(self.supervisor).exists())
+        self.assertEqual(list(ApprovalInbox.invoices_for(self.accountant)), [self.invoice])
+
+        invoice.status = 'approved'
+        invoice.current_approval_step = None
+        invoice.save()
+        self.assertFalse(ApprovalInbox.objects.filter(invoice=invoice).exists())
+
+    def test_my_pending_approvals_reads_inbox(self):
+        self.invoice.status = 'pending_approval'
+        self.invoice.current_approver = self.supervisor
+        self.invoice.current_approval_step = self.supervisor_step
+        self.invoice.save()
+
+        client = APIClient()
+        client.force_authenticate(self.supervisor)
+        response = client.get('/api/invoices/my_pending_approvals/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['id'], self.invoice.id)
+
+        stats = client.get('/api/dashboard/stats/').data
+        self.assertEqual(stats['my_pending_approvals'], 1)
+
+
+class DashboardStatsTest(InvoiceTestCase):
+    """ダッシュボード統計（条件付き集計＋キャッシュ）"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        super().setUp()
+
+    def test_stats_are_cached_until_status_changes(self):
+        invoice = self._create_invoice(status='submitted', total_amount=1000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.get('/api/dashboard/stats/').data
+        self.assertEqual(first['submitted_count'], 1)
+        self.assertEqual(first['pending_invoices'], 0)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/dashboard/stats/')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.status = 'pending_approval'
+            invoice.save()
+
+        second = self.client.get('/api/dashboard/stats/').data
+        self.assertEqual(second['pending_invoices'], 1)
+        self.assertEqual(second['submitted_total_amount'], 1000)
+
+
+class SiteInvoicedTotalTest(InvoiceTestCase):
+    """現場の累計請求額（請求書の保存・削除に追随し、ヒートマップは件数によらず一定クエリ）"""
+
+    def setUp(self):
+        super().setUp()
+        self.site = ConstructionSite.objects.create(
+            name='テスト現場', company=self.company, supervisor=self.user, total_budget=10000,
+        )
+
+    def _create_invoice(self, site=None, **kwargs):
+        return super()._create_invoice(construction_site=site or self.site, **kwargs)
+
+    def _invoiced_total(self, site=None):
+        return ConstructionSite.objects.get(pk=(site or self.site).pk).invoiced_total
+
+    def test_invoiced_total_follows_invoice_changes(self):
+        invoice = self._create_invoice(status='pending_approval', total_amount=3000)
+        self._create_invoice(status='paid', total_amount=2000)
+        self.assertEqual(self._invoiced_total(), 2000)
+
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.status = 'approved'
+        invoice.save()
+        self.assertEqual(self._invoiced_total(), 5000)
+
+        # 現場側の保存で累計請求額が古い値に戻らないこと
+        self.site.name = 'テスト現場（改）'
+        self.site.save()
+        self.assertEqual(self._invoiced_total(), 5000)
+
+        other_site = ConstructionSite.objects.create(name='別現場', company=self.company)
+        invoice.construction_site = other_site
+        invoice.save()
+        self.assertEqual(self._invoiced_total(), 2000)
+        self.assertEqual(self._invoiced_total(other_site), 3000)
+
+        invoice.delete()
+        self.assertEqual(self._invoiced_total(other_site), 0)
+
+        ConstructionSite.objects.filter(pk=self.site.pk).update(invoiced_total=0)
+        ConstructionSite.recalculate_invoiced_totals()
+        self.assertEqual(self._invoiced_total(), 2000)
+
+    def test_site_heatmap_query_count_is_constant(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/dashboard/site_heatmap/')
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self._create_invoice(status='approved', total_amount=9500)
+        small = count_queries()
+        for i in range(5):
+            site = ConstructionSite.objects.create(
+                name=f'現場{i}', company=self.company, supervisor=self.user, total_budget=1000,
+            )
+            self._create_invoice(site=site, status='approved', total_amount=500)
+        self.assertEqual(small, count_queries())
+
+        response = self.client.get('/api/dashboard/site_heatmap/')
+        first = response.data['heatmap'][0]
+        self.assertEqual(first['site_id'], self.site.id)
+        self.assertEqual(first['risk_level'], 'high')
+
+    def test_alert_sites_filters_on_invoiced_total(self):
+        self._create_invoice(status='approved', total_amount=9500)
+        quiet_site = ConstructionSite.objects.create(name='余裕現場', company=self.company, total_budget=10000)
+        self._create_invoice(site=quiet_site, status='approved', total_amount=1000)
+
+        report = self.client.get('/api/reports/alert_sites/').data
+        self.assertEqual([row['id'] for row in report['sites']], [self.site.id])
+        self.assertEqual(report['sites'][0]['alert_type'], 'warning')
+
+        chart = self.client.get('/api/chart-data/alert_sites/').data
+        self.assertEqual([row['id'] for row in chart['sites']], [self.site.id])
+        self.assertEqual(chart['sites'][0]['consumption_rate'], 95.0)
+
+    def test_final_approval_sends_budget_alerts(self):
+        route_id, _ = ApprovalRoute.standard_template(self.company)
+        accountant_step = ApprovalStep.objects.get(route_id=route_id, approver_position='accountant')
+
+        def approve(amount):
+            invoice = self._create_invoice(
+                status='pending_approval', total_amount=amount,
+                approval_route_id=route_id, current_approval_step=accountant_step,
+            )
+            response = self.client.post(f'/api/invoices/{invoice.id}/approve/', {}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            return response.data['message']
+
+        self.assertIn('予算消化率80%', approve(8500))
+        self.assertIn('予算消化率90%', approve(600))
+        self.assertEqual(self._invoiced_total(), 9100)
+        site = ConstructionSite.objects.get(pk=self.site.pk)
+        self.assertTrue(site.budget_alert_80_notified and site.budget_alert_90_notified)
+        self.assertEqual(
+            SystemNotification.objects.filter(recipient=self.user, notification_type='alert').count(), 2
+        )
+
+
+class BulkApprovalTest(InvoiceTestCase):
+    """一括承認（件数によらず一定クエリで、まとめて書き込むこと）"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        super().setUp()
+        self.supervisor = self._create_user('supervisor', 'site_supervisor')
+        self.manager = self._create_user('manager', 'manager')
+        self.site = ConstructionSite.objects.create(
+            name='テスト現場', company=self.company, supervisor=self.supervisor,
+        )
+        route = ApprovalRoute.objects.create(company=self.company, name='テストルート')
+        self.steps = [
+            ApprovalStep.objects.create(route=route, step_order=1, step_name='現場所長承認', approver_position='site_supervisor'),
+            ApprovalStep.objects.create(route=route, step_order=2, step_name='部長承認', approver_position='manager'),
+            ApprovalStep.objects.create(route=route, step_order=3, step_name='経理確認', approver_position='accountant'),
+        ]
+        self.route = route
+
+    def _create_invoices(self, count, step_index=0, approver=None):
+        return super()._create_invoices(
+            count,
+            construction_site=self.site,
+            created_by=self.supervisor,
+            approval_route=self.route,
+            status='pending_approval',
+            current_approval_step=self.steps[step_index],
+            current_approver=approver or self.supervisor,
+            total_amount=1000,
+        )
+
+    def _bulk_approve(self, user, invoices):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(
+                    '/api/invoices/bulk_approve/',
+                    {'invoice_ids': [invoice.id for invoice in invoices]}, format='json',
+                )
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(ctx.captured_queries)
+
+    def test_bulk_approve_advances_to_next_step(self):
+        invoices = self._create_invoices(3)
+        data, _ = self._bulk_approve(self.supervisor, invoices)
+        self.assertEqual(data['success_count'], 3)
+
+        for invoice in Invoice.objects.filter(id__in=[i.id for i in invoices]):
+            self.assertEqual(invoice.current_approval_step_id, self.steps[1].id)
+            self.assertEqual(invoice.current_approver_id, self.manager.id)
+        self.assertEqual(ApprovalHistory.objects.filter(user=self.supervisor, action='approved').count(), 3)
+        self.assertEqual(ApprovalInbox.invoices_for(self.manager).count(), 3)
+        self.assertEqual(EmailOutbox.objects.filter(to_email=self.manager.email).count(), 3)
+
+        # 同じユーザーが再度承認しようとするとエラー
+        data, _ = self._bulk_approve(self.supervisor, invoices)
+        self.assertEqual(data['success_count'], 0)
+        self.assertEqual(data['failure_count'], 3)
+
+    def test_bulk_approve_final_step_completes(self):
+        invoices = self._create_invoices(2, step_index=2, approver=self.accountant)
+        data, _ = self._bulk_approve(self.accountant, invoices)
+        self.assertEqual(data['success_count'], 2)
+        self.assertEqual(Invoice.objects.filter(status='approved').count(), 2)
+        self.assertFalse(ApprovalInbox.objects.exists())
+        self.assertEqual(ConstructionSite.objects.get(pk=self.site.pk).invoiced_total, 2000)
+
+    def test_bulk_approve_query_count_is_constant(self):
+        # 承認者ディレクトリのキャッシュを温める
+        self._bulk_approve(self.supervisor, self._create_invoices(1))
+        _, small = self._bulk_approve(self.supervisor, self._create_invoices(2))
+        _, large = self._bulk_approve(self.supervisor, self._create_invoices(10))
+        self.assertEqual(small, large)
+
+
+class EmailOutboxTest(TestCase):
+    """メール送信キュー（登録はトランザクション内、送信はワーカーでまとめて）"""
+
+    def test_deliver_sends_pending_and_schedules_retry_on_failure(self):
+        from unittest import mock
+        from django.conf import settings
+        from django.core import mail
+        from django.core.mail import EmailMultiAlternatives
+        from .services import EmailService
+
+        EmailOutbox.enqueue('a@example.com', '件名A', '本文A')
+        EmailOutbox.enqueue('b@example.com', '件名B', '本文B')
+        EmailOutbox.enqueue('', '宛先なし', '登録されない')
+
+        original_send = EmailMultiAlternatives.send
+
+        def send(message, *args, **kwargs):
+            if message.to == ['b@example.com']:
+                raise ConnectionError('temporary failure')
+            return original_send(message, *args, **kwargs)
+
+        with mock.patch.object(EmailMultiAlternatives, 'send', send):
+            result = EmailService.deliver_outbox(batch_size=10)
+
+        self.assertEqual(result, {'sent': 1, 'failed': 1})
+        self.assertEqual([m.to for m in mail.outbox], [['a@example.com']])
+        self.assertEqual(mail.outbox[0].subject, f'{settings.EMAIL_SUBJECT_PREFIX}件名A')
+
+        failed = EmailOutbox.objects.get(to_email='b@example.com')
+        self.assertEqual(failed.status, 'pending')
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('temporary failure', failed.last_error)
+
+        # 再試行時刻までは送信しない
+        self.assertEqual(EmailService.deliver_outbox(), {'sent': 0, 'failed': 0})
+        EmailOutbox.objects.filter(pk=failed.pk).update(next_attempt_at=failed.created_at)
+        self.assertEqual(EmailService.deliver_outbox(), {'sent': 1, 'failed': 0})
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 2)
+
+    def test_gives_up_after_max_attempts(self):
+        message = EmailOutbox.enqueue('a@example.com', '件名', '本文')
+        for _ in range(EmailOutbox.MAX_ATTEMPTS):
+            message.mark_failed('error')
+        self.assertEqual(message.status, 'failed')
+
+
+class NumberSequenceTest(InvoiceTestCase):
+    """採番カウンター（請求書番号・管理番号・工事コード）"""
+
+    def test_numbers_continue_from_existing_data(self):
+        from django.utils import timezone
+        year = timezone.localdate().year
+        self._create_invoice(invoice_number=f'INV-{year}-0041', unique_number=f'INV-{year}-017')
+
+        invoice = self._create_invoice()
+        delivery = self._create_invoice(document_type='delivery_note')
+        self.assertEqual(invoice.invoice_number, f'INV-{year}-0042')
+        self.assertEqual(invoice.unique_number, f'INV-{year}-018')
+        self.assertEqual(delivery.invoice_number, f'DLV-{year}-0001')
+        self.assertEqual(delivery.unique_number, f'INV-{year}-019')
+
+        site = ConstructionSite.objects.create(name='現場A', company=self.company)
+        self.assertEqual(site.project_code, f'PRJ-{year}-0001')
+
+    def test_rolled_back_number_is_reused(self):
+        from django.db import transaction
+
+        first = NumberSequence.next_value('test:seq')
+        try:
+            with transaction.atomic():
+                NumberSequence.next_value('test:seq')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(NumberSequence.next_value('test:seq'), first + 1)
+
+    def test_block_allocation(self):
+        self.assertEqual(list(NumberSequence.allocate('test:block', 3)), [1, 2, 3])
+        self.assertEqual(list(NumberSequence.allocate('test:block', 2)), [4, 5])
+
+        invoices = [
+            Invoice(customer_company=self.customer_company, receiving_company=self.company, created_by=self.user)
+            for _ in range(3)
+        ]
+        Invoice.assign_numbers(invoices)
+        self.assertEqual(len({invoice.invoice_number for invoice in invoices}), 3)
+        self.assertEqual(NumberSequence.objects.filter(key__startswith='invoice_number:').get().last_value, 3)
+
+
+class ApprovalRouteTemplateTest(InvoiceTestCase):
+    """提出時の承認ルート（会社共通テンプレートを共有し、現場監督は請求書ごとに保持）"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        super().setUp()
+        self.partner = User.objects.create_user(
+            username='partner', email='partner@example.com', password='pass',
+            user_type='customer', customer_company=self.customer_company,
+        )
+        self.supervisor = self._create_user('supervisor', 'site_supervisor')
+        self.manager = self._create_user('manager', 'department_manager')
+        self.site = ConstructionSite.objects.create(
+            name='テスト現場', company=self.company, supervisor=self.supervisor,
+            special_access_password='special',
+        )
+        self.client.force_authenticate(self.partner)
+
+    def _submit(self):
+        invoice = self._create_invoice(construction_site=self.site, created_by=self.partner)
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    f'/api/invoices/{invoice.id}/submit/', {'special_password': 'special'}, format='json'
+                )
+        self.assertEqual(response.status_code, 200, response.data)
+        invoice.refresh_from_db()
+        return invoice, len(ctx.captured_queries)
+
+    def test_cached_template_is_revalidated(self):
+        first, _ = self._submit()
+
+        # 無効化・削除されたルートはキャッシュに残っていても使わない
+        ApprovalRoute.objects.filter(pk=first.approval_route_id).update(is_active=False)
+        second, _ = self._submit()
+        self.assertNotEqual(second.approval_route_id, first.approval_route_id)
+        self.assertTrue(second.approval_route.is_active)
+
+        Invoice.objects.update(approval_route=None, current_approval_step=None)
+        ApprovalRoute.objects.all().delete()
+        third, _ = self._submit()
+        self.assertTrue(ApprovalRoute.objects.filter(pk=third.approval_route_id).exists())
+        self.assertEqual(third.current_approval_step.route_id, third.approval_route_id)
+
+    def test_submissions_share_one_template_route(self):
+        first, first_queries = self._submit()
+        second, second_queries = self._submit()
+
+        self.assertEqual(first.approval_route_id, second.approval_route_id)
+        self.assertEqual(ApprovalRoute.objects.count(), 1)
+        self.assertEqual(ApprovalStep.objects.count(), len(ApprovalRoute.STANDARD_STEPS))
+        self.assertLess(second_queries, first_queries)
+
+        self.assertEqual(second.status, 'pending_approval')
+        self.assertEqual(second.approval_supervisor, self.supervisor)
+        self.assertEqual(second.current_approver, self.supervisor)
+        self.assertEqual(second.current_approval_step.approver_position, 'site_supervisor')
+
+    def test_supervisor_approval_moves_to_directory_approver(self):
+        invoice, _ = self._submit()
+        client = APIClient()
+        client.force_authenticate(self.supervisor)
+        response = client.post(f'/api/invoices/{invoice.id}/approve/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.current_approver, self.manager)
+
+        # 役職の変更はディレクトリに反映される
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer = self._create_user('manager2', 'department_manager')
+        from .services import ApproverDirectory
+        self.assertEqual(ApproverDirectory.first(self.company.id, 'department_manager'), newcomer)
+
+    def test_only_assigned_approver_can_approve_template_step(self):
+        invoice, _ = self._submit()
+        client = APIClient()
+        client.force_authenticate(self.supervisor)
+        client.post(f'/api/invoices/{invoice.id}/approve/', {}, format='json')
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.current_approver, self.manager)
+
+        # 同じ役職でも、割り当てられた承認者以外は承認できない
+        other_manager = self._create_user('manager2', 'department_manager')
+        client.force_authenticate(other_manager)
+        response = client.post(f'/api/invoices/{invoice.id}/approve/', {}, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = client.post('/api/invoices/bulk_approve/', {'invoice_ids': [invoice.id]}, format='json')
+        self.assertEqual(response.data['success_count'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_user('director', 'senior_managing_director')
+        client.force_authenticate(self.manager)
+        response = client.post(f'/api/invoices/{invoice.id}/approve/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_assigned_supervisor_can_resubmit_after_site_change(self):
+        invoice, _ = self._submit()
+        # 提出後に現場の監督が替わっても、提出時に割り当てた監督が再提出できる
+        ConstructionSite.objects.filter(pk=self.site.pk).update(
+            supervisor=self._create_user('supervisor2', 'site_supervisor')
+        )
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.status = 'returned'
+        invoice.save()
+
+        invoice.supervisor_resubmit(self.supervisor)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'pending_approval')
+        self.assertEqual(invoice.current_approval_step.approver_position, 'department_manager')
+
+
+class StreamingCSVExportTest(InvoiceTestCase):
+    """CSV出力（ストリーミング。BOMは先頭のみ）"""
+
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.user.pk).update(first_name='太郎', last_name='経理')
+        self.site = ConstructionSite.objects.create(name='テスト現場', company=self.company)
+
+    def _create_invoices(self, count):
+        return super()._create_invoices(
+            count, construction_site=self.site,
+            invoice_date=date(2026, 3, 1), total_amount=200000, status='approved',
+        )
+
+    def _read(self, response):
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith('\ufeff'.encode('utf-8')))
+        self.assertEqual(content.count('\ufeff'.encode('utf-8')), 1)
+        return content.decode('utf-8-sig').splitlines()
+
+    def test_invoice_csv_streams_rows(self):
+        self._create_invoices(3)
+        response = self.client.get('/api/csv-export/invoices/', {'year': 2026})
+        lines = self._read(response)
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('請求書番号,協力会社'))
+        self.assertIn('協力会社A,テスト現場,,2026/03/01', lines[1])
+        # 協力会費 3/1000 を差し引いた支払額と作成者名
+        self.assertIn(',200000,600,199400,承認済み,', lines[1])
+        self.assertTrue(lines[1].endswith('太郎 経理'))
+
+    def test_report_csv_export_detail(self):
+        self._create_invoices(2)
+        response = self.client.get('/api/reports/csv_export/', {'year': 2026, 'type': 'monthly'})
+        lines = self._read(response)
+        self.assertEqual(len(lines), 3)
+        self.assertIn('承認済み', lines[1])
+
+
+class ExcelExportTest(InvoiceTestCase):
+    """Excel出力（write_only ブック。名前付きスタイルで書式を設定）"""
+
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.user.pk).update(first_name='太郎', last_name='経理')
+        site = ConstructionSite.objects.create(name='テスト現場', company=self.company)
+        self._create_invoices(
+            3, construction_site=site, invoice_date=date(2026, 3, 1), total_amount=200000, status='approved',
+        )
+
+    def test_invoice_excel_rows_and_styles(self):
+        import io
+        from openpyxl import load_workbook
+
+        response = self.client.get('/api/csv-export/invoices_excel/', {'year': 2026})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        content = b''.join(response.streaming_content)
+
+        ws = load_workbook(io.BytesIO(content))['請求書一覧']
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0][:3], ('請求書番号', '協力会社', '工事現場'))
+        self.assertEqual(rows[1][1:3], ('協力会社A', 'テスト現場'))
+        self.assertEqual(rows[1][7:11], (200000, 600, 199400, '承認済み'))
+        self.assertEqual(rows[1][12], '太郎 経理')
+        self.assertEqual(ws['H2'].number_format, '#,##0')
+        self.assertTrue(ws['A1'].font.bold)
+        self.assertEqual(ws.column_dimensions['B'].width, 22)
+
+
+class InvoicePDFCacheTest(InvoiceTestCase):
+    """請求書PDFキャッシュ（描画内容のハッシュをキー・ETag にする）"""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(INVOICE_PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache_dir = cache_dir.name
+
+        super().setUp()
+        self.invoice = self._create_invoice(invoice_date=date(2026, 3, 1), status='approved')
+        self.item = InvoiceItem.objects.create(
+            invoice=self.invoice, item_number=1, description='材料', quantity=1, unit_price=1000
+        )
+        self.url = f'/api/invoices/{self.invoice.pk}/download_pdf/'
+
+    def _cached_files(self):
+        import os
+        return sorted(name for name in os.listdir(self.cache_dir) if name.endswith('.pdf'))
+
+    def test_repeat_download_served_from_cache(self):
+        from unittest import mock
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        first = b''.join(response.streaming_content)
+        self.assertTrue(first.startswith(b'%PDF'))
+        etag = response['ETag']
+        self.assertEqual(self._cached_files(), [f'{self.invoice.pk}-{etag.strip(chr(34))}.pdf'])
+
+        with mock.patch('invoices.pdf_generator.generate_invoice_pdf') as render:
+            response = self.client.get(self.url)
+            self.assertEqual(b''.join(response.streaming_content), first)
+            self.assertEqual(response['ETag'], etag)
+
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        render.assert_not_called()
+
+    def test_changes_invalidate_cached_pdf(self):
+        etag = self.client.get(self.url)['ETag']
+
+        # 描画しない項目だけの保存ではキャッシュを残す
+        self.invoice.status = 'payment_preparing'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.save()
+        self.assertEqual(len(self._cached_files()), 1)
+
+        self.invoice.notes = '備考を変更'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.save()
+        self.assertEqual(self._cached_files(), [])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.item.unit_price = 2000
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        self.assertEqual(self._cached_files(), [])
+
+    def test_evicts_least_recently_used(self):
+        import os
+        from django.test import override_settings
+        from .services import InvoicePDFCache
+
+        for i, name in enumerate(['1-a.pdf', '2-b.pdf', '3-c.pdf']):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (1000 + i, 1000 + i))
+        # 1-a を最近使ったことにする
+        os.utime(os.path.join(self.cache_dir, '1-a.pdf'), (2000, 2000))
+
+        with override_settings(INVOICE_PDF_CACHE_MAX_BYTES=200):
+            InvoicePDFCache.evict()
+        self.assertEqual(self._cached_files(), ['1-a.pdf', '3-c.pdf'])
+
+
+class PDFResourceRegistryTest(TestCase):
+    """PDFのフォント・スタイルはプロセス内で1回だけ作る"""
+
+    def test_fonts_and_styles_are_reused(self):
+        from unittest import mock
+        from . import pdf_generator
+
+        pdf_generator.clear_pdf_resource_cache()
+        self.addCleanup(pdf_generator.clear_pdf_resource_cache)
+        with mock.patch.object(
+            pdf_generator.pdfmetrics, 'registerFont', wraps=pdf_generator.pdfmetrics.registerFont
+        ) as register_font:
+            font = pdf_generator.register_japanese_fonts()
+            pdf_generator.register_japanese_fonts()
+        self.assertEqual(register_font.call_count, 1)
+        self.assertIs(pdf_generator._st(font, 9), pdf_generator._st(font, 9))
+        self.assertIsNot(pdf_generator._st(font, 9), pdf_generator._st(font, 10))
+
+    def test_timings_breakdown(self):
+        from .pdf_generator import generate_invoice_list_pdf
+
+        timings = {}
+        with generate_invoice_list_pdf([], timings=timings) as pdf_file:
+            self.assertTrue(pdf_file.read().startswith(b'%PDF'))
+        self.assertEqual(set(timings), {'font', 'layout', 'build'})
+
+
+class PDFExportJobTest(InvoiceTestCase):
+    """請求書PDF一括出力（ジョブ登録 → ワーカーで ZIP 作成 → ダウンロード）"""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        settings_override = override_settings(
+            INVOICE_PDF_CACHE_DIR=f'{work_dir.name}/cache', PDF_EXPORT_DIR=f'{work_dir.name}/exports'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        super().setUp()
+        self.invoices = self._create_invoices(3, invoice_date=date(2026, 3, 1), status='approved')
+
+    def test_job_renders_zip(self):
+        import io
+        import zipfile
+        from .services import PDFExportService
+
+        response = self.client.post('/api/pdf-export-jobs/', {'year': 2026}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(response.data['total'], 3)
+
+        response = self.client.get(f'/api/pdf-export-jobs/{job_id}/download/')
+        self.assertEqual(response.status_code, 409)
+
+        job = PDFExportService.run_next(processes=0)
+        self.assertEqual(job.pk, job_id)
+        self.assertIsNone(PDFExportService.run_next(processes=0))
+
+        response = self.client.get(f'/api/pdf-export-jobs/{job_id}/')
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['processed'], 3)
+
+        response = self.client.get(f'/api/pdf-export-jobs/{job_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f'invoice_{invoice.invoice_number}.pdf' for invoice in self.invoices),
+        )
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+    def test_job_with_invoice_ids(self):
+        response = self.client.post(
+            '/api/pdf-export-jobs/', {'invoice_ids': [self.invoices[0].pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total'], 1)
+
+        response = self.client.post('/api/pdf-export-jobs/', {'invoice_ids': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cleanup_fails_stale_jobs_and_deletes_expired_zips(self):
+        import os
+        from datetime import timedelta
+        from django.conf import settings
+        from django.core.management import call_command
+        from .models import PDFExportJob
+        from .services import PDFExportService
+
+        long_ago = timezone.now() - timedelta(days=7)
+        # ワーカーが落ちて処理中のまま残ったジョブ
+        stale = PDFExportService.create_job(self.user, [self.invoices[0].pk])
+        PDFExportJob.objects.filter(pk=stale.pk).update(status='running', started_at=long_ago)
+        # 保存期間を過ぎた ZIP
+        job_id = self.client.post('/api/pdf-export-jobs/', {'year': 2026}, format='json').data['id']
+        expired = PDFExportService.run_next(processes=0)
+        self.assertEqual(expired.pk, job_id)
+        PDFExportJob.objects.filter(pk=expired.pk).update(finished_at=long_ago)
+
+        call_command('run_pdf_export_jobs', processes=0, stdout=io.StringIO())
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertEqual(stale.error, PDFExportService.STALE_JOB_ERROR)
+        expired.refresh_from_db()
+        self.assertEqual(expired.file_path, '')
+        self.assertFalse(os.path.exists(f'{settings.PDF_EXPORT_DIR}/invoices_{job_id}.zip'))
+        response = self.client.get(f'/api/pdf-export-jobs/{job_id}/download/')
+        self.assertEqual(response.status_code, 410)
+
+
+class InvoiceListPDFTest(InvoiceTestCase):
+    """請求書一覧PDF（ページごとに表を分け、小計・総合計を出す）"""
+
+    def _page_count(self, content):
+        import re
+        return len(re.findall(rb'/Type /Page\b', content))
+
+    def test_rows_are_paged_without_table_splits(self):
+        import io
+        from .pdf_generator import render_invoice_list_pdf, LIST_ROWS_PER_PAGE
+
+        for count, pages in ((0, 1), (LIST_ROWS_PER_PAGE, 1), (LIST_ROWS_PER_PAGE * 2 + 1, 3)):
+            buffer = io.BytesIO()
+            rows = ((f'INV-{i}', '協力会社A', 'テスト現場', date(2026, 3, 1), 1000, '承認済み') for i in range(count))
+            render_invoice_list_pdf(rows, count, buffer)
+            self.assertEqual(self._page_count(buffer.getvalue()), pages, count)
+
+    def test_list_pdf_endpoint_streams_spooled_file(self):
+        from unittest import mock
+
+        self._create_invoices(3, invoice_date=date(2026, 3, 1), total_amount=1000, status='approved')
+
+        # 一時ファイルへの書き出し（メモリ上限超過）後も同じように返せること
+        for spool_max in (8 * 1024 * 1024, 1):
+            with mock.patch('invoices.pdf_generator.LIST_SPOOL_MAX_BYTES', spool_max):
+                response = self.client.get('/api/csv-export/invoices_pdf/', {'year': 2026})
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content)
+            self.assertTrue(content.startswith(b'%PDF'))
+            self.assertEqual(int(response['Content-Length']), len(content))
+
+
+class MonthlyInvoiceTestCase(InvoiceTestCase):
+    """月次の集計・帳票のテスト用（協力会社2社・現場1つ）"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_a = self.customer_company
+        self.customer_b = CustomerCompany.objects.create(name='協力会社B')
+        self.site = ConstructionSite.objects.create(name='テスト現場', company=self.company)
+
+    def _invoice(self, customer, total, invoice_date=None, status='approved', **kwargs):
+        return self._create_invoice(
+            customer_company=customer, construction_site=self.site,
+            invoice_date=invoice_date, total_amount=total, status=status, **kwargs
+        )
+
+
+class PaymentReportTest(MonthlyInvoiceTestCase):
+    """月次支払い表（計上月で絞り込み、現場 × 協力会社を GROUP BY で集計）"""
+
+    def test_accounting_date_fallback(self):
+        invoice = self._invoice(self.customer_a, 1000, invoice_date=date(2026, 3, 5))
+        self.assertEqual(invoice.accounting_date, date(2026, 3, 5))
+        invoice = self._invoice(self.customer_a, 1000, issue_date=date(2026, 2, 5))
+        self.assertEqual(invoice.accounting_date, date(2026, 2, 5))
+        invoice = self._invoice(self.customer_a, 1000)
+        self.assertEqual(invoice.accounting_date, timezone.localdate(invoice.created_at))
+
+        invoice.invoice_date = date(2026, 1, 31)
+        invoice.save(update_fields=['invoice_date'])
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.accounting_date, date(2026, 1, 31))
+
+    def test_report_groups_by_site_and_company(self):
+        a1 = self._invoice(self.customer_a, 200000, invoice_date=date(2026, 3, 1))
+        a2 = self._invoice(self.customer_a, 100000, issue_date=date(2026, 3, 31))
+        b1 = self._invoice(self.customer_b, 50000, invoice_date=date(2026, 3, 15), status='paid')
+        # 対象外（別の月・未承認）
+        self._invoice(self.customer_a, 999, invoice_date=date(2026, 4, 1))
+        self._invoice(self.customer_b, 999, invoice_date=date(2026, 3, 10), status='pending_approval')
+
+        with self.assertNumQueries(2):  # 集計 + 請求書ID（ArrayAgg の無い SQLite のみ）
+            response = self.client.get('/api/payment-report/generate/', {'year': 2026, 'month': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(len(data['sites']), 1)
+        companies = data['sites'][0]['companies']
+        self.assertEqual([c['company_name'] for c in companies], ['協力会社A', '協力会社B'])
+        self.assertEqual(companies[0]['invoice_amount'], 300000)
+        self.assertEqual(companies[0]['safety_fee'], 900)
+        self.assertEqual(companies[0]['net_amount'], 299100)
+        self.assertEqual(companies[0]['invoice_count'], 2)
+        self.assertEqual(companies[0]['invoice_ids'], sorted([a1.pk, a2.pk]))
+        self.assertEqual(companies[1]['invoice_ids'], [b1.pk])
+        self.assertEqual(data['grand_total_invoice'], 350000)
+        self.assertEqual(data['sites'][0]['site_total_net'], 350000 - 900)
+
+        response = self.client.get('/api/payment-report/available_months/')
+        self.assertEqual(response.data, [{'year': 2026, 'month': 4}, {'year': 2026, 'month': 3}])
+
+    def test_accounting_ym_follows_dates(self):
+        invoice = self._invoice(self.customer_a, 1000, invoice_date=date(2026, 3, 5))
+        self.assertEqual(invoice.accounting_ym, 202603)
+
+        invoice.invoice_date = date(2025, 12, 31)
+        invoice.save(update_fields=['invoice_date'])
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.accounting_ym, 202512)
+        self.assertEqual(Invoice.objects.filter(Invoice.accounting_period_q(2025, 12)).count(), 1)
+        self.assertEqual(Invoice.objects.filter(Invoice.accounting_period_q(2025)).count(), 1)
+        self.assertEqual(Invoice.objects.filter(Invoice.accounting_period_q(2026)).count(), 0)
+
+    def test_monthly_trend_single_query(self):
+        from .services import ChartDataService
+        self._invoice(self.customer_a, 1000, invoice_date=date(2026, 3, 5))
+        self._invoice(self.customer_a, 2000, issue_date=date(2026, 3, 20))
+        self._invoice(self.customer_b, 500, invoice_date=date(2026, 11, 1), status='paid')
+        self._invoice(self.customer_b, 999, invoice_date=date(2026, 11, 2), status='draft')
+
+        with self.assertNumQueries(1):
+            data = ChartDataService.get_monthly_trend_data(2026)
+        self.assertEqual(len(data), 12)
+        self.assertEqual(data[2], {'month': 3, 'total_amount': 3000, 'invoice_count': 2})
+        self.assertEqual(data[10], {'month': 11, 'total_amount': 500, 'invoice_count': 1})
+        self.assertEqual(data[0]['invoice_count'], 0)
+
+    def test_budget_fiscal_year(self):
+        from .models import Budget
+        self._invoice(self.customer_a, 1000, invoice_date=date(2026, 4, 1))
+        self._invoice(self.customer_a, 2000, invoice_date=date(2027, 3, 31))
+        self._invoice(self.customer_a, 4000, invoice_date=date(2026, 3, 31))
+
+        budget = Budget.objects.create(project=self.site, budget_year=2026, budget_amount=10000)
+        self.assertEqual(budget.update_allocated_amount(), 3000)
+        budget = Budget.objects.create(project=self.site, budget_year=2026, budget_month=3, budget_amount=10000)
+        self.assertEqual(budget.update_allocated_amount(), 4000)
+
+
+class InvoiceMonthlyRollupTest(MonthlyInvoiceTestCase):
+    """会社・協力会社・現場別の月次集計（保存・削除時の差分更新と再作成）"""
+
+    def _snapshot(self):
+        return {
+            model.__name__: sorted(
+                model.objects.filter(invoice_count__gt=0).values_list(
+                    model.KEY_FIELD, 'year_month', 'bucket', 'invoice_count', 'total_amount'
+                )
+            )
+            for model in INVOICE_ROLLUP_MODELS
+        }
+
+    def test_transitions_update_rollups(self):
+        invoice = self._invoice(self.customer_a, 1000, date(2026, 3, 5), status='pending_approval')
+        self._invoice(self.customer_b, 2000, date(2026, 3, 6))
+        self.assertEqual(
+            list(CustomerMonthlyRollup.objects.order_by('customer_company__name').values_list(
+                'customer_company_id', 'year_month', 'bucket', 'invoice_count', 'total_amount'
+            )),
+            [(self.customer_a.pk, 202603, 'pending', 1, 1000), (self.customer_b.pk, 202603, 'approved', 1, 2000)],
+        )
+
+        # 承認・金額変更・計上月の変更・削除
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.status = 'approved'
+        invoice.total_amount = 1500
+        invoice.save()
+        invoice.invoice_date = date(2026, 4, 1)
+        invoice.save(update_fields=['invoice_date'])
+        Invoice.objects.only('id', 'status').get(pk=invoice.pk).save()  # 読み込み時の状態が不明でも差分を反映
+        self.assertEqual(
+            SiteMonthlyRollup.objects.get(construction_site=self.site, year_month=202604, bucket='approved').total_amount,
+            1500,
+        )
+        expected = self._snapshot()
+        InvoiceMonthlyRollup.rebuild()
+        self.assertEqual(self._snapshot(), expected)
+
+        invoice.delete()
+        self.assertEqual(
+            CompanyMonthlyRollup.objects.get(company=self.company, year_month=202604, bucket='approved').invoice_count,
+            0,
+        )
+
+    def test_trend_and_summary_endpoints_read_rollups(self):
+        from .services import ChartDataService
+        self._invoice(self.customer_a, 1000, date(2026, 3, 5))
+        self._invoice(self.customer_a, 3000, date(2026, 3, 9), status='paid')
+        self._invoice(self.customer_a, 500, date(2026, 3, 9), status='pending_approval')
+        self._invoice(self.customer_b, 700, date(2026, 5, 1))
+
+        with self.assertNumQueries(1):
+            data = ChartDataService.get_monthly_trend_data(2026)
+        self.assertEqual(data[2], {'month': 3, 'total_amount': 4000, 'invoice_count': 2})
+        self.assertEqual(data[4], {'month': 5, 'total_amount': 700, 'invoice_count': 1})
+
+        response = self.client.get('/api/reports/monthly_company_summary/', {'year': 2026, 'month': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        row = response.data[0]
+        self.assertEqual(row['customer_company__name'], '協力会社A')
+        self.assertEqual(row['month_field'], 3)
+        self.assertEqual((row['invoice_count'], row['total_amount']), (3, 4500))
+        self.assertEqual((row['approved_count'], row['pending_count']), (1, 1))
+
+        response = self.client.get('/api/reports/site_payment_summary/')
+        self.assertEqual(response.data['grand_total'], 4700)
+        self.assertEqual(response.data['sites'][0]['total_amount'], 4700)
+
+    def test_rebuild_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self._invoice(self.customer_a, 1000, date(2026, 3, 5))
+        expected = self._snapshot()
+        CompanyMonthlyRollup.objects.all().delete()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self._snapshot(), expected)
+
+
+class QueryProfilingTest(InvoiceTestCase):
+    """クエリ数・処理時間の計測（Server-Timing・管理者用集計・クエリ数の上限）"""
+
+    def setUp(self):
+        from . import profiling
+        profiling.store.reset()
+        super().setUp()
+        self._create_invoices(3, current_approver=self.user, status='pending_approval')
+
+    def test_server_timing_and_summary(self):
+        from django.test import override_settings
+
+        # 一般ユーザーには内部の計測値を返さない（計測自体は行う）
+        response = self.client.get('/api/invoices/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        with override_settings(DEBUG=True):
+            response = self.client.get('/api/invoices/')
+        metrics = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'serializer', 'total'])
+        self.assertIn('DB 2 queries', response['Server-Timing'])
+
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            user_type='internal', company=self.company, is_super_admin=True,
+        )
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/query-profile/').status_code, 403)
+
+        self.client.force_authenticate(admin)
+        data = self.client.get('/api/query-profile/').data
+        endpoints = {row['endpoint']: row for row in data['endpoints']}
+        row = endpoints['GET invoice-list']
+        self.assertEqual(row['count'], 2)
+        self.assertEqual(row['queries']['max'], 2)
+        self.assertEqual(sum(row['histogram'].values()), 2)
+        self.assertIn('Server-Timing', self.client.get('/api/query-profile/'))
+
+        self.assertEqual(self.client.post('/api/query-profile/reset/').status_code, 204)
+        self.assertEqual(
+            [row['endpoint'] for row in self.client.get('/api/query-profile/').data['endpoints']],
+            ['POST query-profile-reset'],
+        )
+
+    def test_query_budget(self):
+        from django.test import override_settings
+        from .profiling import QueryBudgetExceeded
+
+        with override_settings(QUERY_BUDGETS={'invoice-list': 1}):
+            with self.assertLogs('invoices.profiling', level='WARNING') as logs:
+                self.assertEqual(self.client.get('/api/invoices/').status_code, 200)
+        self.assertIn('GET invoice-list 2件（上限 1件）', logs.output[0])
+
+        with override_settings(QUERY_BUDGETS={'GET invoice-list': 1}, QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/invoices/')
+
+        # 設定済みの上限内に収まっていること
+        with override_settings(QUERY_BUDGET_RAISE=True):
+            self.assertEqual(self.client.get('/api/invoices/my_pending_approvals/').status_code, 200)
+            self.assertEqual(self.client.get('/api/dashboard/stats/').status_code, 200)
+
+
+class PeriodCloseTest(InvoiceTestCase):
+    """月次締め（提出済み請求書を集合演算で一斉に承認待ちへ）"""
+
+    def setUp(self):
+        super().setUp()
+        self.supervisor = self._create_user('supervisor', 'site_supervisor')
+        self.assigned = self._create_user('assigned', 'site_supervisor')
+        self.site = ConstructionSite.objects.create(name='テスト現場', company=self.company, supervisor=self.supervisor)
+        self.no_supervisor_site = ConstructionSite.objects.create(name='監督未設定現場', company=self.company)
+        self.period, _ = MonthlyInvoicePeriod.create_for_month(self.company, 2026, 3)
+        self.other_period, _ = MonthlyInvoicePeriod.create_for_month(self.company, 2026, 4)
+
+    def _invoices(self, count, site=None, period=None, **kwargs):
+        return [
+            self._create_invoice(
+                construction_site=site or self.site, invoice_period=period or self.period,
+                status='submitted', total_amount=1000, **kwargs
+            )
+            for _ in range(count)
+        ]
+
+    def test_close_moves_submitted_invoices(self):
+        invoices = self._invoices(3)
+        assigned = self._invoices(1, approval_supervisor=self.assigned)[0]
+        skipped = self._invoices(1, site=self.no_supervisor_site)[0]
+        other = self._invoices(1, period=self.other_period)[0]
+
+        progress = []
+        processed = self.period.close_period(self.accountant, progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(processed, 4)
+        self.assertEqual(progress, [(4, 4)])
+        self.assertTrue(MonthlyInvoicePeriod.objects.get(pk=self.period.pk).is_closed)
+
+        for invoice in invoices:
+            invoice.refresh_from_db()
+            self.assertEqual((invoice.status, invoice.current_approver_id), ('pending_approval', self.supervisor.pk))
+        assigned.refresh_from_db()
+        self.assertEqual(assigned.current_approver_id, self.assigned.pk)
+        skipped.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((skipped.status, other.status), ('submitted', 'submitted'))
+
+        self.assertEqual(ApprovalHistory.objects.filter(action='submitted').count(), 4)
+        self.assertEqual(
+            set(ApprovalInbox.for_user(self.supervisor).values_list('invoice_id', flat=True)),
+            {invoice.pk for invoice in invoices},
+        )
+        self.assertEqual(
+            sorted(EmailOutbox.objects.values_list('to_email', flat=True)),
+            ['assigned@example.com', 'supervisor@example.com'],
+        )
+        self.assertIn('3件', EmailOutbox.objects.get(to_email='supervisor@example.com').subject)
+        self.assertEqual(
+            CompanyMonthlyRollup.objects.filter(bucket='pending').values_list('invoice_count', flat=True).get(),
+            6,
+        )
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        def close_count(period, count):
+            self._invoices(count, period=period)
+            with CaptureQueriesContext(connection) as ctx:
+                period.close_period(self.accountant)
+            return len(ctx.captured_queries)
+
+        small = close_count(self.period, 2)
+        large = close_count(self.other_period, 20)
+        self.assertEqual(small, large)
+
+    def test_dry_run_returns_diff_without_changes(self):
+        invoice = self._invoices(1)[0]
+        skipped = self._invoices(1, site=self.no_supervisor_site)[0]
+
+        response = self.client.post(f'/api/invoice-periods/{self.period.pk}/close/', {'dry_run': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['changes'], [{
+            'id': invoice.pk, 'invoice_number': invoice.invoice_number,
+            'status': ['submitted', 'pending_approval'],
+            'current_approver_id': [None, self.supervisor.pk],
+        }])
+        self.assertEqual(response.data['skipped'], [{'id': skipped.pk, 'invoice_number': skipped.invoice_number}])
+        self.assertFalse(MonthlyInvoicePeriod.objects.get(pk=self.period.pk).is_closed)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'submitted')
+
+        response = self.client.post(f'/api/invoice-periods/{self.period.pk}/close/')
+        self.assertEqual(response.data['processed_count'], 1)
+
+
+class BatchApprovalExecutorTest(InvoiceTestCase):
+    """一斉承認（行ロック・一括更新・監督ごとのまとめ通知）"""
+
+    def setUp(self):
+        super().setUp()
+        self.supervisor = self._create_user('supervisor', 'site_supervisor')
+        self.other_supervisor = self._create_user('supervisor2', 'site_supervisor')
+        self.site = ConstructionSite.objects.create(name='テスト現場', company=self.company, supervisor=self.supervisor)
+        self.other_site = ConstructionSite.objects.create(
+            name='別現場', company=self.company, supervisor=self.other_supervisor,
+        )
+        self.period, _ = MonthlyInvoicePeriod.create_for_month(self.company, 2026, 3)
+        self.schedule = BatchApprovalSchedule.objects.create(period=self.period, scheduled_datetime=timezone.now())
+
+    def _invoices(self, count, site=None, status='pending_batch_approval'):
+        return self._create_invoices(
+            count, construction_site=site or self.site, invoice_period=self.period,
+            status=status, total_amount=1000,
+        )
+
+    def test_execute_moves_invoices_and_sends_digests(self):
+        invoices = self._invoices(3)
+        single = self._invoices(1, site=self.other_site)[0]
+        untouched = self._invoices(1, status='submitted')[0]
+
+        success, message = self.schedule.execute(self.accountant)
+        self.assertTrue(success)
+        self.assertIn('4件', message)
+
+        schedule = BatchApprovalSchedule.objects.get(pk=self.schedule.pk)
+        self.assertTrue(schedule.is_executed)
+        self.assertEqual((schedule.target_invoice_count, schedule.target_supervisor_count), (4, 2))
+        self.assertEqual(schedule.executed_by, self.accountant)
+        self.assertTrue(self.schedule.is_executed)
+
+        for invoice in invoices + [single]:
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.status, 'pending_approval')
+        untouched.refresh_from_db()
+        self.assertEqual(untouched.status, 'submitted')
+
+        digest = SystemNotification.objects.get(recipient=self.supervisor)
+        self.assertIn('3件', digest.title)
+        self.assertIsNone(digest.related_invoice_id)
+        for invoice in invoices:
+            self.assertIn(invoice.invoice_number, digest.message)
+        other_digest = SystemNotification.objects.get(recipient=self.other_supervisor)
+        self.assertEqual(other_digest.related_invoice_id, single.pk)
+        self.assertEqual(
+            CompanyMonthlyRollup.objects.filter(bucket='pending').values_list('invoice_count', flat=True).get(),
+            5,
+        )
+
+        self.assertEqual(self.schedule.execute(self.accountant), (False, '既に実行済みです'))
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        def execute_count(count):
+            self._invoices(count)
+            schedule = BatchApprovalSchedule.objects.create(period=self.period, scheduled_datetime=timezone.now())
+            with CaptureQueriesContext(connection) as ctx:
+                schedule.execute(self.accountant)
+            return len(ctx.captured_queries)
+
+        # 月次集計の承認待ち区分の行を先に作っておく（初回だけ INSERT になるため）
+        self._invoices(1, status='pending_approval')
+        self.assertEqual(execute_count(2), execute_count(20))
+
+    def test_interrupted_run_rolls_back_and_can_be_resumed(self):
+        from unittest import mock
+
+        invoices = self._invoices(3)
+        with mock.patch.object(SystemNotification.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.schedule.execute(self.accountant)
+
+        schedule = BatchApprovalSchedule.objects.get(pk=self.schedule.pk)
+        self.assertFalse(schedule.is_executed)
+        self.assertEqual(Invoice.objects.filter(status='pending_batch_approval').count(), 3)
+        self.assertFalse(SystemNotification.objects.exists())
+
+        # 中断の間に別経路で承認待ちへ移った請求書は数えない
+        invoices[0].status = 'pending_approval'
+        invoices[0].save()
+        success, message = schedule.execute(self.accountant)
+        self.assertTrue(success)
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.target_invoice_count, 2)
+        self.assertEqual(SystemNotification.objects.get(recipient=self.supervisor).title, '【一斉承認】承認待ちの請求書 2件')
+
+
+class AuditBufferTest(InvoiceTestCase):
+    """アクセスログ・監査ログのまとめ書き（invoices.audit）"""
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        super().setUp()
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = spool_dir.name
+        settings_override = override_settings(AUDIT_SPOOL_DIR=self.spool_dir, AUDIT_BUFFER_MAX_ENTRIES=500)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _log(self, count=1):
+        from .services import AuditLogService
+        # テストはトランザクション内で動くため、コミット時のコールバックをその場で実行する
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                AccessLog.log(self.user, 'view', 'Invoice', resource_id=i)
+                AuditLogService.log(self.user, 'export', 'Invoice', resource_id=i)
+
+    def _spool_files(self):
+        import os
+        return [name for name in os.listdir(self.spool_dir) if name.endswith('.jsonl')]
+
+    def test_buffered_writes_once_on_exit(self):
+        from . import audit
+
+        with audit.buffered():
+            self._log(3)
+            self.assertFalse(AccessLog.objects.exists())
+        self.assertEqual((AccessLog.objects.count(), AuditLog.objects.count()), (3, 3))
+
+        with CaptureQueriesContext(connection) as ctx:
+            with audit.buffered():
+                self._log(10)
+        inserts = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith(('INSERT INTO "access_logs"', 'INSERT INTO "audit_logs"'))
+        ]
+        self.assertEqual(len(inserts), 2)
+
+    def test_rolled_back_entries_are_not_written(self):
+        from django.db import transaction
+        from . import audit
+
+        with audit.buffered():
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        AccessLog.log(self.user, 'approve', 'Invoice', resource_id=1)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                AccessLog.log(self.user, 'view', 'Invoice', resource_id=2)
+        self.assertEqual(list(AccessLog.objects.values_list('resource_id', flat=True)), ['2'])
+
+    def test_flushes_at_size_threshold(self):
+        from django.test import override_settings
+        from . import audit
+
+        with override_settings(AUDIT_BUFFER_MAX_ENTRIES=4):
+            with audit.buffered():
+                self._log(3)
+                self.assertEqual(AccessLog.objects.count() + AuditLog.objects.count(), 4)
+        self.assertEqual(AccessLog.objects.count() + AuditLog.objects.count(), 6)
+
+    def test_middleware_writes_after_response_is_closed(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .audit import AuditBufferMiddleware
+
+        def view(request):
+            self._log(2)
+            return HttpResponse('ok')
+
+        response = AuditBufferMiddleware(view)(RequestFactory().get('/'))
+        self.assertFalse(AccessLog.objects.exists())
+        response.close()
+        self.assertEqual((AccessLog.objects.count(), AuditLog.objects.count()), (2, 2))
+
+    def test_failed_flush_is_spooled_and_replayed(self):
+        from unittest import mock
+        from . import audit
+
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=RuntimeError):
+            with audit.buffered():
+                self._log(2)
+                logged_at = AccessLog(user=self.user).timestamp
+        # AccessLog と AuditLog は1トランザクションで書くため、片方だけ残ることはない
+        self.assertFalse(AccessLog.objects.exists())
+        self.assertEqual(len(self._spool_files()), 1)
+
+        self.assertEqual(audit.replay_spool(min_age=0), (1, 4))
+        self.assertEqual((AccessLog.objects.count(), AuditLog.objects.count()), (2, 2))
+        self.assertEqual(self._spool_files(), [])
+        # 記録した時刻が残る（書き込んだ時刻にならない）
+        self.assertLessEqual(AuditLog.objects.latest('created_at').created_at, logged_at)
+
+    def test_spool_mode_persists_before_flush(self):
+        import os
+        from . import audit
+
+        with audit.buffered('spool'):
+            self._log(1)
+            [name] = self._spool_files()
+            with open(os.path.join(self.spool_dir, name), encoding='utf-8') as f:
+                self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(self._spool_files(), [])
+        self.assertEqual((AccessLog.objects.count(), AuditLog.objects.count()), (1, 1))
+
+
+class AuditArchiveTest(InvoiceTestCase):
+    """アクセスログ・操作ログの月別アーカイブ"""
+
+    def setUp(self):
+        import tempfile
+        from datetime import datetime
+        from django.test import override_settings
+
+        super().setUp()
+        self.user = self._create_user('admin', 'accountant', is_superuser=True)
+        self.client.force_authenticate(self.user)
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(AUDIT_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.at = lambda *args: timezone.make_aware(datetime(*args))
+
+    def _logs(self, logged_at, count=2):
+        AccessLog.objects.bulk_create([
+            AccessLog(user=self.user, action='view', resource_type='Invoice', resource_id=str(i), timestamp=logged_at)
+            for i in range(count)
+        ])
+        AuditLog.objects.bulk_create([
+            AuditLog(user=self.user, action='other', target_model='Invoice', target_id=str(i), created_at=logged_at)
+            for i in range(count)
+        ])
+
+    def test_archive_month_writes_checksummed_file_and_removes_rows(self):
+        from .services import AuditArchiveService
+
+        self._logs(self.at(2024, 3, 1, 0, 30), count=3)  # 月初0時台（ローカル時刻）も3月分
+        self._logs(self.at(2024, 4, 1))
+
+        archive = AuditArchiveService.archive_month('access_logs', 202403, retention_years=7)
+        self.assertEqual((archive.row_count, archive.part), (3, 1))
+        self.assertEqual(str(archive.retain_until), '2031-03-31')
+        self.assertTrue(AuditArchiveService.verify(archive))
+        rows = list(AuditArchiveService.read(archive))
+        self.assertEqual(sorted(row['resource_id'] for row in rows), ['0', '1', '2'])
+        self.assertEqual(AccessLog.objects.count(), 2)
+        self.assertEqual(AuditLog.objects.count(), 5)
+
+        # アーカイブ後に書き込まれた同じ月のログは次の連番
+        self._logs(self.at(2024, 3, 15), count=1)
+        self.assertEqual(AuditArchiveService.archive_month('access_logs', 202403).part, 2)
+        self.assertIsNone(AuditArchiveService.archive_month('access_logs', 202403))
+
+        with open(archive.file_path, 'ab') as f:
+            f.write(b'tampered')
+        self.assertFalse(AuditArchiveService.verify(archive))
+
+    def test_command_archives_months_before_hot_window(self):
+        from django.core.management import call_command
+        from .services import AuditArchiveService
+
+        this_month = int(timezone.localdate().strftime('%Y%m'))
+        old = AuditArchiveService.shift_month(this_month, -3)
+        kept = AuditArchiveService.shift_month(this_month, -2)
+        for year_month in (old, kept):
+            self._logs(AuditArchiveService.month_range(year_month)[0])
+
+        call_command('archive_audit_logs', keep_months=3, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(AuditArchive.objects.values_list('table_name', 'year_month')),
+            [('access_logs', old), ('audit_logs', old)],
+        )
+        self.assertEqual((AccessLog.objects.count(), AuditLog.objects.count()), (2, 2))
+        call_command('archive_audit_logs', verify=True, stdout=io.StringIO())
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/audit-archives/', {'table_name': 'audit_logs'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([row['year_month'] for row in results], [old])
+
+    def test_access_log_date_filter_uses_local_day_range(self):
+        self._logs(self.at(2024, 3, 1, 0, 30), count=1)
+        self._logs(self.at(2024, 2, 29, 23, 30), count=1)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/access-logs/', {'start_date': '2024-03-01', 'end_date': '2024-03-01'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual(len(results), 1)
+
+
+class AccessLogHourlyRollupTest(InvoiceTestCase):
+    """アクセスログの時間別集計とサマリー"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self._create_user('admin', 'accountant', is_superuser=True)
+        self.other = self._create_user('other', 'site_supervisor')
+        self.client.force_authenticate(self.admin)
+
+    def test_log_writes_maintain_hourly_rollups(self):
+        from . import audit
+
+        AccessLog.log(self.admin, 'view', 'Invoice', resource_id=1)
+        with audit.buffered(), self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                AccessLog.log(self.other, 'download', 'Invoice', resource_id=i)
+            AccessLog.log(self.admin, 'view', 'Invoice', resource_id=2)
+
+        rollups = {
+            (row.user_id, row.action): row.log_count for row in AccessLogHourlyRollup.objects.all()
+        }
+        self.assertEqual(rollups, {(self.admin.pk, 'view'): 2, (self.other.pk, 'download'): 3})
+        hour = AccessLogHourlyRollup.objects.first().hour
+        self.assertEqual((hour.minute, hour.second, hour.microsecond), (0, 0, 0))
+
+        # 作り直しても同じ集計になる
+        self.assertEqual(AccessLogHourlyRollup.rebuild(), 2)
+        self.assertEqual(
+            {(row.user_id, row.action): row.log_count for row in AccessLogHourlyRollup.objects.all()},
+            rollups,
+        )
+
+    def test_summary_reads_rollups_with_constant_queries(self):
+        def summary_queries(count):
+            for i in range(count):
+                AccessLog.log(self.other, 'view', 'Invoice', resource_id=i)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/access-logs/summary/')
+            self.assertEqual(response.status_code, 200)
+            return response.data, len(ctx.captured_queries)
 
-# Create your tests here.
+        _, small = summary_queries(2)
+        data, large = summary_queries(20)
+        self.assertEqual(small, large)
+        self.assertEqual(data['today_count'], 22)
+        self.assertEqual(list(data['action_summary']), [{'action': 'view', 'count': 22}])
+        self.assertEqual(data['user_summary'][0]['user__username'], 'other')
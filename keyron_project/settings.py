@@ -57,6 +57,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'invoices.profiling.QueryProfilingMiddleware',  # クエリ数・処理時間の計測（Server-Timing）
+    'invoices.audit.AuditBufferMiddleware',  # アクセスログ・監査ログをレスポンス送信後にまとめて書き込む
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # WhiteNoise追加
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -122,6 +124,8 @@ else:
             'NAME': BASE_DIR / "db.sqlite3",
         }
     }
+    # 集計用のカバリングインデックス（INCLUDE 列）は PostgreSQL 用。SQLite ではキー列のみで作成される
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
 
 
 # Password validation
@@ -295,6 +299,10 @@ EMAIL_BACKEND = os.environ.get(
     'django.core.mail.backends.console.EmailBackend'
 )
 
+# ファイル出力（EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend）時の出力先
+# SMTP に接続できない環境で送信キュー（send_outbox_emails）の動作確認に使う
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'logs' / 'emails'))
+
 # AWS SES / SMTP 本番設定（環境変数で注入）
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'email-smtp.ap-northeast-1.amazonaws.com')
 EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '587'))
@@ -334,6 +342,58 @@ INVOICE_SETTINGS = {
     'APPROVAL_REMINDER_DAYS': [3, 1],  # 締切3日前、1日前
 }
 
+# ====================
+# 請求書PDFキャッシュ
+# ====================
+# 描画済みの請求書PDFの保存先と合計サイズの上限（超えたら最終利用日時の古いものから削除）
+INVOICE_PDF_CACHE_DIR = os.environ.get('INVOICE_PDF_CACHE_DIR', str(MEDIA_ROOT / 'pdf_cache'))
+INVOICE_PDF_CACHE_MAX_BYTES = int(os.environ.get('INVOICE_PDF_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+# 請求書PDF一括出力（run_pdf_export_jobs）で作成する ZIP の保存先
+PDF_EXPORT_DIR = os.environ.get('PDF_EXPORT_DIR', str(MEDIA_ROOT / 'pdf_exports'))
+# 開始からこの時間を過ぎても処理中のジョブは、ワーカーが落ちたものとして失敗にする（分）
+PDF_EXPORT_JOB_TIMEOUT_MINUTES = int(os.environ.get('PDF_EXPORT_JOB_TIMEOUT_MINUTES', '60'))
+# 完了した ZIP の保存期間（時間）。過ぎたものは run_pdf_export_jobs が削除する
+PDF_EXPORT_RETENTION_HOURS = int(os.environ.get('PDF_EXPORT_RETENTION_HOURS', '72'))
+
+# ====================
+# クエリ数・処理時間の計測（invoices.profiling）
+# ====================
+# 計測値は管理者用API（/api/query-profile/）で確認できる。
+# Server-Timing ヘッダーは DEBUG 時とスタッフ・スーパーアドミンへのレスポンスにだけ付ける。
+# ストリーミング出力（CSV等）は本文の生成中のクエリを数えられないため、少なめの値になる
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'True') == 'True'
+# ビュー（URL名。'GET invoice-list' のようにメソッド付きも可）ごとのクエリ数の上限。超えたらログに警告を出す
+QUERY_BUDGETS = {
+    'invoice-list': 10,
+    'invoice-detail': 20,
+    'invoice-my-pending-approvals': 10,
+    'dashboard-stats': 10,
+    'dashboard-monthly-trend': 5,
+    'chart-data-monthly-trend': 5,
+    'report-monthly-company-summary': 5,
+    'payment-report-generate': 10,
+}
+QUERY_BUDGET_DEFAULT = int(os.environ['QUERY_BUDGET_DEFAULT']) if os.environ.get('QUERY_BUDGET_DEFAULT') else None
+# True の場合、上限を超えたら例外を送出する（テストで上限超過を失敗として検出する用）
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE', 'False') == 'True'
+
+# ====================
+# アクセスログ・監査ログのまとめ書き（invoices.audit）
+# ====================
+# 'buffered': リクエストごとに溜めてレスポンス送信後に bulk_create（失敗したらスプールファイルに退避）
+# 'spool': 溜める時点でスプールファイルにも fsync して書く（プロセスが落ちても失わない）
+# 'sync': その場で1件ずつ書き込む
+AUDIT_LOG_DURABILITY = os.environ.get('AUDIT_LOG_DURABILITY', 'buffered')
+AUDIT_BUFFER_MAX_ENTRIES = int(os.environ.get('AUDIT_BUFFER_MAX_ENTRIES', '500'))
+# 書き込めなかったログの退避先（flush_audit_spool で書き込む）
+AUDIT_SPOOL_DIR = os.environ.get('AUDIT_SPOOL_DIR', str(BASE_DIR / 'audit_spool'))
+# ホットテーブルに残す月数（今月を含む）。これより前の月は archive_audit_logs でアーカイブする
+AUDIT_LOG_HOT_MONTHS = int(os.environ.get('AUDIT_LOG_HOT_MONTHS', '13'))
+# アーカイブファイル（gzip 圧縮の JSON Lines）の保存先と保存年数（電子取引データの保存規程: 原則7年、欠損金の繰越控除は10年）
+AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', str(BASE_DIR / 'audit_archive'))
+AUDIT_ARCHIVE_RETENTION_YEARS = int(os.environ.get('AUDIT_ARCHIVE_RETENTION_YEARS', '7'))
+
 # ====================
 # ログ設定
 # ====================